@@ -0,0 +1,110 @@
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from collections import deque
+from typing import Iterator, List, Tuple
+from pydantic import ValidationError
+from app.codec import decode_request, encode_response
+from app.nudge_engine import NudgeEngine
+
+# Engine used by the current worker process
+_engine = None
+
+def _init_worker(config_path: str, model_path: str):
+    """Load the nudge engine once per worker process."""
+    global _engine
+    _engine = NudgeEngine(config_path=config_path, model_path=model_path)
+    # Offline scoring must not withhold nudges or use up users' daily allowance
+    _engine.nudge_cap = None
+
+def score_chunk(chunk: List[Tuple[int, str]]) -> Tuple[List[str], int]:
+    """Score one chunk of NDJSON lines, returning output lines (in input order) and the error count."""
+    outputs = [None] * len(chunk)
+    requests, positions = [], []
+
+    for i, (line_number, line) in enumerate(chunk):
+        try:
+            requests.append(decode_request(line))
+            positions.append(i)
+        except (ValidationError, ValueError) as e:
+            outputs[i] = json.dumps({"line": line_number, "status": "error", "error": str(e)})
+
+    if requests:
+        nudges_per_user = _engine.score_batch(requests)
+        for i, request, nudges in zip(positions, requests, nudges_per_user):
+            outputs[i] = encode_response(request.user_id, nudges).decode("utf-8")
+
+    return outputs, len(chunk) - len(requests)
+
+def read_chunks(stream, chunk_size: int) -> Iterator[List[Tuple[int, str]]]:
+    """Yield chunks of (line_number, line) pairs, skipping blank lines."""
+    chunk = []
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        chunk.append((line_number, line))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def score_stream(chunks: Iterator[List[Tuple[int, str]]], workers: int,
+                 config_path: str, model_path: str) -> Iterator[Tuple[List[str], int]]:
+    """Score chunks across worker processes, yielding results in input order.
+
+    At most two chunks per worker are in flight, so memory stays constant
+    no matter how large the input is.
+    """
+    if workers <= 1:
+        _init_worker(config_path, model_path)
+        for chunk in chunks:
+            yield score_chunk(chunk)
+        return
+
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(config_path, model_path)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(score_chunk, (chunk,)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+def main(argv: List[str] = None):
+    """Score an NDJSON file of engagement requests without going through HTTP."""
+    parser = argparse.ArgumentParser(description="Bulk-score EngagementAnalysisRequest records from NDJSON.")
+    parser.add_argument("input", nargs="?", default="-", help="NDJSON input file, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="NDJSON output file, or - for stdout")
+    parser.add_argument("-w", "--workers", type=int, default=multiprocessing.cpu_count(), help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Records scored per batch")
+    parser.add_argument("--config", default="config.json", help="Service configuration file")
+    parser.add_argument("--models", default="models/nudge_models.pkl", help="Model pickle")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    records, errors = 0, 0
+    start = time.perf_counter()
+    try:
+        for outputs, chunk_errors in score_stream(read_chunks(source, args.chunk_size), args.workers, args.config, args.models):
+            sink.write("\n".join(outputs))
+            sink.write("\n")
+            records += len(outputs)
+            errors += chunk_errors
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    elapsed = time.perf_counter() - start
+    rate = records / elapsed if elapsed > 0 else 0.0
+    print(f"Scored {records} records ({errors} malformed) in {elapsed:.2f}s: {rate:.0f} records/sec", file=sys.stderr)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,121 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List
+from pydantic import TypeAdapter
+from app.schemas import Nudge
+
+# orjson is optional; without it responses are encoded with the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Compact request structures for the fast path. They declare the same fields
+# and types as the Pydantic models in app.schemas and are validated by the
+# same pydantic-core rules (objects only, extra keys ignored), but decode
+# straight from JSON bytes into __slots__ instances with no model machinery.
+
+@dataclass
+class CompactProfile:
+    __slots__ = ("resume_uploaded", "goal_tags", "karma", "projects_added", "quiz_history", "clubs_joined", "buddy_count")
+    resume_uploaded: bool
+    goal_tags: List[str]
+    karma: int
+    projects_added: int
+    quiz_history: List[str]
+    clubs_joined: List[str]
+    buddy_count: int
+
+@dataclass
+class CompactActivity:
+    __slots__ = ("login_streak", "posts_created", "buddies_interacted", "last_event_attended")
+    login_streak: int
+    posts_created: int
+    buddies_interacted: int
+    last_event_attended: str
+
+@dataclass
+class CompactPeerSnapshot:
+    __slots__ = ("batch_avg_projects", "batch_resume_uploaded_pct", "batch_event_attendance", "buddies_attending_events")
+    batch_avg_projects: int
+    batch_resume_uploaded_pct: int
+    batch_event_attendance: Dict[str, int]
+    buddies_attending_events: List[str]
+
+@dataclass
+class CompactRequest:
+    __slots__ = ("user_id", "profile", "activity", "peer_snapshot")
+    user_id: str
+    profile: CompactProfile
+    activity: CompactActivity
+    peer_snapshot: CompactPeerSnapshot
+
+@dataclass
+class CompactBatchRequest:
+    __slots__ = ("requests",)
+    requests: List[CompactRequest]
+
+@dataclass
+class CompactByBatchRequest:
+    __slots__ = ("user_id", "profile", "activity", "batch_id")
+    user_id: str
+    profile: CompactProfile
+    activity: CompactActivity
+    batch_id: str
+
+_request_adapter = TypeAdapter(CompactRequest)
+_batch_adapter = TypeAdapter(CompactBatchRequest)
+_by_batch_adapter = TypeAdapter(CompactByBatchRequest)
+
+def decode_request(body: bytes) -> CompactRequest:
+    """Validate an EngagementAnalysisRequest JSON document; raises pydantic.ValidationError."""
+    return _request_adapter.validate_json(body)
+
+def decode_batch_request(body: bytes) -> List[CompactRequest]:
+    """Validate a BatchEngagementAnalysisRequest JSON document and return its requests."""
+    return _batch_adapter.validate_json(body).requests
+
+def decode_by_batch_request(body: bytes) -> CompactByBatchRequest:
+    """Validate an EngagementAnalysisByBatchRequest JSON document."""
+    return _by_batch_adapter.validate_json(body)
+
+def with_snapshot(request: CompactByBatchRequest, snapshot) -> CompactRequest:
+    """Attach a registered peer snapshot (any object with the PeerSnapshotData fields) without validating it again."""
+    return CompactRequest(request.user_id, request.profile, request.activity, snapshot)
+
+def _response(user_id: str, nudges: List[Nudge]) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "nudges": [{"type": t, "title": title, "action": action, "priority": priority} for t, title, action, priority in nudges],
+        "status": "generated"
+    }
+
+def dumps(document: Any) -> bytes:
+    """Encode a JSON document to UTF-8 bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(document)
+    return json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def encode_response(user_id: str, nudges: List[Nudge]) -> bytes:
+    """Encode an EngagementAnalysisResponse body."""
+    return dumps(_response(user_id, nudges))
+
+def encode_batch_response(user_ids: List[str], nudges_per_user: List[List[Nudge]]) -> bytes:
+    """Encode a BatchEngagementAnalysisResponse body, one result per user in order."""
+    return dumps({"results": [_response(user_id, nudges) for user_id, nudges in zip(user_ids, nudges_per_user)]})
+
+def openapi_request_body(model) -> Dict[str, Any]:
+    """Document a raw-body endpoint with a Pydantic model's schema (for openapi_extra)."""
+    schema = model.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def inline(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return inline(definitions[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: inline(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [inline(value) for value in node]
+        return node
+
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": inline(schema)}}}}
@@ -0,0 +1,335 @@
+import json
+import struct
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from app.codec import CompactActivity, CompactPeerSnapshot, CompactProfile, CompactRequest
+
+# Binary columnar batch requests, for callers that already hold their data in
+# columns. A body is MAGIC, a little-endian uint32 header length, a JSON header
+# listing the buffers ({"rows": n, "buffers": [{"name", "dtype", "count",
+# "offset"}]}), then the raw buffers, each starting on an 8-byte boundary
+# (offsets count from the first byte after the header, itself padded to 8).
+# Buffers are read in place with np.frombuffer, so decoding copies nothing.
+#
+# Each request field maps to buffers by its dotted path:
+#   numbers      <path>                       one value per row
+#   strings      <path>.offsets, <path>.data  rows + 1 byte offsets into UTF-8 data
+#   string lists <path>.offsets               rows + 1 offsets into the strings <path>.values
+#   string maps  <path>.offsets               rows + 1 offsets into the strings <path>.keys
+#                                             and the numbers <path>.values
+
+MAGIC = b"NUDGCOL1"
+CONTENT_TYPE = "application/vnd.nudge.columnar"
+ALIGNMENT = 8
+
+NUMBER_FIELDS = (
+    "profile.resume_uploaded", "profile.karma", "profile.projects_added", "profile.buddy_count",
+    "activity.login_streak", "activity.posts_created", "activity.buddies_interacted",
+    "peer_snapshot.batch_avg_projects", "peer_snapshot.batch_resume_uploaded_pct"
+)
+STRING_FIELDS = ("user_id", "activity.last_event_attended")
+LIST_FIELDS = ("profile.goal_tags", "profile.quiz_history", "profile.clubs_joined", "peer_snapshot.buddies_attending_events")
+MAP_FIELDS = ("peer_snapshot.batch_event_attendance",)
+
+# Model features in app.tree_inference.FEATURE_NAMES order; the last is the buddy event count
+FEATURE_COLUMNS = ("profile.resume_uploaded", "profile.karma", "profile.projects_added",
+                   "peer_snapshot.batch_avg_projects", "peer_snapshot.batch_resume_uploaded_pct")
+
+_MISSING = object()
+
+class ColumnarFormatError(ValueError):
+    """Raised when a columnar batch body is malformed."""
+
+def _pad(length: int) -> int:
+    return -length % ALIGNMENT
+
+# Values JSON requests could not carry: pydantic only takes 0 and 1 as booleans
+BOOL_FIELDS = ("profile.resume_uploaded",)
+INT64_MAX = np.iinfo(np.int64).max
+
+class _Strings:
+    """A string column: byte offsets into one UTF-8 buffer, decoded up front so bad UTF-8 fails the decode."""
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        offsets, data = offsets.tolist(), data.tobytes()
+        self.values = [data[start:stop].decode("utf-8") for start, stop in zip(offsets, offsets[1:])]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def get(self, i: int) -> str:
+        return self.values[i]
+
+    def slice(self, start: int, stop: int) -> List[str]:
+        return self.values[start:stop]
+
+class ColumnarBatch:
+    """A decoded columnar batch request.
+
+    Numbers stay NumPy columns that rules, model planning and feature
+    extraction read directly. Indexing returns a view of one row with the
+    attributes of a compact request, reading each field from the columns
+    only when accessed, for the few places that look at single requests
+    (rule titles and ML nudges).
+    """
+
+    def __init__(self, rows: int, buffers: Dict[str, np.ndarray]):
+        self.rows = rows
+        self.buffers = buffers
+        self.numbers = {name: buffers[name] for name in NUMBER_FIELDS}
+        self.strings = {name: _Strings(buffers[f"{name}.offsets"], buffers[f"{name}.data"]) for name in STRING_FIELDS}
+        self.list_offsets = {name: buffers[f"{name}.offsets"] for name in LIST_FIELDS + MAP_FIELDS}
+        self.list_values = {name: _Strings(buffers[f"{name}.values.offsets"], buffers[f"{name}.values.data"])
+                            for name in LIST_FIELDS}
+        self.map_keys = {name: _Strings(buffers[f"{name}.keys.offsets"], buffers[f"{name}.keys.data"]) for name in MAP_FIELDS}
+        self.map_values = {name: buffers[f"{name}.values"] for name in MAP_FIELDS}
+        self.user_ids = self.strings["user_id"].slice(0, rows)
+        self._rows: Dict[int, "_RowView"] = {}
+        self._getters: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def list_lengths(self, name: str) -> np.ndarray:
+        return np.diff(self.list_offsets[name])
+
+    def column(self, expression) -> Optional[np.ndarray]:
+        """Values of a rule Expression for every row, or None if it cannot be read from the columns."""
+        if expression.function_name is None and expression.path in self.numbers:
+            return self.numbers[expression.path]
+        if expression.function_name == "len" and expression.path in self.list_offsets:
+            return self.list_lengths(expression.path)
+        return None
+
+    def eligibility(self) -> np.ndarray:
+        """Whether each row could get the resume, project and event ML nudges (rows x 3)."""
+        return np.column_stack([
+            self.numbers["profile.resume_uploaded"] == 0,
+            self.numbers["profile.projects_added"] == 0,
+            self.list_lengths("peer_snapshot.buddies_attending_events") > 0
+        ])
+
+    def features(self, rows: Optional[Sequence[int]] = None) -> np.ndarray:
+        """The model feature matrix, for all rows or the given ones."""
+        columns = [self.numbers[name] for name in FEATURE_COLUMNS]
+        columns.append(self.list_lengths("peer_snapshot.buddies_attending_events"))
+        features = np.column_stack(columns).astype(np.int64)
+        return features if rows is None else features[np.asarray(rows, dtype=np.intp)]
+
+    def top_events(self, k: int, source: str) -> Optional[List[Optional[List[Tuple[str, int]]]]]:
+        """Per row, the top event by batch attendance as app.event_index.top_events ranks it.
+
+        Only the top-1 "batch" ranking is computed from the columns; it
+        returns None for other rankings, and None for the rows whose top
+        attendance is tied (where buddy overlap and names break the tie), so
+        callers rank those rows themselves.
+        """
+        if k != 1 or source != "batch":
+            return None
+        name = "peer_snapshot.batch_event_attendance"
+        offsets, values = self.list_offsets[name], self.map_values[name]
+        lengths = np.diff(offsets)
+        entry_rows = np.repeat(np.arange(self.rows), lengths)
+        order = np.lexsort((-values.astype(np.int64), entry_rows))
+        firsts = offsets[:-1][lengths > 0]
+        best = order[firsts]
+        tied = np.zeros(len(firsts), dtype=bool)
+        has_second = lengths[lengths > 0] > 1
+        tied[has_second] = values[order[firsts[has_second] + 1]] == values[best[has_second]]
+
+        ranked: List[Optional[List[Tuple[str, int]]]] = [[] for _ in range(self.rows)]
+        keys = self.map_keys[name]
+        for row, entry, is_tied, value in zip(np.flatnonzero(lengths > 0).tolist(), best.tolist(), tied.tolist(), values[best].tolist()):
+            ranked[row] = None if is_tied else [(keys.get(entry), value)]
+        return ranked
+
+    def _list(self, name: str, i: int) -> List[str]:
+        offsets = self.list_offsets[name]
+        return self.list_values[name].slice(int(offsets[i]), int(offsets[i + 1]))
+
+    def _map(self, name: str, i: int) -> Dict[str, int]:
+        offsets = self.list_offsets[name]
+        start, stop = int(offsets[i]), int(offsets[i + 1])
+        return dict(zip(self.map_keys[name].slice(start, stop), self.map_values[name][start:stop].tolist()))
+
+    def _build_getters(self) -> Dict[str, Dict[str, Any]]:
+        """Per section, a function reading each field of row i."""
+        getters: Dict[str, Dict[str, Any]] = {"profile": {}, "activity": {}, "peer_snapshot": {}}
+        for name in NUMBER_FIELDS:
+            section, field = name.split(".")
+            values = self.numbers[name].tolist()
+            getters[section][field] = (lambda i, values=values: bool(values[i])) if field == "resume_uploaded" else values.__getitem__
+        for name in STRING_FIELDS[1:]:
+            section, field = name.split(".")
+            getters[section][field] = self.strings[name].get
+        for name in LIST_FIELDS:
+            section, field = name.split(".")
+            getters[section][field] = lambda i, name=name: self._list(name, i)
+        for name in MAP_FIELDS:
+            section, field = name.split(".")
+            getters[section][field] = lambda i, name=name: self._map(name, i)
+        return getters
+
+    def __getitem__(self, i: int) -> "_RowView":
+        request = self._rows.get(i)
+        if request is None:
+            if self._getters is None:
+                self._getters = self._build_getters()
+            request = self._rows[i] = _RowView(self.user_ids[i], *(_SectionView(getters, i) for getters in self._getters.values()))
+        return request
+
+    def to_request(self, i: int) -> CompactRequest:
+        """Row i as a complete compact request."""
+        row = self[i]
+        return CompactRequest(
+            user_id=row.user_id,
+            profile=CompactProfile(**{field: getattr(row.profile, field) for field in CompactProfile.__slots__}),
+            activity=CompactActivity(**{field: getattr(row.activity, field) for field in CompactActivity.__slots__}),
+            peer_snapshot=CompactPeerSnapshot(**{field: getattr(row.peer_snapshot, field) for field in CompactPeerSnapshot.__slots__})
+        )
+
+    def __reduce__(self):
+        return (ColumnarBatch, (self.rows, self.buffers))
+
+class _SectionView:
+    """One section (profile, activity or peer_snapshot) of a ColumnarBatch row, read field by field on access."""
+    __slots__ = ("_getters", "_i", "_values")
+
+    def __init__(self, getters: Dict[str, Any], i: int):
+        self._getters = getters
+        self._i = i
+        self._values = {}
+
+    def __getattr__(self, name: str):
+        value = self._values.get(name, _MISSING)
+        if value is _MISSING:
+            try:
+                getter = self._getters[name]
+            except KeyError:
+                raise AttributeError(name) from None
+            value = self._values[name] = getter(self._i)
+        return value
+
+class _RowView:
+    """A ColumnarBatch row with the attributes of a compact request."""
+    __slots__ = ("user_id", "profile", "activity", "peer_snapshot")
+
+    def __init__(self, user_id: str, profile: _SectionView, activity: _SectionView, peer_snapshot: _SectionView):
+        self.user_id = user_id
+        self.profile = profile
+        self.activity = activity
+        self.peer_snapshot = peer_snapshot
+
+def _check_offsets(name: str, offsets: np.ndarray, count: int, limit: int):
+    if len(offsets) != count + 1 or offsets[0] != 0 or offsets[-1] != limit or np.any(np.diff(offsets) < 0):
+        raise ColumnarFormatError(f"Buffer {name} does not hold {count + 1} ascending offsets from 0 to {limit}")
+
+def _check_strings(buffers: Dict[str, np.ndarray], name: str, count: int):
+    _check_offsets(f"{name}.offsets", buffers[f"{name}.offsets"], count, len(buffers[f"{name}.data"]))
+
+def decode_columnar(body: bytes) -> ColumnarBatch:
+    """Decode and validate a columnar batch body without copying its buffers."""
+    if len(body) < len(MAGIC) + 4 or body[:len(MAGIC)] != MAGIC:
+        raise ColumnarFormatError("Not a columnar batch body")
+    (header_length,) = struct.unpack_from("<I", body, len(MAGIC))
+    header_end = len(MAGIC) + 4 + header_length
+    try:
+        header = json.loads(body[len(MAGIC) + 4:header_end])
+        rows = int(header["rows"])
+        specs = header["buffers"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ColumnarFormatError(f"Invalid columnar header: {e}") from e
+
+    data_start = header_end + _pad(header_end)
+    buffers = {}
+    for spec in specs:
+        try:
+            dtype = np.dtype(spec["dtype"])
+            if dtype.kind not in "biu":
+                raise ColumnarFormatError(f"Buffer {spec['name']} must hold integers, not {dtype}")
+            start = data_start + int(spec["offset"])
+            count = int(spec["count"])
+            if start < data_start or count < 0 or start + count * dtype.itemsize > len(body):
+                raise ColumnarFormatError(f"Buffer {spec['name']} lies outside the body")
+            buffers[spec["name"]] = np.frombuffer(body, dtype=dtype, count=count, offset=start)
+        except ColumnarFormatError:
+            raise
+        except (KeyError, TypeError, ValueError) as e:
+            raise ColumnarFormatError(f"Invalid buffer description: {e}") from e
+
+    missing = [name for name in required_buffers() if name not in buffers]
+    if missing:
+        raise ColumnarFormatError(f"Missing buffers: {', '.join(missing)}")
+    for name in NUMBER_FIELDS:
+        if len(buffers[name]) != rows:
+            raise ColumnarFormatError(f"Buffer {name} has {len(buffers[name])} values for {rows} rows")
+    for name in NUMBER_FIELDS + tuple(f"{name}.values" for name in MAP_FIELDS):
+        values = buffers[name]
+        if name in BOOL_FIELDS and np.any((values != 0) & (values != 1)):
+            raise ColumnarFormatError(f"Buffer {name} must hold only 0 and 1")
+        if values.dtype.kind == "u" and values.dtype.itemsize == 8 and np.any(values > INT64_MAX):
+            raise ColumnarFormatError(f"Buffer {name} holds values beyond the int64 range")
+    for name in STRING_FIELDS:
+        _check_strings(buffers, name, rows)
+    for name in LIST_FIELDS:
+        _check_strings(buffers, f"{name}.values", len(buffers[f"{name}.values.offsets"]) - 1)
+        _check_offsets(f"{name}.offsets", buffers[f"{name}.offsets"], rows, len(buffers[f"{name}.values.offsets"]) - 1)
+    for name in MAP_FIELDS:
+        entries = len(buffers[f"{name}.values"])
+        _check_strings(buffers, f"{name}.keys", entries)
+        _check_offsets(f"{name}.offsets", buffers[f"{name}.offsets"], rows, entries)
+    try:
+        return ColumnarBatch(rows, buffers)
+    except UnicodeDecodeError as e:
+        raise ColumnarFormatError(f"Invalid UTF-8 string: {e}") from e
+
+def required_buffers() -> List[str]:
+    """Names of every buffer a columnar batch must carry."""
+    names = list(NUMBER_FIELDS)
+    names += [f"{name}.{part}" for name in STRING_FIELDS for part in ("offsets", "data")]
+    names += [f"{name}.{part}" for name in LIST_FIELDS for part in ("offsets", "values.offsets", "values.data")]
+    names += [f"{name}.{part}" for name in MAP_FIELDS for part in ("offsets", "keys.offsets", "keys.data", "values")]
+    return names
+
+def encode_buffers(rows: int, buffers: Dict[str, np.ndarray]) -> bytes:
+    """Lay out named integer arrays as a columnar batch body."""
+    specs, chunks, offset = [], [], 0
+    for name, array in buffers.items():
+        array = np.ascontiguousarray(array)
+        specs.append({"name": name, "dtype": array.dtype.str, "count": len(array), "offset": offset})
+        data = array.tobytes()
+        chunks.append(data + b"\0" * _pad(len(data)))
+        offset += len(chunks[-1])
+    header = json.dumps({"rows": rows, "buffers": specs}).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    return prefix + b"\0" * _pad(len(prefix)) + b"".join(chunks)
+
+def _string_buffers(name: str, values: List[str]) -> Dict[str, np.ndarray]:
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return {f"{name}.offsets": offsets, f"{name}.data": np.frombuffer(b"".join(encoded), dtype=np.uint8)}
+
+def _field(document: Dict[str, Any], path: str):
+    for key in path.split("."):
+        document = document[key]
+    return document
+
+def encode_requests(documents: Sequence[Dict[str, Any]]) -> bytes:
+    """Encode EngagementAnalysisRequest documents (plain dicts) as a columnar batch body."""
+    buffers = {}
+    for name in NUMBER_FIELDS:
+        buffers[name] = np.array([_field(document, name) for document in documents],
+                                 dtype=np.uint8 if name == "profile.resume_uploaded" else np.int64)
+    for name in STRING_FIELDS:
+        buffers.update(_string_buffers(name, [_field(document, name) for document in documents]))
+    for name in LIST_FIELDS:
+        lists = [_field(document, name) for document in documents]
+        buffers[f"{name}.offsets"] = np.cumsum([0] + [len(values) for values in lists], dtype=np.int64)
+        buffers.update(_string_buffers(f"{name}.values", [value for values in lists for value in values]))
+    for name in MAP_FIELDS:
+        maps = [_field(document, name) for document in documents]
+        buffers[f"{name}.offsets"] = np.cumsum([0] + [len(mapping) for mapping in maps], dtype=np.int64)
+        buffers.update(_string_buffers(f"{name}.keys", [key for mapping in maps for key in mapping]))
+        buffers[f"{name}.values"] = np.array([value for mapping in maps for value in mapping.values()], dtype=np.int64)
+    return encode_buffers(len(documents), buffers)
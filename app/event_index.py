@@ -0,0 +1,164 @@
+import heapq
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Rankings an index serves: every batch event by attendance, or the events buddies attend by overlap
+EVENT_SOURCES = ("batch", "buddies")
+
+def _attendance_key(event: str, attendance: int, overlap: int) -> Tuple[int, int, str]:
+    return (-attendance, -overlap, event)
+
+def _overlap_key(event: str, attendance: int, overlap: int) -> Tuple[int, int, str]:
+    return (-overlap, -attendance, event)
+
+class EventIndex:
+    """The events of one batch, ranked for the Event FOMO rules.
+
+    Keeps two rankings: every event in the batch's attendance by attendance
+    (ties broken by buddy overlap, then name), and every event buddies
+    attend by overlap (ties broken by attendance, then name). Buddy overlap
+    is how many times an event appears in buddies_attending_events.
+
+    Each ranking is a heap of keys with lazy deletion: changing an event's
+    counts pushes its new key in O(log n) and leaves the old one to be
+    dropped when it surfaces, and the heap is rebuilt once stale keys
+    outnumber live ones. top(k) pops k live keys and pushes them back, and
+    its answers are cached until the next change. The index is updated in
+    place and locks itself, so readers see a ranking either before or after
+    an update, never one half applied.
+    """
+
+    def __init__(self):
+        self.attendance: Dict[str, int] = {}
+        self.overlap: Dict[str, int] = {}
+        self._by_attendance: List[Tuple[int, int, str]] = []
+        self._by_overlap: List[Tuple[int, int, str]] = []
+        self._top: Dict[Tuple[int, str], List[Tuple[str, int]]] = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_snapshot(cls, snapshot) -> "EventIndex":
+        """Build an index from a peer snapshot in one heapify per ranking."""
+        index = cls()
+        index.attendance = dict(snapshot.batch_event_attendance)
+        index.overlap = dict(Counter(snapshot.buddies_attending_events))
+        index._rebuild()
+        return index
+
+    def _rebuild(self):
+        self._by_attendance = [_attendance_key(event, count, self.overlap.get(event, 0))
+                               for event, count in self.attendance.items()]
+        self._by_overlap = [_overlap_key(event, self.attendance.get(event, 0), count)
+                            for event, count in self.overlap.items()]
+        heapq.heapify(self._by_attendance)
+        heapq.heapify(self._by_overlap)
+
+    def _is_live(self, key: Tuple[int, int, str], source: str) -> bool:
+        """Whether a heap key still matches its event's counts."""
+        event = key[2]
+        attendance, overlap = self.attendance.get(event), self.overlap.get(event, 0)
+        if source == "batch":
+            return attendance is not None and key == _attendance_key(event, attendance, overlap)
+        return overlap > 0 and key == _overlap_key(event, attendance or 0, overlap)
+
+    def _link(self, event: str):
+        """Push the event's current keys; the keys they replace go stale."""
+        attendance, overlap = self.attendance.get(event), self.overlap.get(event, 0)
+        if attendance is not None:
+            heapq.heappush(self._by_attendance, _attendance_key(event, attendance, overlap))
+        if overlap:
+            heapq.heappush(self._by_overlap, _overlap_key(event, attendance or 0, overlap))
+        self._top.clear()
+        if len(self._by_attendance) + len(self._by_overlap) > 2 * (len(self.attendance) + len(self.overlap)) + 64:
+            self._rebuild()
+
+    def set_attendance(self, event: str, attendance: int):
+        """Set an event's batch attendance, adding the event if it is new."""
+        with self._lock:
+            self.attendance[event] = attendance
+            self._link(event)
+
+    def add_attendance(self, event: str, delta: int):
+        """Change an event's batch attendance by delta."""
+        with self._lock:
+            self.set_attendance(event, self.attendance.get(event, 0) + delta)
+
+    def remove_event(self, event: str):
+        """Drop an event from the batch attendance."""
+        with self._lock:
+            if event in self.attendance:
+                del self.attendance[event]
+                self._link(event)
+
+    def set_overlap(self, event: str, overlap: int):
+        """Set how many buddies attend an event."""
+        with self._lock:
+            if overlap > 0:
+                self.overlap[event] = overlap
+            else:
+                self.overlap.pop(event, None)
+            self._link(event)
+
+    def set_buddies(self, buddies_attending_events: Iterable[str]):
+        """Replace the buddy overlap, touching only events whose overlap changed."""
+        overlap = Counter(buddies_attending_events)
+        with self._lock:
+            for event in set(self.overlap) | set(overlap):
+                if self.overlap.get(event, 0) != overlap.get(event, 0):
+                    self.set_overlap(event, overlap.get(event, 0))
+
+    def update(self, snapshot, changed_events: Optional[Iterable[str]] = None):
+        """Bring the index in line with a new snapshot of the same batch, touching only changed events.
+
+        When the caller knows which events' attendance changed, pass them as
+        changed_events to skip comparing the whole attendance.
+        """
+        attendance = snapshot.batch_event_attendance
+        with self._lock:
+            if changed_events is None:
+                changed_events = [event for event in self.attendance if event not in attendance]
+                changed_events += [event for event, count in attendance.items() if self.attendance.get(event) != count]
+            for event in changed_events:
+                if event in attendance:
+                    self.set_attendance(event, attendance[event])
+                else:
+                    self.remove_event(event)
+            self.set_buddies(snapshot.buddies_attending_events)
+
+    def top(self, k: int = 1, source: str = "batch") -> List[Tuple[str, int]]:
+        """The k highest ranked (event, batch attendance) pairs of a ranking in EVENT_SOURCES."""
+        with self._lock:
+            ranked = self._top.get((k, source))
+            if ranked is None:
+                heap = self._by_attendance if source == "batch" else self._by_overlap
+                live, seen = [], set()
+                while heap and len(live) < k:
+                    key = heapq.heappop(heap)
+                    # Stale keys are dropped here; an event re-set to earlier counts can have duplicates
+                    if key[2] not in seen and self._is_live(key, source):
+                        live.append(key)
+                        seen.add(key[2])
+                for key in live:
+                    heapq.heappush(heap, key)
+                if source == "batch":
+                    ranked = [(event, -attendance) for attendance, _, event in live]
+                else:
+                    ranked = [(event, -attendance) for _, attendance, event in live]
+                self._top[(k, source)] = ranked
+            return ranked
+
+    def __len__(self) -> int:
+        return len(self.attendance)
+
+def top_events(snapshot, k: int = 1, source: str = "batch") -> List[Tuple[str, int]]:
+    """Rank a snapshot's events like EventIndex.top without building an index (for one-off snapshots)."""
+    attendance = snapshot.batch_event_attendance
+    buddies = snapshot.buddies_attending_events
+    # Buddy lists are usually a few events, where counting in place is cheaper than a Counter
+    overlap = Counter(buddies) if len(buddies) > 8 else {event: buddies.count(event) for event in buddies}
+    if source == "batch":
+        keys = (_attendance_key(event, count, overlap.get(event, 0)) for event, count in attendance.items())
+        return [(event, -count) for count, _, event in heapq.nsmallest(k, keys)]
+    keys = (_overlap_key(event, attendance.get(event, 0), count) for event, count in overlap.items())
+    return [(event, -count) for _, count, event in heapq.nsmallest(k, keys)]
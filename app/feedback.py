@@ -0,0 +1,67 @@
+import os
+import json
+import datetime
+import threading
+from typing import Any, Dict, Iterator, Optional, Sequence
+from app.tree_inference import FEATURE_NAMES
+
+# Feedback names the model whose nudge was shown, in app.tree_inference.MODEL_NAMES order
+FEEDBACK_MODELS = ("resume", "project", "event")
+
+class FeedbackLog:
+    """Append-only NDJSON log of nudge feedback, the input of incremental training.
+
+    Each line records the model whose nudge was shown, whether the user acted
+    on it and the six model features the nudge was scored with.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def record(self, user_id: str, model: str, acted_on: bool, features: Sequence[int]) -> Dict[str, Any]:
+        """Append one feedback record and return it."""
+        record = {
+            "user_id": user_id,
+            "model": model,
+            "acted_on": acted_on,
+            "features": dict(zip(FEATURE_NAMES, (int(value) for value in features))),
+            "recorded_at": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        }
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            self.recorded += 1
+        return record
+
+    def close(self):
+        """Close the log file; the next record reopens it."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def read_feedback(path: str, since: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Yield feedback records from an NDJSON file, optionally only those recorded at or after since (ISO 8601, UTC)."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if since is None or record.get("recorded_at", "") >= since:
+                yield record
+
+def build_feedback_log(config: Dict[str, Any]) -> Optional[FeedbackLog]:
+    """Create the feedback log from the "feedback" config section, or None when disabled."""
+    feedback_config = config.get("feedback", {})
+    if not feedback_config.get("enabled"):
+        return None
+    return FeedbackLog(feedback_config.get("path", "data/feedback.ndjson"))
@@ -0,0 +1,148 @@
+import sys
+import json
+import pickle
+import time
+import hashlib
+import logging
+import argparse
+import numpy as np
+from typing import Dict, List
+from app.tree_inference import FEATURE_NAMES, build_predictor
+
+logger = logging.getLogger(__name__)
+
+# Rows evaluated per forest call while building the table
+BUILD_CHUNK_SIZE = 65536
+
+class LookupTablePredictor:
+    """Answers nudge predictions from a precomputed, bit-packed table.
+
+    Every model output over the declared feature domain is stored as one bit
+    per cell, so an in-domain prediction is a single array index. Rows that
+    fall outside the domain are sent to the fallback predictor.
+    """
+
+    def __init__(self, lows: np.ndarray, sizes: np.ndarray, packed: np.ndarray, fallback):
+        self.lows = lows
+        self.sizes = sizes
+        self.packed = packed
+        self.fallback = fallback
+
+        self.strides = cell_strides(sizes)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Return resume, project and event predictions, shape (n_samples, 3)."""
+        X = np.asarray(X)
+        if X.dtype.kind not in "iub":
+            return self.fallback.predict(X)
+
+        offsets = X.astype(np.int64) - self.lows
+        in_domain = np.all((offsets >= 0) & (offsets < self.sizes), axis=1)
+
+        predictions = np.empty((X.shape[0], self.packed.shape[0]), dtype=np.int64)
+        if in_domain.any():
+            cells = offsets[in_domain] @ self.strides
+            bits = (self.packed[:, cells >> 3] >> (7 - (cells & 7)).astype(np.uint8)) & 1
+            predictions[in_domain] = bits.T
+        if not in_domain.all():
+            predictions[~in_domain] = self.fallback.predict(X[~in_domain])
+
+        return predictions
+
+def cell_strides(sizes: np.ndarray) -> np.ndarray:
+    """Return mixed-radix strides for the domain, last feature varying fastest."""
+    strides = np.ones(len(sizes), dtype=np.int64)
+    for i in range(len(sizes) - 2, -1, -1):
+        strides[i] = strides[i + 1] * sizes[i + 1]
+    return strides
+
+def model_fingerprint(model_bytes: bytes) -> str:
+    """Return the fingerprint a table records for the models it was built from."""
+    return hashlib.sha256(model_bytes).hexdigest()
+
+def domain_bounds(domain: Dict[str, List[int]]):
+    """Turn a {feature: [low, high]} mapping into low and size arrays."""
+    lows = np.array([domain[name][0] for name in FEATURE_NAMES], dtype=np.int64)
+    highs = np.array([domain[name][1] for name in FEATURE_NAMES], dtype=np.int64)
+    if np.any(highs < lows):
+        raise ValueError("Lookup table domain has a feature whose high bound is below its low bound")
+    return lows, highs - lows + 1
+
+def domain_from_training_data(file_path: str = "data/training_data.json") -> Dict[str, List[int]]:
+    """Derive the feature domain from the min/max values seen in the training data."""
+    with open(file_path, 'r') as f:
+        data = json.load(f)
+    domain = {}
+    for name in FEATURE_NAMES:
+        values = [int(sample["features"][name]) for sample in data]
+        domain[name] = [min(values), max(values)]
+    return domain
+
+def build_table(predictor, domain: Dict[str, List[int]]) -> Dict[str, np.ndarray]:
+    """Evaluate the predictor over every cell of the domain and bit-pack the outputs."""
+    lows, sizes = domain_bounds(domain)
+    cell_count = int(np.prod(sizes))
+    strides = cell_strides(sizes)
+
+    outputs = None
+    for start in range(0, cell_count, BUILD_CHUNK_SIZE):
+        cells = np.arange(start, min(start + BUILD_CHUNK_SIZE, cell_count), dtype=np.int64)
+        X = lows + (cells[:, np.newaxis] // strides) % sizes
+        predictions = predictor.predict(X)
+        if not np.isin(predictions, (0, 1)).all():
+            raise ValueError("Lookup tables only support 0/1 model outputs")
+        if outputs is None:
+            outputs = np.empty((predictions.shape[1], cell_count), dtype=bool)
+        outputs[:, cells] = predictions.T.astype(bool)
+
+    return {
+        "lows": lows,
+        "sizes": sizes,
+        "packed": np.packbits(outputs, axis=1),
+    }
+
+def save_table(path: str, table: Dict[str, np.ndarray], fingerprint: str):
+    """Save a built table next to the models it was built from."""
+    np.savez_compressed(path, model_fingerprint=np.array(fingerprint), **table)
+
+def load_lookup_predictor(path: str, fingerprint: str, fallback):
+    """Wrap the fallback predictor with the table at path, if it exists and matches the models."""
+    try:
+        with np.load(path) as table:
+            if str(table["model_fingerprint"]) != fingerprint:
+                logger.warning("Lookup table %s was built from different models; ignoring it", path)
+                return fallback
+            return LookupTablePredictor(table["lows"], table["sizes"], table["packed"], fallback)
+    except FileNotFoundError:
+        logger.warning("Lookup table %s not found; predicting with the forests", path)
+        return fallback
+
+def main(argv: List[str] = None):
+    """Build the prediction lookup table for the current models."""
+    parser = argparse.ArgumentParser(description="Precompute model predictions over the bounded feature domain.")
+    parser.add_argument("--config", default="config.json", help="Service configuration file")
+    parser.add_argument("--models", default="models/nudge_models.pkl", help="Model pickle to tabulate")
+    parser.add_argument("--output", default=None, help="Where to save the table (defaults to lookup_table.path)")
+    parser.add_argument("--domain-from-training-data", action="store_true",
+                        help="Use the min/max feature values in data/training_data.json instead of config")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    with open(args.models, 'rb') as f:
+        model_bytes = f.read()
+
+    lookup_config = config.get("lookup_table", {})
+    domain = domain_from_training_data() if args.domain_from_training_data else lookup_config["domain"]
+    output = args.output or lookup_config.get("path", "models/nudge_lookup.npz")
+
+    start = time.perf_counter()
+    # sklearn's compiled loop is the fastest exact predictor for millions of rows
+    table = build_table(build_predictor(pickle.loads(model_bytes), "sklearn"), domain)
+    save_table(output, table, model_fingerprint(model_bytes))
+
+    print(f"Tabulated {int(np.prod(table['sizes']))} feature combinations in {time.perf_counter() - start:.1f}s")
+    print(f"Lookup table saved to {output} ({table['packed'].nbytes} bytes packed)")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,6 +1,50 @@
-from fastapi import FastAPI, HTTPException
-from app.schemas import EngagementAnalysisRequest, EngagementAnalysisResponse
+import time
+import json
+import uuid
+import logging
+
+# Taken before the heavy imports so boot timings include them
+BOOT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from app.schemas import (
+    EngagementAnalysisRequest,
+    EngagementAnalysisResponse,
+    BatchEngagementAnalysisRequest,
+    BatchEngagementAnalysisResponse,
+    EngagementAnalysisByBatchRequest,
+    PeerSnapshotData,
+    PeerSnapshotRegistration,
+    PeerEventBatch,
+    PeerEventReceipt,
+    NudgeFeedback,
+    FeedbackReceipt,
+)
 from app.nudge_engine import NudgeEngine
+from app.rules import RuleConfigError
+from app.peer_snapshots import PeerSnapshotRegistry
+from app.peer_aggregator import PeerAggregator
+from app.scoring_executor import ScoringExecutor, ScoringQueueFull
+from app.metrics import CONTENT_TYPE
+from app.feedback import build_feedback_log
+from app.nudge_feed import ChangedInputsFull, build_nudge_feed
+from app.worker_fanout import WorkerFanout
+from app.request_debug import PROFILE_HEADER, build_request_debug, server_timing
+from app.model_registry import ModelRegistry, ModelRollout
+from app.columnar import CONTENT_TYPE as COLUMNAR_CONTENT_TYPE, ColumnarFormatError, decode_columnar
+from app.codec import (
+    decode_request,
+    decode_batch_request,
+    decode_by_batch_request,
+    with_snapshot,
+    encode_response,
+    encode_batch_response,
+    openapi_request_body,
+)
+
+logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -10,8 +54,169 @@ app = FastAPI(
 )
 
 # Initialize nudge engine
+imports_done = time.perf_counter()
 nudge_engine = NudgeEngine()
 
+# Versioned models that can be swapped in at runtime; boot_version serves one from the start
+registry_config = nudge_engine.config.get("model_registry", {})
+model_registry = ModelRegistry(registry_config.get("path", "models/registry"))
+model_rollout = ModelRollout(nudge_engine, model_registry, registry_config.get("warmup_rows", 512))
+boot_version = registry_config.get("boot_version")
+if boot_version == "latest":
+    boot_version = model_registry.latest()
+if boot_version:
+    model_rollout.load(boot_version)
+engine_loaded = time.perf_counter()
+
+# Startup and readiness timings, in milliseconds since BOOT_STARTED
+boot_timings = {
+    "imports_ms": 1000 * (imports_done - BOOT_STARTED),
+    "engine_load_ms": 1000 * (engine_loaded - imports_done),
+    "ready_ms": None
+}
+
+watch_config = nudge_engine.config.get("config_watch", {})
+cap_config = nudge_engine.config.get("nudge_cap", {})
+
+# Peer snapshots registered per batch id
+peer_snapshots = PeerSnapshotRegistry()
+
+# Per-batch aggregates kept up to date from peer events and published as snapshots
+peer_aggregator = PeerAggregator()
+
+# Nudge feedback appended for incremental training, None when disabled
+feedback_log = build_feedback_log(nudge_engine.config)
+
+# Precomputed per-user nudges served by GET /nudges/{user_id}, None when disabled
+nudge_feed = build_nudge_feed(nudge_engine, nudge_engine.config)
+
+# Per-request Server-Timing and profiling for /analyze-engagement, None when not allowed
+request_debug = build_request_debug(nudge_engine.config)
+
+# Run scoring off the event loop with bounded concurrency
+executor_config = nudge_engine.config.get("scoring_executor", {})
+if executor_config.get("kind") == "process" and (boot_version or nudge_engine.nudge_cap is not None):
+    # Pool processes load their own engine from config.json and the default models file
+    raise ValueError("The process scoring executor cannot serve model_registry.boot_version or the nudge cap")
+scoring_executor = ScoringExecutor(
+    nudge_engine,
+    kind=executor_config.get("kind", "thread"),
+    max_workers=executor_config.get("max_workers", 4),
+    max_in_flight=executor_config.get("max_in_flight", 64)
+)
+
+# Writes to in-memory state, applied in every prefork worker once app.prefork connects it
+worker_fanout = WorkerFanout()
+
+@worker_fanout.operation
+def reload_rules():
+    """Recompile the rules from config.json."""
+    return nudge_engine.reload_config()
+
+@worker_fanout.operation
+def activate_model_version(version: str, shadow: bool, sample_rate: float):
+    """Start loading a registry version, after any load still running so every process swaps in the same order."""
+    model_rollout.wait()
+    return model_rollout.start(version, shadow, sample_rate)
+
+@worker_fanout.operation
+def promote_shadow_version():
+    """Promote the shadowed version once it is loaded."""
+    model_rollout.wait()
+    return model_rollout.promote()
+
+@worker_fanout.operation
+def stop_shadow_version():
+    """Stop shadow scoring once the shadowed version is loaded."""
+    model_rollout.wait()
+    return nudge_engine.stop_shadow()
+
+@worker_fanout.operation
+def register_snapshot(batch_id: str, snapshot: PeerSnapshotData):
+    """Register a batch's peer snapshot."""
+    return peer_snapshots.register(batch_id, snapshot)
+
+@worker_fanout.operation
+def apply_peer_events(events):
+    """Fold peer events into the aggregates and return the new snapshot version per touched batch."""
+    touched = peer_aggregator.apply_all(events)
+    return {batch_id: peer_aggregator.publish(peer_snapshots, batch_id).version for batch_id in touched}
+
+@worker_fanout.operation
+def record_nudge_inputs(request):
+    """Record a user's new inputs in the nudge feed."""
+    return nudge_feed.update_inputs(request)
+
+@worker_fanout.operation
+def reopen_nudge_feed():
+    """Reopen the nudge feed file."""
+    return nudge_feed.reload()
+
+@worker_fanout.operation
+def keep_profile(profile_id: str, stats: bytes):
+    """Keep a debug profile under profile_id."""
+    return request_debug.store_profile(stats, profile_id)
+
+def require_thread_executor():
+    """Model swaps happen in this process, which the process executor's engines never see."""
+    if scoring_executor.kind != "thread":
+        raise HTTPException(status_code=409, detail="Model versions cannot be swapped with the process scoring executor")
+
+def overloaded_error() -> HTTPException:
+    """Error returned when the scoring queue is full."""
+    return HTTPException(
+        status_code=executor_config.get("reject_status", 503),
+        detail="Scoring queue is full, retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
+def encoded_response(mode: str, encode, *args) -> Response:
+    """Encode a response body, timing it as the "serialization" stage when metrics are on."""
+    metrics = nudge_engine.metrics
+    if metrics is None:
+        return Response(encode(*args), media_type="application/json")
+    start = time.perf_counter()
+    body = encode(*args)
+    metrics.record(mode, ("serialization",), (start, time.perf_counter()))
+    return Response(body, media_type="application/json")
+
+def decode_body(decode, body: bytes):
+    """Validate a raw JSON body, reporting errors exactly like FastAPI's own body validation."""
+    try:
+        return decode(body)
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors()])
+
+@app.on_event("startup")
+def start_background_tasks():
+    """Start the background threads in the serving process, so each prefork worker runs its own."""
+    # Reload the rules whenever config.json changes
+    if watch_config.get("enabled"):
+        nudge_engine.start_config_watcher(watch_config.get("interval_seconds", 2))
+
+    # Snapshot the daily nudge cap to disk periodically
+    if nudge_engine.nudge_cap is not None and cap_config.get("snapshot_path"):
+        nudge_engine.nudge_cap.start_snapshotter(cap_config["snapshot_path"], cap_config.get("snapshot_interval_seconds", 60))
+
+@app.on_event("startup")
+def report_boot_timings():
+    """Record and log how long the service took to become ready."""
+    boot_timings["ready_ms"] = 1000 * (time.perf_counter() - BOOT_STARTED)
+    source = "flat artifact" if nudge_engine.models is None else "pickle"
+    if nudge_engine.model_version:
+        source += f" {nudge_engine.model_version}"
+    logger.info("Ready in %.0fms (imports %.0fms, engine load %.0fms, models from %s)", boot_timings["ready_ms"],
+                boot_timings["imports_ms"], boot_timings["engine_load_ms"], source)
+
+@app.on_event("shutdown")
+def shutdown_scoring_executor():
+    """Stop the scoring workers."""
+    scoring_executor.shutdown()
+    if feedback_log is not None:
+        feedback_log.close()
+    if nudge_engine.nudge_cap is not None and cap_config.get("snapshot_path"):
+        nudge_engine.nudge_cap.save(cap_config["snapshot_path"])
+
 @app.get("/")
 async def root():
     """Root endpoint for browser access."""
@@ -22,25 +227,284 @@ async def health_check():
     """Health check endpoint."""
     return {"status": "ok"}
 
+@app.get("/ready")
+async def readiness():
+    """Readiness check reporting how long startup took."""
+    if boot_timings["ready_ms"] is None:
+        raise HTTPException(status_code=503, detail="Service is still starting")
+    return {"status": "ready", **boot_timings}
+
 @app.get("/version")
 async def version():
     """Version endpoint."""
     return {"version": "1.0.0"}
 
-@app.post("/analyze-engagement", response_model=EngagementAnalysisResponse)
-async def analyze_engagement(request: EngagementAnalysisRequest):
+@app.get("/prediction-cache/stats")
+async def prediction_cache_stats():
+    """Prediction cache size and hit/miss/eviction counters."""
+    if nudge_engine.prediction_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **nudge_engine.prediction_cache.stats()}
+
+@app.get("/nudge-cap/stats")
+async def nudge_cap_stats():
+    """Users tracked today by the daily nudge cap, its capacity and withheld nudges."""
+    if nudge_engine.nudge_cap is None:
+        return {"enabled": False}
+    return {"enabled": True, **nudge_engine.nudge_cap.stats()}
+
+@app.get("/nudge-feed/stats")
+async def nudge_feed_stats():
+    """Precomputed feed size and how reads were answered (from the feed or live)."""
+    if nudge_feed is None:
+        return {"enabled": False}
+    return {"enabled": True, **nudge_feed.stats()}
+
+@app.get("/metrics")
+async def metrics():
+    """Per-stage latency histograms and nudge counts in Prometheus text format."""
+    if nudge_engine.metrics is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(nudge_engine.metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/scoring/stats")
+async def scoring_stats():
+    """Scoring queue depth, rejections, wait time and model evaluations skipped by the planner."""
+    return {**scoring_executor.stats(), "model_planner": nudge_engine.planner_stats.stats()}
+
+@app.post("/admin/reload-config")
+async def reload_config():
+    """Recompile the rules from config.json and swap them in without a restart."""
+    try:
+        rules = await worker_fanout.apply("reload_rules")
+    except (RuleConfigError, json.JSONDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rule configuration, keeping current rules: {str(e)}")
+    return {"status": "reloaded", "rules": [rule.name for rule in rules.rules]}
+
+@app.get("/admin/models")
+async def model_status():
+    """Active, loading and shadowed model versions, with shadow disagreement and latency stats."""
+    return model_rollout.status()
+
+@app.post("/admin/models/{version}/activate", status_code=202)
+async def activate_model(version: str, shadow: bool = False, sample_rate: float = 1.0):
+    """Load a registry version in the background, warm it and swap it in (or shadow-score it with shadow=true)."""
+    require_thread_executor()
+    if shadow and not 0.0 < sample_rate <= 1.0:
+        raise HTTPException(status_code=422, detail="sample_rate must be in (0, 1]")
+    loading = model_rollout.loading
+    if loading is None:
+        try:
+            if await worker_fanout.apply("activate_model_version", version, shadow, sample_rate):
+                return {"status": "loading", "version": version, "mode": "shadow" if shadow else "active"}
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Unknown model version: {version}")
+        loading = model_rollout.loading
+    raise HTTPException(status_code=409, detail=f"Model version {loading} is still loading")
+
+@app.post("/admin/models/promote")
+async def promote_shadow_model():
+    """Make the shadowed version the active one."""
+    require_thread_executor()
+    version = await worker_fanout.apply("promote_shadow_version")
+    if version is None:
+        raise HTTPException(status_code=409, detail="No model version is being shadowed")
+    return {"status": "promoted", "version": version}
+
+@app.delete("/admin/models/shadow")
+async def stop_shadow_model():
+    """Stop shadow scoring, keeping the active models, and return the final shadow stats."""
+    shadow = await worker_fanout.apply("stop_shadow_version")
+    if shadow is None:
+        raise HTTPException(status_code=409, detail="No model version is being shadowed")
+    return {"status": "stopped", "shadow": shadow.stats()}
+
+@app.post("/analyze-engagement", response_model=EngagementAnalysisResponse,
+          openapi_extra=openapi_request_body(EngagementAnalysisRequest))
+async def analyze_engagement(http_request: Request):
     """Analyze user engagement and generate nudges."""
+    if request_debug is not None:
+        mode = request_debug.mode(http_request.headers)
+        if mode is not None:
+            return await analyze_engagement_debug(http_request, mode)
+
+    # Decode straight into the compact request structure
+    request = decode_body(decode_request, await http_request.body())
     try:
         # Generate nudges
-        nudges = nudge_engine.generate_nudges(request)
-        
-        # Create response
-        response = EngagementAnalysisResponse(
-            user_id=request.user_id,
-            nudges=nudges,
-            status="generated"
-        )
+        nudges = await scoring_executor.run("score", request)
         
-        return response
+        # Encode the response bytes directly
+        return encoded_response("single", encode_response, request.user_id, nudges)
+    except ScoringQueueFull:
+        raise overloaded_error()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating nudges: {str(e)}")
+
+async def analyze_engagement_debug(http_request: Request, mode: str) -> Response:
+    """/analyze-engagement with its stage timings in Server-Timing and, in "profile" mode, a downloadable cProfile."""
+    clock = time.perf_counter
+    t0 = clock()
+    request = decode_body(decode_request, await http_request.body())
+    t1 = clock()
+    try:
+        nudges, stages, profile = await scoring_executor.run("trace_score", request, mode == "profile")
+        t2 = clock()
+        body = encode_response(request.user_id, nudges)
+        t3 = clock()
+    except ScoringQueueFull:
+        raise overloaded_error()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating nudges: {str(e)}")
+
+    timings = [("validation", t1 - t0, None), *stages, ("encoding", t3 - t2, None), ("total", t3 - t0, None)]
+    headers = {"Server-Timing": server_timing(timings)}
+    if profile is not None:
+        profile_id = await worker_fanout.apply("keep_profile", uuid.uuid4().hex, profile)
+        headers[PROFILE_HEADER] = f"/debug/profiles/{profile_id}"
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.get("/debug/profiles/{profile_id}")
+async def download_profile(profile_id: str):
+    """Download a profile captured by a debug request, in the format pstats and snakeviz read."""
+    profile = request_debug.get_profile(profile_id) if request_debug is not None else None
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile {profile_id}")
+    return Response(profile, media_type="application/octet-stream",
+                    headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'})
+
+@app.post("/analyze-engagement/batch", response_model=BatchEngagementAnalysisResponse,
+          openapi_extra=openapi_request_body(BatchEngagementAnalysisRequest))
+async def analyze_engagement_batch(http_request: Request):
+    """Analyze a batch of users and generate nudges for each of them."""
+    requests = decode_body(decode_batch_request, await http_request.body())
+    try:
+        # Generate nudges for the whole batch at once
+        nudges_per_user = await scoring_executor.run("score_batch", requests)
+
+        # Encode one result per user, in request order
+        user_ids = [request.user_id for request in requests]
+        return encoded_response("batch", encode_batch_response, user_ids, nudges_per_user)
+    except ScoringQueueFull:
+        raise overloaded_error()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating nudges: {str(e)}")
+
+@app.post("/analyze-engagement/batch/columnar", response_model=BatchEngagementAnalysisResponse,
+          openapi_extra={"requestBody": {"required": True, "content": {COLUMNAR_CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}}}}})
+async def analyze_engagement_batch_columnar(http_request: Request):
+    """Analyze a batch of users sent in the binary columnar layout of app/columnar.py."""
+    try:
+        batch = decode_columnar(await http_request.body())
+    except ColumnarFormatError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        # Score straight from the columns, without a request object per user
+        nudges_per_user = await scoring_executor.run("score_batch", batch)
+
+        return encoded_response("batch", encode_batch_response, batch.user_ids, nudges_per_user)
+    except ScoringQueueFull:
+        raise overloaded_error()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating nudges: {str(e)}")
+
+@app.put("/peer-snapshots/{batch_id}", response_model=PeerSnapshotRegistration)
+async def register_peer_snapshot(batch_id: str, snapshot: PeerSnapshotData):
+    """Register or update the peer snapshot shared by a batch."""
+    entry = await worker_fanout.apply("register_snapshot", batch_id, snapshot)
+    return PeerSnapshotRegistration(batch_id=entry.batch_id, version=entry.version)
+
+@app.get("/peer-snapshots/{batch_id}", response_model=PeerSnapshotData)
+async def get_peer_snapshot(batch_id: str):
+    """Return the peer snapshot registered for a batch."""
+    entry = peer_snapshots.get(batch_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch id: {batch_id}")
+    return entry.snapshot
+
+@app.get("/nudges/{user_id}", response_model=EngagementAnalysisResponse)
+async def get_precomputed_nudges(user_id: str):
+    """Return a user's nudges from the precomputed feed, scoring live when their inputs changed since the build."""
+    if nudge_feed is None:
+        raise HTTPException(status_code=404, detail="The nudge feed is disabled")
+    response, request = nudge_feed.lookup(user_id)
+    if response is not None:
+        return Response(response, media_type="application/json")
+    if request is None:
+        raise HTTPException(status_code=404, detail=f"No precomputed nudges for user {user_id}")
+    try:
+        nudges = await scoring_executor.run("score", request)
+        return encoded_response("single", encode_response, user_id, nudges)
+    except ScoringQueueFull:
+        raise overloaded_error()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating nudges: {str(e)}")
+
+@app.put("/nudges/{user_id}/inputs", openapi_extra=openapi_request_body(EngagementAnalysisRequest))
+async def update_nudge_inputs(user_id: str, http_request: Request):
+    """Record a user's current inputs; reads score them live until a feed built from them is loaded."""
+    if nudge_feed is None:
+        raise HTTPException(status_code=404, detail="The nudge feed is disabled")
+    request = decode_body(decode_request, await http_request.body())
+    if request.user_id != user_id:
+        raise HTTPException(status_code=422, detail="The body's user_id does not match the path")
+    try:
+        changed = await worker_fanout.apply("record_nudge_inputs", request)
+    except ChangedInputsFull:
+        raise HTTPException(status_code=503, detail="Too many users changed since the feed was built; rebuild and reload it")
+    return {"user_id": user_id, "changed": changed}
+
+@app.post("/admin/nudge-feed/reload")
+async def reload_nudge_feed():
+    """Reopen the feed file after a rebuild."""
+    if nudge_feed is None:
+        raise HTTPException(status_code=404, detail="The nudge feed is disabled")
+    if not await worker_fanout.apply("reopen_nudge_feed"):
+        raise HTTPException(status_code=409, detail=f"No readable nudge feed at {nudge_feed.path}")
+    return nudge_feed.stats()
+
+@app.post("/peer-events", response_model=PeerEventReceipt)
+async def ingest_peer_events(batch: PeerEventBatch):
+    """Fold profile and attendance events into per-batch aggregates and register the updated snapshots."""
+    versions = await worker_fanout.apply("apply_peer_events", batch.events)
+    return PeerEventReceipt(applied=len(batch.events), batches=versions)
+
+@app.get("/peer-events/stats")
+async def peer_event_stats():
+    """Return the batches and members tracked by the peer aggregator."""
+    return peer_aggregator.stats()
+
+@app.post("/analyze-engagement/by-batch", response_model=EngagementAnalysisResponse,
+          openapi_extra=openapi_request_body(EngagementAnalysisByBatchRequest))
+async def analyze_engagement_by_batch(http_request: Request):
+    """Analyze a user against the peer snapshot registered for their batch."""
+    request = decode_body(decode_by_batch_request, await http_request.body())
+    entry = peer_snapshots.get(request.batch_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch id: {request.batch_id}")
+
+    try:
+        # Attach the registered snapshot without validating it again
+        full_request = with_snapshot(request, entry.snapshot)
+
+        # Generate nudges, reusing the snapshot's cached rule results
+        nudges = await scoring_executor.run("score", full_request, entry)
+
+        return encoded_response("single", encode_response, request.user_id, nudges)
+    except ScoringQueueFull:
+        raise overloaded_error()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating nudges: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error generating nudges: {str(e)}")
+
+@app.post("/feedback", response_model=FeedbackReceipt)
+def record_feedback(feedback: NudgeFeedback):
+    """Record whether a user acted on a model's nudge, for incremental training."""
+    if feedback_log is None:
+        raise HTTPException(status_code=404, detail="Feedback collection is disabled")
+    try:
+        # Store the features the nudge was scored with
+        features = nudge_engine.extract_features(feedback)
+        record = feedback_log.record(feedback.user_id, feedback.model, feedback.acted_on, features)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Error recording feedback: {str(e)}")
+    return FeedbackReceipt(user_id=record["user_id"], model=record["model"], recorded_at=record["recorded_at"])
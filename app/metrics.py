@@ -0,0 +1,124 @@
+import time
+import threading
+import numpy as np
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# One stage per model output, in MODEL_NAMES order
+MODEL_STAGES = ("model_resume", "model_project", "model_event")
+
+# Stages timed inside NudgeEngine, in pipeline order; a request only has the model stages it evaluated
+ENGINE_STAGES = ("rules", "feature_extraction", *MODEL_STAGES, "ml_nudges", "prioritization")
+
+# Latency bucket upper bounds in seconds, from 10µs to 1s
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Samples buffered before they are folded into the histograms
+FLUSH_EVERY = 4096
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class StageTimer:
+    """perf_counter marks between the stages of one NudgeEngine scoring call.
+
+    The engine takes a mark after rules, feature extraction, the model call,
+    ML nudges and prioritization, and sets needed to the model outputs its
+    planner evaluated. The three models run as one fused call (one tree
+    walk, or one lookup table index), which cannot be timed per model, so
+    stages() splits its time evenly over the evaluated outputs.
+    """
+    __slots__ = ("marks", "needed")
+
+    def __init__(self):
+        self.marks = [time.perf_counter()]
+        self.needed = (False, False, False)
+
+    def mark(self, count: int = 1):
+        """Close the next count stages now (stages that did not run take no time)."""
+        self.marks.extend([time.perf_counter()] * count)
+
+    def stages(self) -> Tuple[Tuple[str, ...], Tuple[float, ...]]:
+        """The ENGINE_STAGES this call ran, and their marks (one more than the stages)."""
+        start, rules, features, models, ml_nudges, end = self.marks
+        evaluated = [stage for stage, needed in zip(MODEL_STAGES, self.needed) if needed]
+        share = (models - features) / len(evaluated) if evaluated else 0.0
+        model_marks = [features + share * (k + 1) for k in range(len(evaluated) - 1)] + ([models] if evaluated else [])
+        return (("rules", "feature_extraction", *evaluated, "ml_nudges", "prioritization"),
+                (start, rules, features, *model_marks, ml_nudges, end))
+
+class PipelineMetrics:
+    """Per-stage latency histograms and emitted-nudge counters.
+
+    Recording a request only appends its perf_counter marks and emitted
+    nudges to a deque (atomic, no lock). Buffered samples are folded into
+    the histograms with NumPy every FLUSH_EVERY records and whenever the
+    metrics are rendered, so no bucket search or lock is paid per stage.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = np.array(sorted(buckets), dtype=np.float64)
+        self._pending = deque()
+        self._lock = threading.Lock()
+
+        # (mode, stage) -> [per-bucket counts plus +Inf, sum of seconds]
+        self._histograms: Dict[Tuple[str, str], list] = {}
+        self._nudges: Dict[Tuple[str, str], int] = {}
+
+    def record(self, mode: str, stages: Tuple[str, ...], marks: Tuple[float, ...], emitted: Tuple = ()):
+        """Buffer one request's stage marks (len(stages) + 1 perf_counter readings) and (type, source) nudges."""
+        self._pending.append((mode, stages, marks, emitted))
+        if len(self._pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        """Fold buffered samples into the histograms and counters."""
+        with self._lock:
+            pending = self._pending
+            samples = [pending.popleft() for _ in range(len(pending))]
+
+            groups: Dict[Tuple[str, Tuple[str, ...]], List[Tuple[float, ...]]] = {}
+            for mode, stages, marks, emitted in samples:
+                groups.setdefault((mode, stages), []).append(marks)
+                for key in emitted:
+                    self._nudges[key] = self._nudges.get(key, 0) + 1
+
+            for (mode, stages), marks in groups.items():
+                durations = np.diff(np.array(marks, dtype=np.float64), axis=1)
+                slots = np.searchsorted(self.buckets, durations, side="left")
+                for i, stage in enumerate(stages):
+                    histogram = self._histograms.get((mode, stage))
+                    if histogram is None:
+                        histogram = self._histograms[(mode, stage)] = [np.zeros(len(self.buckets) + 1, dtype=np.int64), 0.0]
+                    histogram[0] += np.bincount(slots[:, i], minlength=len(self.buckets) + 1)
+                    histogram[1] += float(durations[:, i].sum())
+
+    def render(self) -> str:
+        """Return the metrics in the Prometheus text exposition format."""
+        self.flush()
+        bounds = [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+        lines = [
+            "# HELP nudge_stage_duration_seconds Time spent in each stage of nudge generation.",
+            "# TYPE nudge_stage_duration_seconds histogram"
+        ]
+        with self._lock:
+            for (mode, stage), (counts, total) in sorted(self._histograms.items()):
+                labels = f'mode="{mode}",stage="{stage}"'
+                for bound, cumulative in zip(bounds, np.cumsum(counts).tolist()):
+                    lines.append(f'nudge_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"nudge_stage_duration_seconds_sum{{{labels}}} {total!r}")
+                lines.append(f"nudge_stage_duration_seconds_count{{{labels}}} {int(counts.sum())}")
+
+            lines.append("# HELP nudges_emitted_total Nudges returned to users, by nudge type and source.")
+            lines.append("# TYPE nudges_emitted_total counter")
+            for (nudge_type, source), count in sorted(self._nudges.items()):
+                lines.append(f'nudges_emitted_total{{type="{nudge_type}",source="{source}"}} {count}')
+
+        return "\n".join(lines) + "\n"
+
+def build_metrics(config: Dict) -> Optional[PipelineMetrics]:
+    """Create the pipeline metrics described by the "metrics" config section, or None when disabled."""
+    metrics_config = config.get("metrics", {})
+    if not metrics_config.get("enabled"):
+        return None
+    return PipelineMetrics(metrics_config.get("buckets", DEFAULT_BUCKETS))
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import pickle
+import shutil
+import logging
+import datetime
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional
+from app.tree_inference import FEATURE_NAMES, build_predictor, load_lazy_predictors, save_flat_artifact
+from app.lookup_table import LookupTablePredictor, build_table, model_fingerprint, save_table
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "nudge_models.pkl"
+ARTIFACT_DIR = "nudge_flat"
+LOOKUP_FILE = "nudge_lookup.npz"
+METADATA_FILE = "metadata.json"
+
+
+class ModelRegistry:
+    """Local directory of versioned models.
+
+    Each version lives in <root>/v0001, <root>/v0002, ... and holds the model
+    pickle, its flat artifact, its prediction lookup table when published
+    with a domain, and a metadata.json. Versions are written to a
+    hidden directory first and renamed into place, so a version that is
+    listed is always complete.
+    """
+
+    def __init__(self, root: str = "models/registry"):
+        self.root = root
+
+    def versions(self) -> List[str]:
+        """Published versions, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if name.startswith("v") and name[1:].isdigit() and os.path.isdir(os.path.join(self.root, name)))
+
+    def latest(self) -> Optional[str]:
+        """The newest published version, or None when the registry is empty."""
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def path(self, version: str) -> str:
+        """Directory of a published version; raises KeyError if it does not exist."""
+        path = os.path.join(self.root, version)
+        if version not in self.versions():
+            raise KeyError(f"Unknown model version: {version}")
+        return path
+
+    def model_path(self, version: str) -> str:
+        return os.path.join(self.path(version), MODEL_FILE)
+
+    def artifact_path(self, version: str) -> str:
+        return os.path.join(self.path(version), ARTIFACT_DIR)
+
+    def lookup_path(self, version: str) -> str:
+        return os.path.join(self.path(version), LOOKUP_FILE)
+
+    def metadata(self, version: str) -> Dict[str, Any]:
+        with open(os.path.join(self.path(version), METADATA_FILE), "r") as f:
+            return json.load(f)
+
+    def publish(self, models: Dict[str, Any], metadata: Dict[str, Any],
+                lookup_domain: Optional[Dict[str, List[int]]] = None) -> str:
+        """Write models (a trained models dict) as the next version and return its name.
+
+        With lookup_domain ({feature: [low, high]}), the models' lookup table
+        is built over it and saved with the version; for the shipped domain
+        that takes tens of seconds.
+        """
+        versions = self.versions()
+        version = f"v{int(versions[-1][1:]) + 1 if versions else 1:04d}"
+        staging = os.path.join(self.root, f".{version}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        model_bytes = pickle.dumps(models)
+        with open(os.path.join(staging, MODEL_FILE), "wb") as f:
+            f.write(model_bytes)
+        layout = models.get("layout", "separate")
+        save_flat_artifact(build_predictor(models, "flat"), os.path.join(staging, ARTIFACT_DIR),
+                           layout, model_fingerprint(model_bytes))
+        if lookup_domain is not None:
+            # sklearn's compiled loop is the fastest exact predictor for millions of rows
+            table = build_table(build_predictor(models, "sklearn"), lookup_domain)
+            save_table(os.path.join(staging, LOOKUP_FILE), table, model_fingerprint(model_bytes))
+
+        metadata = {
+            "version": version,
+            "layout": layout,
+            "created_at": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "model_fingerprint": model_fingerprint(model_bytes),
+            "lookup_table": lookup_domain is not None,
+            **metadata
+        }
+        with open(os.path.join(staging, METADATA_FILE), "w") as f:
+            json.dump(metadata, f, indent=2)
+
+        os.rename(staging, os.path.join(self.root, version))
+        return version
+
+def lookup_domain(config_path: str = "config.json") -> Optional[Dict[str, List[int]]]:
+    """The lookup table domain versions should be published with: lookup_table.domain when the table is enabled."""
+    with open(config_path, "r") as f:
+        lookup_config = json.load(f).get("lookup_table", {})
+    return lookup_config.get("domain") if lookup_config.get("enabled") else None
+
+def warmup_domain(config: Dict[str, Any]) -> Dict[str, List[int]]:
+    """The feature ranges warm-up rows are drawn from: lookup_table.domain in config.json."""
+    domain = config.get("lookup_table", {}).get("domain")
+    if domain is None:
+        raise ValueError("config.json has no lookup_table.domain to draw warm-up rows from")
+    return domain
+
+def warm_up(predictor, domain: Dict[str, List[int]], rows: int = 512):
+    """Run predictions through a freshly loaded predictor so its first requests are not cold.
+
+    Single rows and one batch of rows are predicted, which pages in the
+    memory-mapped arrays. The rows fall inside the lookup table's domain,
+    so the lazily built large-batch predictor behind it is loaded explicitly.
+    """
+    lows = np.array([domain[name][0] for name in FEATURE_NAMES])
+    highs = np.array([domain[name][1] for name in FEATURE_NAMES])
+    X = np.random.default_rng(0).integers(lows, highs + 1, (max(rows, 1), len(lows)))
+    for row in X[:32]:
+        predictor.predict(row.reshape(1, -1))
+    predictor.predict(X)
+    load_lazy_predictors(predictor)
+
+class ModelRollout:
+    """Loads registry versions into a running NudgeEngine in the background.
+
+    A version is loaded and warmed on its own thread while the current models
+    keep serving, then either swapped in or, in shadow mode, scored alongside
+    them until it is promoted or stopped. Only one load runs at a time.
+    """
+
+    def __init__(self, engine, registry: ModelRegistry, warmup_rows: int = 512):
+        self.engine = engine
+        self.registry = registry
+        self.warmup_rows = warmup_rows
+        self.loading: Optional[str] = None
+        self.last_load: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self, version: str, shadow: bool = False, sample_rate: float = 1.0):
+        """Load, warm and install (or shadow) a version on the calling thread."""
+        start = time.perf_counter()
+        model_set = self.engine.load_model_set(
+            self.registry.model_path(version),
+            artifact_path=self.registry.artifact_path(version),
+            lookup_path=self.registry.lookup_path(version),
+            version=version
+        )
+        loaded = time.perf_counter()
+        if self.engine.config.get("lookup_table", {}).get("enabled") and not isinstance(model_set.predictor, LookupTablePredictor):
+            # Serving without the table is several times slower per request, so refuse rather than degrade
+            raise RuntimeError(
+                f"Model version {version} has no lookup table matching its models; build one with "
+                f"python -m app.lookup_table --models {self.registry.model_path(version)} --output {self.registry.lookup_path(version)}"
+            )
+        warm_up(model_set.predictor, warmup_domain(self.engine.config), self.warmup_rows)
+        warmed = time.perf_counter()
+
+        if shadow:
+            self.engine.start_shadow(model_set, sample_rate)
+        else:
+            self.engine.install_model_set(model_set)
+        self.last_load = {
+            "version": version,
+            "mode": "shadow" if shadow else "active",
+            "load_ms": 1000 * (loaded - start),
+            "warmup_ms": 1000 * (warmed - loaded),
+            "error": None
+        }
+        return model_set
+
+    def start(self, version: str, shadow: bool = False, sample_rate: float = 1.0) -> bool:
+        """Load a version in the background; returns False if another load is still running.
+
+        Raises KeyError for an unknown version.
+        """
+        self.registry.path(version)
+        with self._lock:
+            if self.loading is not None:
+                return False
+            self.loading = version
+
+        def run():
+            try:
+                self.load(version, shadow, sample_rate)
+                logger.info("Model version %s is now %s", version, "shadowing" if shadow else "active")
+            except Exception as e:
+                logger.exception("Could not load model version %s; keeping the current models", version)
+                self.last_load = {"version": version, "mode": "shadow" if shadow else "active", "error": str(e)}
+            finally:
+                with self._lock:
+                    self.loading = None
+
+        self._thread = threading.Thread(target=run, name=f"model-load-{version}", daemon=True)
+        self._thread.start()
+        return True
+
+    def wait(self):
+        """Block until the background load, if any, has finished."""
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def promote(self) -> Optional[str]:
+        """Swap the shadowed candidate in as the active models; returns its version, or None if none is shadowing."""
+        shadow = self.engine.stop_shadow()
+        if shadow is None:
+            return None
+        self.engine.install_model_set(shadow.candidate)
+        return shadow.candidate.version
+
+    def status(self) -> Dict[str, Any]:
+        """Active, loading and shadowed versions plus the outcome of the last load."""
+        shadow = self.engine.shadow
+        return {
+            "active": self.engine.model_version,
+            "model_path": self.engine.model_path,
+            "loading": self.loading,
+            "shadow": shadow.stats() if shadow is not None else None,
+            "last_load": self.last_load,
+            "versions": self.registry.versions()
+        }
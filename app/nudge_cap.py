@@ -0,0 +1,324 @@
+import os
+import json
+import mmap
+import time
+import zlib
+import logging
+import threading
+import multiprocessing
+import numpy as np
+from hashlib import blake2b
+from typing import Any, Dict, List, Optional
+from app.schemas import Nudge
+
+logger = logging.getLogger(__name__)
+
+# Distinct nudge keys tracked exactly; further keys share bits (they come from config, so this is plenty)
+MASK_BITS = 32
+
+# Shards refuse new users beyond this fill, keeping linear probes short
+MAX_LOAD = 0.75
+
+# Columns of a shard's state row: users, day (-1 before first use), overflows, withheld
+SIZE, DAY, OVERFLOWS, WITHHELD = range(4)
+
+def user_hash(user_id: str) -> int:
+    """Stable 64-bit hash of a user id (0 is reserved for empty slots)."""
+    return int.from_bytes(blake2b(user_id.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+def shared_zeros(shape, dtype) -> np.ndarray:
+    """A zeroed array in anonymous shared memory, written through by processes forked after it is made."""
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return np.frombuffer(mmap.mmap(-1, max(size, 1)), dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+class _Shard:
+    """One open-addressing table: user hash -> (nudges sent today, bitmask of nudge keys sent)."""
+
+    def __init__(self, keys: np.ndarray, counts: np.ndarray, masks: np.ndarray, state: np.ndarray, lock):
+        self.keys_array = keys
+        self.counts_array = counts
+        self.masks_array = masks
+        self.keys = memoryview(keys)
+        self.counts = memoryview(counts)
+        self.masks = memoryview(masks)
+        # Kept in an array next to the table so they are shared with it, and only changed under this shard's lock
+        self.state = memoryview(state)
+        self.slot_mask = len(keys) - 1
+        self.limit = int(len(keys) * MAX_LOAD)
+        self.lock = lock
+
+    @property
+    def size(self) -> int:
+        return self.state[SIZE]
+
+    @size.setter
+    def size(self, size: int):
+        self.state[SIZE] = size
+
+    @property
+    def day(self) -> Optional[int]:
+        day = self.state[DAY]
+        return None if day < 0 else day
+
+    @day.setter
+    def day(self, day: Optional[int]):
+        self.state[DAY] = -1 if day is None else day
+
+    @property
+    def overflows(self) -> int:
+        return self.state[OVERFLOWS]
+
+    @overflows.setter
+    def overflows(self, overflows: int):
+        self.state[OVERFLOWS] = overflows
+
+    @property
+    def withheld(self) -> int:
+        return self.state[WITHHELD]
+
+    @withheld.setter
+    def withheld(self, withheld: int):
+        self.state[WITHHELD] = withheld
+
+    def clear(self, day: int):
+        self.keys_array.fill(0)
+        self.counts_array.fill(0)
+        self.masks_array.fill(0)
+        self.size = 0
+        self.day = day
+
+    def slot(self, key: int, start: int) -> int:
+        """Return the slot holding key, claiming an empty one if needed, or -1 when the shard is full."""
+        keys = self.keys
+        index = start & self.slot_mask
+        while True:
+            found = keys[index]
+            if found == key:
+                return index
+            if found == 0:
+                state = self.state
+                if state[SIZE] >= self.limit:
+                    return -1
+                keys[index] = key
+                state[SIZE] += 1
+                return index
+            index = (index + 1) & self.slot_mask
+
+class DailyNudgeCap:
+    """Per-user daily nudge cap and dedup store.
+
+    Tracks, for every user seen today, how many nudges they were sent and
+    which nudge keys (type and action) those were, in sharded open-addressing
+    tables of fixed size: 13 bytes per slot, O(1) per lookup, each shard with
+    its own lock. Users are keyed by a 64-bit hash of their id. A shard forgets
+    everything the first time it is used on a new day (midnight at
+    utc_offset_minutes), and the whole store can be snapshotted to disk and
+    restored. When a shard is full, new users are served uncapped and counted
+    as overflows rather than evicting anyone. share moves the store into
+    shared memory, so the prefork workers all count against one allowance.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, shards: int = 16, utc_offset_minutes: int = 0):
+        if shards < 1 or shards & (shards - 1):
+            raise ValueError("The number of nudge cap shards must be a power of two")
+        slots = 1
+        while slots * shards * MAX_LOAD < capacity:
+            slots *= 2
+
+        self.offset_seconds = 60 * utc_offset_minutes
+        self.shared = False
+        self._shard_mask = shards - 1
+        self._shard_bits = shards.bit_length() - 1
+        self._allocate(np.zeros, threading.Lock, shards, slots)
+        self.states[:, DAY] = -1
+
+    def _allocate(self, zeros, new_lock, shards: int, slots: int):
+        self.keys = zeros((shards, slots), np.uint64)
+        self.counts = zeros((shards, slots), np.uint8)
+        self.masks = zeros((shards, slots), np.uint32)
+        self.states = zeros((shards, 4), np.int64)
+        self._shards = [_Shard(self.keys[i], self.counts[i], self.masks[i], self.states[i], new_lock())
+                        for i in range(shards)]
+        # Hash of the nudge key owning each mask bit (0 while unassigned), shared like the tables
+        self.bit_keys = zeros(MASK_BITS, np.uint64)
+        self._bits: Dict[str, int] = {}
+        self._bits_lock = new_lock()
+
+    def share(self):
+        """Move the tables into shared memory, with process-shared locks, before forking workers.
+
+        Processes forked afterwards read and update the same tables. A
+        process killed while holding a shard lock leaves that shard locked.
+        """
+        if self.shared:
+            return
+        arrays = (self.keys, self.counts, self.masks, self.states, self.bit_keys)
+        self._allocate(shared_zeros, multiprocessing.get_context("fork").Lock, *self.keys.shape)
+        for target, source in zip((self.keys, self.counts, self.masks, self.states, self.bit_keys), arrays):
+            target[...] = source
+        self.shared = True
+
+    def today(self) -> int:
+        """Day number at the configured UTC offset."""
+        return int((time.time() + self.offset_seconds) // 86400)
+
+    def _bit(self, nudge: Nudge) -> int:
+        """Bit of the nudge's dedup key (the key _prioritize_nudges dedupes on)."""
+        key = f"{nudge.type}_{nudge.action}"
+        bit = self._bits.get(key)
+        if bit is None:
+            with self._bits_lock:
+                bit = self._bits[key] = 1 << self._claim_bit(key)
+        return bit
+
+    def _claim_bit(self, key: str) -> int:
+        """Position of key's bit in bit_keys, claiming the next free one (or sharing a bit once all are taken)."""
+        key_hash = user_hash(key)
+        for position, owner in enumerate(self.bit_keys.tolist()):
+            if owner == key_hash:
+                return position
+            if owner == 0:
+                self.bit_keys[position] = key_hash
+                return position
+        return zlib.crc32(key.encode("utf-8")) % MASK_BITS
+
+    def take(self, user_id: str, candidates: List[Nudge], limit: int) -> List[Nudge]:
+        """Return the candidates (in order) this user may still get today and record them as sent.
+
+        Nudges already sent today are skipped, and at most limit nudges are
+        sent per day in total.
+        """
+        key = user_hash(user_id)
+        shard = self._shards[key & self._shard_mask]
+        day = self.today()
+        with shard.lock:
+            state = shard.state
+            if state[DAY] != day:
+                shard.clear(day)
+            index = shard.slot(key, key >> self._shard_bits)
+            if index < 0:
+                state[OVERFLOWS] += 1
+                return candidates[:limit]
+
+            count = shard.counts[index]
+            mask = shard.masks[index]
+            selected = []
+            for nudge in candidates:
+                if count + len(selected) >= limit:
+                    break
+                bit = self._bit(nudge)
+                if not mask & bit:
+                    selected.append(nudge)
+                    mask |= bit
+            shard.counts[index] = min(count + len(selected), 255)
+            shard.masks[index] = mask
+            state[WITHHELD] += min(len(candidates), limit) - len(selected)
+        return selected
+
+    def sent_today(self, user_id: str) -> int:
+        """How many nudges the user was sent today."""
+        key = user_hash(user_id)
+        shard = self._shards[key & self._shard_mask]
+        with shard.lock:
+            if shard.day != self.today():
+                return 0
+            keys = shard.keys
+            index = (key >> self._shard_bits) & shard.slot_mask
+            while keys[index] != 0:
+                if keys[index] == key:
+                    return shard.counts[index]
+                index = (index + 1) & shard.slot_mask
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Users tracked today, capacity and overflow/withheld counters."""
+        day = self.today()
+        return {
+            "users_today": sum(shard.size for shard in self._shards if shard.day == day),
+            "capacity": sum(shard.limit for shard in self._shards),
+            "shards": len(self._shards),
+            "memory_bytes": self.keys.nbytes + self.counts.nbytes + self.masks.nbytes,
+            "shared": self.shared,
+            "overflows": sum(shard.overflows for shard in self._shards),
+            "withheld": sum(shard.withheld for shard in self._shards)
+        }
+
+    def save(self, path: str):
+        """Write a snapshot to path atomically, copying one shard at a time under its lock."""
+        keys, counts, masks = np.empty_like(self.keys), np.empty_like(self.counts), np.empty_like(self.masks)
+        days, sizes = [], []
+        for i, shard in enumerate(self._shards):
+            with shard.lock:
+                keys[i], counts[i], masks[i] = shard.keys_array, shard.counts_array, shard.masks_array
+                days.append(-1 if shard.day is None else shard.day)
+                sizes.append(shard.size)
+        with self._bits_lock:
+            bit_keys = self.bit_keys.copy()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Every process sharing the tables may save them, so each stages its own file
+        staging = f"{path}.{os.getpid()}.tmp"
+        with open(staging, "wb") as f:
+            np.savez(f, keys=keys, counts=counts, masks=masks, days=np.array(days, dtype=np.int64),
+                     sizes=np.array(sizes, dtype=np.int64), bit_keys=bit_keys)
+        os.replace(staging, path)
+
+    def load(self, path: str) -> bool:
+        """Restore a snapshot written by save; returns False if it is missing or has a different shape."""
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as snapshot:
+            if snapshot["keys"].shape != self.keys.shape:
+                logger.warning("Nudge cap snapshot %s has a different capacity or shard count; ignoring it", path)
+                return False
+            keys, counts, masks = snapshot["keys"], snapshot["counts"], snapshot["masks"]
+            days, sizes = snapshot["days"].tolist(), snapshot["sizes"].tolist()
+            if "bit_keys" in snapshot:
+                bit_keys = snapshot["bit_keys"]
+            else:
+                # Older snapshots map each nudge key to its bit
+                bit_keys = np.zeros(MASK_BITS, dtype=np.uint64)
+                for key, bit in json.loads(str(snapshot["bits"])).items():
+                    bit_keys[bit.bit_length() - 1] = user_hash(key)
+        for i, shard in enumerate(self._shards):
+            with shard.lock:
+                shard.keys_array[:] = keys[i]
+                shard.counts_array[:] = counts[i]
+                shard.masks_array[:] = masks[i]
+                shard.day = None if days[i] < 0 else days[i]
+                shard.size = sizes[i]
+        with self._bits_lock:
+            self.bit_keys[:] = bit_keys
+            self._bits = {}
+        return True
+
+    def start_snapshotter(self, path: str, interval_seconds: float = 60.0) -> threading.Thread:
+        """Save a snapshot to path every interval_seconds in the background."""
+        def snapshot():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    self.save(path)
+                except Exception:
+                    logger.exception("Could not save the nudge cap snapshot to %s", path)
+
+        snapshotter = threading.Thread(target=snapshot, name="nudge-cap-snapshot", daemon=True)
+        snapshotter.start()
+        return snapshotter
+
+def build_nudge_cap(config: Dict[str, Any]) -> Optional[DailyNudgeCap]:
+    """Create the store from the "nudge_cap" config section, restoring its snapshot; None when disabled."""
+    cap_config = config.get("nudge_cap", {})
+    if not cap_config.get("enabled"):
+        return None
+    cap = DailyNudgeCap(
+        capacity=cap_config.get("capacity", 1_000_000),
+        shards=cap_config.get("shards", 16),
+        utc_offset_minutes=cap_config.get("utc_offset_minutes", 0)
+    )
+    snapshot_path = cap_config.get("snapshot_path")
+    if snapshot_path and cap.load(snapshot_path):
+        logger.info("Restored nudge cap snapshot from %s", snapshot_path)
+    return cap
@@ -1,21 +1,265 @@
+import os
 import json
+import time
 import pickle
-import datetime
+import logging
+import threading
 import numpy as np
-from typing import List, Dict, Any
-from app.schemas import NudgeResponse, EngagementAnalysisRequest
+from typing import List, Dict, Any, NamedTuple, Optional
+from app.schemas import Nudge, NudgeResponse, EngagementAnalysisRequest
+from app.peer_snapshots import SnapshotEntry
+from app.event_index import top_events
+from app.tree_inference import build_predictor, load_flat_artifact, BatchSizeRouter, LazyPredictor
+from app.lookup_table import LookupTablePredictor, load_lookup_predictor, model_fingerprint
+from app.prediction_cache import PredictionCache
+from app.rules import PRIORITY_ORDER, RuleSet, compile_rules
+from app.metrics import MODEL_STAGES, StageTimer, build_metrics
+from app.request_debug import profile_call
+from app.shadow import ShadowPredictor
+from app.nudge_cap import build_nudge_cap
+from app.columnar import ColumnarBatch
+
+logger = logging.getLogger(__name__)
+
+# Type, action and priority label of the nudge each model output can produce, in prediction column order
+ML_NUDGES = (
+    ("profile", "Upload resume", "resume"),
+    ("profile", "Add your first project", "project"),
+    ("event", "View event details", "event_fomo"),
+)
+
+class PlannerStats:
+    """Counts of model outputs the evaluation planner needed or skipped."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.predictions_skipped = 0
+        self.evaluated = [0] * len(ML_NUDGES)
+
+    def record(self, needed: List[bool]):
+        with self._lock:
+            self.requests += 1
+            if not any(needed):
+                self.predictions_skipped += 1
+            for k, output_needed in enumerate(needed):
+                self.evaluated[k] += output_needed
+
+    def record_batch(self, plans: List[List[bool]]):
+        with self._lock:
+            self.requests += len(plans)
+            for needed in plans:
+                if not any(needed):
+                    self.predictions_skipped += 1
+                for k, output_needed in enumerate(needed):
+                    self.evaluated[k] += output_needed
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests planned, how many needed no prediction at all, and skips per model output."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "predictions_skipped": self.predictions_skipped,
+                "outputs_skipped": {
+                    output: self.requests - evaluated
+                    for output, evaluated in zip(("resume", "project", "event"), self.evaluated)
+                },
+                "skip_rate": self.predictions_skipped / self.requests if self.requests else 0.0
+            }
+
+class ModelSet(NamedTuple):
+    """Loaded models and their predictor chain, swapped into the engine as one unit."""
+    models: Optional[Dict[str, Any]]
+    layout: str
+    predictor: Any
+    cache: Optional[PredictionCache]
+    model_path: str
+    version: Optional[str]
+    fingerprint: Optional[str] = None
+
+    @property
+    def serving_predictor(self):
+        """The predictor requests call: the prediction cache when it wraps the whole chain."""
+        if self.cache is not None and self.cache.predictor is self.predictor:
+            return self.cache
+        return self.predictor
 
 class NudgeEngine:
     def __init__(self, config_path="config.json", model_path="models/nudge_models.pkl"):
         """Initialize the nudge engine with configuration and models."""
-        # Load configuration
+        # Load configuration and compile the rules
+        self.config_path = config_path
         with open(config_path, 'r') as f:
             self.config = json.load(f)
-        
+        self.rules = compile_rules(self.config)
+        self._config_mtime = os.path.getmtime(config_path)
+
+        # Predictions are cached per feature vector when prediction_cache is enabled
+        self.prediction_cache = None
+        self.shadow = None
+
+        # Per-user daily cap and dedup of sent nudges, None when switched off
+        self.nudge_cap = build_nudge_cap(self.config)
+
+        # Per-stage latency histograms and nudge counters, None when switched off
+        self.metrics = build_metrics(self.config)
+
+        # Counts of model outputs evaluated and skipped by the planner
+        self.planner_stats = PlannerStats()
+
+        # Peer-only rule results for registered snapshots, keyed by batch id
+        self._snapshot_rule_cache = {}
+
         # Load models
+        self.model_path = model_path
+        self.reload_models()
+
+    def _build_model_predictor(self, model_bytes: bytes, artifact_path: Optional[str] = None,
+                               lookup_path: Optional[str] = None):
+        """Build the predictor chain for a pickled set of models.
+
+        artifact_path and lookup_path default to inference.flat_artifact and
+        lookup_table.path. Returns the unpickled models (None when served from
+        a flat artifact), their layout and the predictor.
+        """
+        inference = self.config.get("inference", {})
+        engine = inference.get("engine", "sklearn")
+        flat_max_batch = inference.get("flat_max_batch")
+        fingerprint = model_fingerprint(model_bytes)
+
+        # Memory-map the exported flat forest when it matches the pickle, so neither
+        # the pickle nor scikit-learn has to be loaded before serving
+        models, predictor, layout = None, None, None
+        artifact_path = artifact_path or inference.get("flat_artifact")
+        if engine == "flat" and artifact_path:
+            predictor, layout = self._load_flat_artifact(artifact_path, fingerprint, model_bytes, flat_max_batch)
+
+        # Otherwise detect the model layout and pick the inference engine used for predictions
+        if predictor is None:
+            models = pickle.loads(model_bytes)
+            layout = models.get("layout", "separate")
+            predictor = build_predictor(models, engine, flat_max_batch)
+
+        # Answer in-domain predictions from the precomputed table when one matches these models
+        lookup_table = self.config.get("lookup_table", {})
+        if lookup_table.get("enabled"):
+            predictor = load_lookup_predictor(lookup_path or lookup_table["path"], fingerprint, predictor)
+
+        return models, layout, predictor
+
+    def _load_flat_artifact(self, artifact_path: str, fingerprint: str, model_bytes: bytes, flat_max_batch: Optional[int]):
+        """Load the flat artifact at artifact_path, or return (None, None) if it is missing or stale."""
+        if not os.path.isdir(artifact_path):
+            logger.warning("Flat model artifact %s not found; loading the pickled models", artifact_path)
+            return None, None
+        manifest, flat = load_flat_artifact(artifact_path)
+        if manifest["model_fingerprint"] != fingerprint:
+            logger.warning("Flat model artifact %s was exported from different models; ignoring it", artifact_path)
+            return None, None
+
+        if flat_max_batch is None:
+            return flat, manifest["layout"]
+        # Large batches still go to sklearn, loaded on first use
+        large = LazyPredictor(lambda: build_predictor(pickle.loads(model_bytes), "sklearn"))
+        return BatchSizeRouter(flat, large, flat_max_batch), manifest["layout"]
+
+    def load_model_set(self, model_path: str, artifact_path: Optional[str] = None, lookup_path: Optional[str] = None,
+                       version: Optional[str] = None) -> ModelSet:
+        """Load models into a ModelSet without touching the ones being served."""
         with open(model_path, 'rb') as f:
-            self.models = pickle.load(f)
-    
+            model_bytes = f.read()
+        models, layout, predictor = self._build_model_predictor(model_bytes, artifact_path, lookup_path)
+
+        # Each model set gets its own prediction cache, so a swap never serves stale entries
+        cache = None
+        cache_config = self.config.get("prediction_cache", {})
+        if cache_config.get("enabled"):
+            # A table lookup is cheaper than a cache lookup, so only the rows outside its domain are cached
+            table = predictor if isinstance(predictor, LookupTablePredictor) else None
+            cache = PredictionCache(
+                table.fallback if table is not None else predictor,
+                capacity=cache_config.get("capacity", 100000),
+                eviction=cache_config.get("eviction", "lru")
+            )
+            if table is not None:
+                table.fallback = cache
+        return ModelSet(models, layout, predictor, cache, model_path, version, model_fingerprint(model_bytes))
+
+    def install_model_set(self, model_set: ModelSet):
+        """Start serving model_set, ending any shadow run.
+
+        Requests already scoring keep the predictor they started with; every
+        later call uses the new one.
+        """
+        if self.prediction_cache is not None and model_set.cache is not None:
+            model_set.cache.invalidations = self.prediction_cache.invalidations + 1
+
+        self.model_set = model_set
+        self.model_path = model_set.model_path
+        self.model_version = model_set.version
+        self.models = model_set.models
+        self.layout = model_set.layout
+        self.prediction_cache = model_set.cache
+        self.shadow = None
+        self.predictor = model_set.serving_predictor
+
+    def start_shadow(self, candidate: ModelSet, sample_rate: float = 1.0) -> ShadowPredictor:
+        """Score with the candidate alongside the current models, still answering with the current ones."""
+        shadow = ShadowPredictor(self.model_set.serving_predictor, candidate, sample_rate)
+        self.shadow = shadow
+        self.predictor = shadow
+        return shadow
+
+    def stop_shadow(self) -> Optional[ShadowPredictor]:
+        """Stop shadow scoring and return the finished run, or None if none was active."""
+        shadow = self.shadow
+        if shadow is not None:
+            self.predictor = self.model_set.serving_predictor
+            self.shadow = None
+        return shadow
+
+    def reload_models(self, model_path: Optional[str] = None):
+        """Load (or reload) the models, invalidating any cached predictions."""
+        self.install_model_set(self.load_model_set(model_path or self.model_path))
+
+    def reload_config(self) -> RuleSet:
+        """Recompile the rules from config.json and swap them in atomically.
+
+        Rules and rule parameters (thresholds, priority labels and
+        max_nudges_per_day) take effect immediately; inference settings are
+        picked up on the next model reload. If the new rules do not compile,
+        the current ones stay in place and RuleConfigError is raised.
+        """
+        mtime = os.path.getmtime(self.config_path)
+        with open(self.config_path, 'r') as f:
+            config = json.load(f)
+        rules = compile_rules(config)
+
+        self.config = config
+        self.rules = rules
+        self._config_mtime = mtime
+        return rules
+
+    def start_config_watcher(self, interval_seconds: float = 2.0) -> threading.Thread:
+        """Poll config.json in the background and reload the rules when it changes."""
+        def watch():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    if os.path.getmtime(self.config_path) != self._config_mtime:
+                        self.reload_config()
+                        logger.info("Reloaded rules from %s", self.config_path)
+                except Exception:
+                    logger.exception("Could not reload rules from %s; keeping the current rules", self.config_path)
+
+        watcher = threading.Thread(target=watch, name="config-watcher", daemon=True)
+        watcher.start()
+        return watcher
+
+    def extract_features(self, request) -> np.ndarray:
+        """The model feature vector of one request, in FEATURE_NAMES order."""
+        return self._extract_features(request)[0]
+
     def _extract_features(self, request: EngagementAnalysisRequest) -> np.ndarray:
         """Extract features from the request for model prediction."""
         # Extract relevant features
@@ -24,10 +268,10 @@ class NudgeEngine:
         projects_added = request.profile.projects_added
         batch_avg_projects = request.peer_snapshot.batch_avg_projects
         batch_resume_uploaded_pct = request.peer_snapshot.batch_resume_uploaded_pct
-        
+
         # Calculate event FOMO score
         event_fomo_score = len(request.peer_snapshot.buddies_attending_events)
-        
+
         # Create feature vector
         features = np.array([
             1 if resume_uploaded else 0,
@@ -37,135 +281,329 @@ class NudgeEngine:
             batch_resume_uploaded_pct,
             event_fomo_score
         ]).reshape(1, -1)
-        
+
         return features
-    
-    def _apply_rule_based_logic(self, request: EngagementAnalysisRequest) -> List[Dict[str, Any]]:
+
+    def _extract_features_batch(self, requests: List[EngagementAnalysisRequest]) -> np.ndarray:
+        """Extract one feature matrix (one row per request) for batch model prediction."""
+        features = np.array([
+            [
+                1 if request.profile.resume_uploaded else 0,
+                request.profile.karma,
+                request.profile.projects_added,
+                request.peer_snapshot.batch_avg_projects,
+                request.peer_snapshot.batch_resume_uploaded_pct,
+                len(request.peer_snapshot.buddies_attending_events)
+            ]
+            for request in requests
+        ]).reshape(len(requests), -1)
+
+        return features
+
+    def registered_snapshot_rule_results(self, entry: SnapshotEntry, rules: RuleSet) -> List[Optional[Dict[str, Any]]]:
+        """Return the snapshot-only rule results for a registered snapshot, cached per snapshot version."""
+        cached = self._snapshot_rule_cache.get(entry.batch_id)
+        if cached is None or cached[0] != entry.version or cached[1] is not rules:
+            cached = (entry.version, rules, rules.evaluate_snapshot(entry.snapshot, entry.events))
+            self._snapshot_rule_cache[entry.batch_id] = cached
+        return cached[2]
+
+    def _apply_rule_based_logic(self, request: EngagementAnalysisRequest, rules: RuleSet,
+                                snapshot_results: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[Nudge]:
         """Apply rule-based logic to generate nudges."""
+        return rules.apply(request, snapshot_results)
+
+    def _apply_rule_based_logic_batch(self, requests: List[EngagementAnalysisRequest], rules: RuleSet) -> List[List[Nudge]]:
+        """Apply rule-based logic column-wise over a batch of requests."""
+        return rules.apply_batch(requests)
+
+    def _ml_nudges(self, request: EngagementAnalysisRequest, rules: RuleSet, resume_prediction: int, project_prediction: int, event_prediction: int) -> List[Nudge]:
+        """Turn the three model predictions for one request into nudges."""
         nudges = []
-        
-        # Resume nudge rule
-        if not request.profile.resume_uploaded and request.peer_snapshot.batch_resume_uploaded_pct >= self.config["profile_rules"]["resume_threshold"] * 100:
-            nudges.append({
-                "type": "profile",
-                "title": f"{request.peer_snapshot.batch_resume_uploaded_pct}% of your peers have uploaded resumes. You haven't yet!",
-                "action": "Upload resume now",
-                "priority": self.config["priority_labels"]["resume"]
-            })
-        
-        # Project nudge rule
-        if request.profile.projects_added == 0 and request.peer_snapshot.batch_avg_projects >= self.config["profile_rules"]["projects_avg_threshold"]:
-            nudges.append({
-                "type": "profile",
-                "title": f"Your peers have {request.peer_snapshot.batch_avg_projects} projects on average. Add your first project!",
-                "action": "Add a project",
-                "priority": self.config["priority_labels"]["project"]
-            })
-        
-        # Quiz nudge rule
-        if request.profile.quiz_history:
-            last_quiz_date = datetime.datetime.now() - datetime.timedelta(days=10)  # Simulated
-            days_since_last_quiz = (datetime.datetime.now() - last_quiz_date).days
-            if days_since_last_quiz >= self.config["profile_rules"]["quiz_idle_days"]:
-                nudges.append({
-                    "type": "profile",
-                    "title": f"It's been {days_since_last_quiz} days since your last quiz. Keep learning!",
-                    "action": "Take a 2-question quiz today",
-                    "priority": self.config["priority_labels"]["quiz"]
-                })
-        
-        # Event FOMO nudge rule
-        buddies_attending = request.peer_snapshot.buddies_attending_events
-        if buddies_attending and len(buddies_attending) >= self.config["event_rules"]["buddy_attendance_trigger"]:
-            event = buddies_attending[0]  # Just take the first event
-            nudges.append({
-                "type": "event",
-                "title": f"{len(buddies_attending)} of your buddies are joining '{event}'",
-                "action": "Join the event",
-                "priority": self.config["priority_labels"]["event_fomo"]
-            })
-        
-        # Batch attendance nudge rule
-        for event, attendance in request.peer_snapshot.batch_event_attendance.items():
-            if attendance >= self.config["event_rules"]["batch_attendance_trigger"]:
-                nudges.append({
-                    "type": "event",
-                    "title": f"{attendance} peers from your batch are attending '{event}'",
-                    "action": "Check out this popular event",
-                    "priority": self.config["priority_labels"]["event_fomo"]
-                })
-                break  # Just show one batch attendance nudge
-        
-        return nudges
-    
-    def _apply_ml_logic(self, request: EngagementAnalysisRequest) -> List[Dict[str, Any]]:
-        """Apply ML-based logic to generate nudges."""
-        features = self._extract_features(request)
-        nudges = []
-        
-        # Predict resume nudge
-        resume_prediction = self.models["resume_model"].predict(features)[0]
+
+        resume, project, event_fomo = ML_NUDGES
+
+        # Resume nudge
         if resume_prediction == 1 and not request.profile.resume_uploaded:
-            nudges.append({
-                "type": "profile",
-                "title": "Your profile would be stronger with a resume. Upload now!",
-                "action": "Upload resume",
-                "priority": self.config["priority_labels"]["resume"]
-            })
-        
-        # Predict project nudge
-        project_prediction = self.models["project_model"].predict(features)[0]
+            nudges.append(Nudge(
+                resume[0],
+                "Your profile would be stronger with a resume. Upload now!",
+                resume[1],
+                rules.priority_labels[resume[2]]
+            ))
+
+        # Project nudge
         if project_prediction == 1 and request.profile.projects_added == 0:
-            nudges.append({
-                "type": "profile",
-                "title": "Adding projects can boost your profile visibility by 70%",
-                "action": "Add your first project",
-                "priority": self.config["priority_labels"]["project"]
-            })
-        
-        # Predict event nudge
-        event_prediction = self.models["event_model"].predict(features)[0]
+            nudges.append(Nudge(
+                project[0],
+                "Adding projects can boost your profile visibility by 70%",
+                project[1],
+                rules.priority_labels[project[2]]
+            ))
+
+        # Event nudge
         if event_prediction == 1 and request.peer_snapshot.buddies_attending_events:
-            event = request.peer_snapshot.buddies_attending_events[0]
-            nudges.append({
-                "type": "event",
-                "title": f"Our AI thinks you'd enjoy the '{event}' event",
-                "action": "View event details",
-                "priority": self.config["priority_labels"]["event_fomo"]
-            })
-        
+            # The event the buddy Event FOMO rule would name: most buddies, then most attended
+            event = top_events(request.peer_snapshot, 1, "buddies")[0][0]
+            nudges.append(Nudge(
+                event_fomo[0],
+                f"Our AI thinks you'd enjoy the '{event}' event",
+                event_fomo[1],
+                rules.priority_labels[event_fomo[2]]
+            ))
+
         return nudges
-    
-    def _prioritize_nudges(self, rule_nudges: List[Dict[str, Any]], ml_nudges: List[Dict[str, Any]]) -> List[NudgeResponse]:
-        """Prioritize and combine nudges from rule-based and ML-based logic."""
+
+    def _plan_models(self, request: EngagementAnalysisRequest, rule_nudges: List[Nudge], rules: RuleSet) -> List[bool]:
+        """Decide which model outputs could still change the final nudges for this request.
+
+        An output is needed only if its nudge could be built (no resume
+        uploaded, no projects, buddies attending an event), is not replaced by
+        a rule nudge with the same key, and could still make the top
+        max_nudges_per_day: rule nudges sort ahead of ML nudges of the same
+        priority, so enough distinct rule nudges at that priority or better
+        rule it out. With the daily cap on, lower-ranked nudges can surface
+        later in the day, so only the first two checks apply.
+        """
+        needed = [
+            not request.profile.resume_uploaded,
+            request.profile.projects_added == 0,
+            bool(request.peer_snapshot.buddies_attending_events)
+        ]
+        return self._refine_plan(needed, rule_nudges, rules)
+
+    def _refine_plan(self, needed: List[bool], rule_nudges: List[Nudge], rules: RuleSet) -> List[bool]:
+        """Drop the eligible outputs whose nudge a rule nudge replaces or pushes out of the response."""
+        if not rule_nudges or not any(needed):
+            return needed
+
+        # Rank of each distinct rule nudge, only needed when the rules alone could fill the response
+        limit = None if self.nudge_cap is not None else rules.max_nudges_per_day
+        rule_ranks = None
+        if limit is not None and len(rule_nudges) >= limit:
+            rule_ranks = {}
+            for nudge in rule_nudges:
+                rule_ranks.setdefault((nudge.type, nudge.action), PRIORITY_ORDER[nudge.priority])
+
+        for k, (nudge_type, action, label) in enumerate(ML_NUDGES):
+            if not needed[k]:
+                continue
+            if any(nudge.action == action and nudge.type == nudge_type for nudge in rule_nudges):
+                needed[k] = False
+            elif rule_ranks is not None:
+                rank = PRIORITY_ORDER[rules.priority_labels[label]]
+                needed[k] = sum(1 for rule_rank in rule_ranks.values() if rule_rank <= rank) < limit
+        return needed
+
+    def _apply_ml_logic(self, request: EngagementAnalysisRequest, rules: RuleSet,
+                        rule_nudges: Optional[List[Nudge]] = None, timer: Optional[StageTimer] = None) -> List[Nudge]:
+        """Apply ML-based logic to generate nudges, skipping the models when no ML nudge could be kept.
+
+        timer, when given, is marked after feature extraction, the model call and the ML nudges.
+        """
+        needed = self._plan_models(request, rule_nudges or [], rules)
+        self.planner_stats.record(needed)
+        if timer is not None:
+            timer.needed = needed
+        if not any(needed):
+            if timer is not None:
+                timer.mark(3)
+            return []
+
+        features = self._extract_features(request)
+        if timer is not None:
+            timer.mark()
+
+        # Predict resume, project and event nudges in one pass
+        resume_prediction, project_prediction, event_prediction = self.predictor.predict(features)[0]
+        if timer is not None:
+            timer.mark()
+
+        ml_nudges = self._ml_nudges(request, rules, resume_prediction, project_prediction, event_prediction)
+        if timer is not None:
+            timer.mark()
+        return ml_nudges
+
+    def _plan_models_batch(self, requests, rule_nudges: List[List[Nudge]], rules: RuleSet) -> List[List[bool]]:
+        """_plan_models for every request of a batch; a ColumnarBatch is checked for eligibility column-wise."""
+        if isinstance(requests, ColumnarBatch):
+            return [self._refine_plan(needed, rule_nudges[i], rules) for i, needed in enumerate(requests.eligibility().tolist())]
+        return [self._plan_models(request, rule_nudges[i], rules) for i, request in enumerate(requests)]
+
+    def _extract_rows_features(self, requests, rows: List[int]) -> np.ndarray:
+        """Feature matrix for the given rows of a batch, read straight from the columns of a ColumnarBatch."""
+        if isinstance(requests, ColumnarBatch):
+            return requests.features(rows)
+        return self._extract_features_batch([requests[i] for i in rows])
+
+    def _apply_ml_logic_batch(self, requests: List[EngagementAnalysisRequest], rules: RuleSet,
+                              rule_nudges: Optional[List[List[Nudge]]] = None,
+                              timer: Optional[StageTimer] = None) -> List[List[Nudge]]:
+        """Apply ML-based logic to a batch with a single prediction call over the rows that need it.
+
+        timer, when given, is marked like in _apply_ml_logic, with the outputs any row evaluated.
+        """
+        plans = self._plan_models_batch(requests, rule_nudges or [[] for _ in range(len(requests))], rules)
+        self.planner_stats.record_batch(plans)
+        rows = [i for i, needed in enumerate(plans) if any(needed)]
+        if timer is not None:
+            timer.needed = [any(plan[k] for plan in plans) for k in range(len(MODEL_STAGES))]
+
+        ml_nudges = [[] for _ in range(len(requests))]
+        if not rows:
+            if timer is not None:
+                timer.mark(3)
+            return ml_nudges
+
+        features = self._extract_rows_features(requests, rows)
+        if timer is not None:
+            timer.mark()
+
+        # Predict resume, project and event nudges for those rows in one pass
+        predictions = self.predictor.predict(features)
+        if timer is not None:
+            timer.mark()
+
+        for row, i in enumerate(rows):
+            if any(predictions[row]):
+                ml_nudges[i] = self._ml_nudges(requests[i], rules, *predictions[row])
+        if timer is not None:
+            timer.mark()
+        return ml_nudges
+
+    def _prioritize_nudges(self, rule_nudges: List[Nudge], ml_nudges: List[Nudge], rules: RuleSet,
+                           user_id: Optional[str] = None) -> List[Nudge]:
+        """Prioritize and combine nudges from rule-based and ML-based logic.
+
+        With the daily cap enabled, nudges the user was already sent today are
+        dropped and the rest are limited to what remains of their daily
+        allowance (and recorded as sent).
+        """
         # Combine all nudges
         all_nudges = rule_nudges + ml_nudges
-        
+
         # Remove duplicates (prefer rule-based nudges)
         unique_nudges = {}
         for nudge in all_nudges:
-            nudge_key = f"{nudge['type']}_{nudge['action']}"
+            nudge_key = f"{nudge.type}_{nudge.action}"
             if nudge_key not in unique_nudges:
                 unique_nudges[nudge_key] = nudge
-        
+
         # Sort by priority
-        priority_order = {"high": 0, "medium": 1, "low": 2}
-        sorted_nudges = sorted(unique_nudges.values(), key=lambda x: priority_order[x["priority"]])
-        
+        sorted_nudges = sorted(unique_nudges.values(), key=lambda x: PRIORITY_ORDER[x.priority])
+
         # Limit to max nudges per day
-        max_nudges = self.config["max_nudges_per_day"]
-        limited_nudges = sorted_nudges[:max_nudges]
-        
-        # Convert to NudgeResponse objects
-        return [NudgeResponse(**nudge) for nudge in limited_nudges]
-    
-    def generate_nudges(self, request: EngagementAnalysisRequest) -> List[NudgeResponse]:
-        """Generate nudges based on user profile, activity, and peer data."""
+        max_nudges = rules.max_nudges_per_day
+        if self.nudge_cap is not None and user_id is not None:
+            return self.nudge_cap.take(user_id, sorted_nudges, max_nudges)
+        return sorted_nudges[:max_nudges]
+
+    def score(self, request: EngagementAnalysisRequest, snapshot_entry: Optional[SnapshotEntry] = None,
+              timer: Optional[StageTimer] = None) -> List[Nudge]:
+        """Return the prioritized nudges for one request as Nudge records.
+
+        The request only needs the attributes of EngagementAnalysisRequest, so
+        the compact structures from app.codec work as well. When the peer
+        snapshot comes from the registry, pass its entry so the peer-only
+        rule work is reused across the batch. With metrics on (or a timer
+        passed in, as trace_score does) each stage is timed.
+        """
+        if timer is None and self.metrics is not None:
+            timer = StageTimer()
+
+        # Use one rule set for the whole request, even if the config is reloaded meanwhile
+        rules = self.rules
+
         # Apply rule-based logic
-        rule_nudges = self._apply_rule_based_logic(request)
-        
-        # Apply ML-based logic
-        ml_nudges = self._apply_ml_logic(request)
-        
+        snapshot_results = self.registered_snapshot_rule_results(snapshot_entry, rules) if snapshot_entry is not None else None
+        rule_nudges = self._apply_rule_based_logic(request, rules, snapshot_results)
+        if timer is not None:
+            timer.mark()
+
+        # Apply ML-based logic where it can still change the outcome
+        ml_nudges = self._apply_ml_logic(request, rules, rule_nudges, timer)
+
         # Prioritize and combine nudges
-        return self._prioritize_nudges(rule_nudges, ml_nudges)
\ No newline at end of file
+        nudges = self._prioritize_nudges(rule_nudges, ml_nudges, rules, request.user_id)
+        if timer is not None:
+            timer.mark()
+            if self.metrics is not None:
+                self.metrics.record("single", *timer.stages(), self._count_emitted(nudges, rule_nudges))
+        return nudges
+
+    def score_batch(self, requests: List[EngagementAnalysisRequest]) -> List[List[Nudge]]:
+        """Return the prioritized nudges for many requests, one list per request in order.
+
+        requests may also be a ColumnarBatch (app.columnar), which is scored
+        from its columns without building a request object per user.
+        """
+        if not len(requests):
+            return []
+        timer = StageTimer() if self.metrics is not None else None
+
+        rules = self.rules
+
+        # Apply rule-based logic column-wise
+        rule_nudges = self._apply_rule_based_logic_batch(requests, rules)
+        if timer is not None:
+            timer.mark()
+
+        # Apply ML-based logic with one prediction pass over the rows that need it
+        ml_nudges = self._apply_ml_logic_batch(requests, rules, rule_nudges, timer)
+
+        # Prioritize and combine nudges per user
+        user_ids = batch_user_ids(requests)
+        results = [self._prioritize_nudges(rule_nudges[i], ml_nudges[i], rules, user_ids[i]) for i in range(len(requests))]
+        if timer is not None:
+            timer.mark()
+            emitted = []
+            for nudges, user_rule_nudges in zip(results, rule_nudges):
+                emitted.extend(self._count_emitted(nudges, user_rule_nudges))
+            self.metrics.record("batch", *timer.stages(), emitted)
+        return results
+
+    def generate_nudges(self, request: EngagementAnalysisRequest, snapshot_entry: Optional[SnapshotEntry] = None) -> List[NudgeResponse]:
+        """Generate nudges based on user profile, activity, and peer data."""
+        return nudge_responses(self.score(request, snapshot_entry))
+
+    def generate_nudges_batch(self, requests: List[EngagementAnalysisRequest]) -> List[List[NudgeResponse]]:
+        """Generate nudges for many users at once, returning one list per request in order."""
+        return [nudge_responses(nudges) for nudges in self.score_batch(requests)]
+
+    def _count_emitted(self, selected: List[Nudge], rule_nudges: List[Nudge]) -> List[tuple]:
+        """Label each selected nudge with its type and source (rule or ml)."""
+        # A rule nudge always wins deduplication, so membership identifies the source
+        return [(nudge.type, "rule" if nudge in rule_nudges else "ml") for nudge in selected]
+
+    def trace_score(self, request: EngagementAnalysisRequest, profile: bool = False):
+        """score one request for a debug trace.
+
+        Returns the nudges, a (stage, seconds, description) entry per stage
+        the request ran (StageTimer.stages) and, with profile, the request's
+        cProfile stats in pstats' file format (else None). The three models
+        run as one fused call, so each evaluated model's entry is an even
+        share of that call and is described as such.
+        """
+        timer = StageTimer()
+        stats = None
+        if profile:
+            nudges, stats = profile_call(self.score, request, None, timer)
+        else:
+            nudges = self.score(request, None, timer)
+
+        names, marks = timer.stages()
+        evaluated = sum(1 for name in names if name in MODEL_STAGES)
+        description = f"1/{evaluated} of one fused model call"
+        stages = [(stage, end - start, description if stage in MODEL_STAGES else None)
+                  for stage, start, end in zip(names, marks, marks[1:])]
+        return nudges, stages, stats
+
+def batch_user_ids(requests) -> List[str]:
+    """User ids of a batch of requests or a ColumnarBatch, in order."""
+    if isinstance(requests, ColumnarBatch):
+        return requests.user_ids
+    return [request.user_id for request in requests]
+
+def nudge_responses(nudges: List[Nudge]) -> List[NudgeResponse]:
+    """Convert Nudge records into the API's NudgeResponse models."""
+    return [NudgeResponse(type=nudge.type, title=nudge.title, action=nudge.action, priority=nudge.priority) for nudge in nudges]
@@ -0,0 +1,302 @@
+import os
+import sys
+import mmap
+import json
+import time
+import struct
+import logging
+import argparse
+import datetime
+import threading
+import dataclasses
+import numpy as np
+from array import array
+from hashlib import blake2b
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+from pydantic import ValidationError
+from app.codec import CompactRequest, decode_request, encode_response
+from app.nudge_cap import user_hash
+from app.bulk_score import read_chunks
+
+logger = logging.getLogger(__name__)
+
+# A feed file holds the user records, then the sorted user hashes, then one
+# fixed-width index entry per hash, then a JSON footer, its little-endian
+# uint32 length and MAGIC. Each record is the user id, the encoded
+# /analyze-engagement response and the request it was scored from.
+MAGIC = b"NUDGFED1"
+INDEX_DTYPE = np.dtype([
+    ("fingerprint", "<u8"),
+    ("offset", "<u8"),
+    ("id_length", "<u4"),
+    ("response_length", "<u4"),
+    ("request_length", "<u4"),
+    ("padding", "<u4")
+])
+
+def input_fingerprint(request: CompactRequest) -> int:
+    """64-bit fingerprint of everything a request feeds into scoring."""
+    document = json.dumps(dataclasses.asdict(request), sort_keys=True, separators=(",", ":"))
+    return int.from_bytes(blake2b(document.encode("utf-8"), digest_size=8).digest(), "little")
+
+class FeedRecord(NamedTuple):
+    fingerprint: int
+    response: bytes
+    request: bytes
+
+class NudgeFeed:
+    """Read-only, memory-mapped view of a feed file built by build_feed.
+
+    Lookups hash the user id, binary search the sorted hash column and read
+    the record straight from the mapping, so only the pages touched are
+    loaded and no scoring happens.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self._map)
+        if size < len(MAGIC) + 4 or self._map[size - len(MAGIC):] != MAGIC:
+            raise ValueError(f"{path} is not a nudge feed")
+        (footer_length,) = struct.unpack_from("<I", self._map, size - len(MAGIC) - 4)
+        footer_start = size - len(MAGIC) - 4 - footer_length
+        self.metadata: Dict[str, Any] = json.loads(self._map[footer_start:footer_start + footer_length])
+
+        users = self.metadata["users"]
+        index_offset = self.metadata["index_offset"]
+        self.hashes = np.frombuffer(self._map, dtype="<u8", count=users, offset=index_offset)
+        self.index = np.frombuffer(self._map, dtype=INDEX_DTYPE, count=users, offset=index_offset + 8 * users)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def get(self, user_id: str) -> Optional[FeedRecord]:
+        """The user's record, or None if the feed has none (the last record wins for repeated users)."""
+        key = user_hash(user_id)
+        position = int(np.searchsorted(self.hashes, np.uint64(key)))
+        wanted = user_id.encode("utf-8")
+        found = None
+        while position < len(self.hashes) and self.hashes[position] == key:
+            fingerprint, offset, id_length, response_length, request_length, _ = self.index[position].tolist()
+            if self._map[offset:offset + id_length] == wanted:
+                start = offset + id_length
+                found = FeedRecord(fingerprint, self._map[start:start + response_length],
+                                   self._map[start + response_length:start + response_length + request_length])
+            position += 1
+        return found
+
+    def close(self):
+        # Arrays still viewing the mapping keep it open until they are released
+        self.hashes = self.index = None
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+
+def build_feed(lines: Iterable[str], output_path: str, engine, chunk_size: int = 1000) -> Dict[str, Any]:
+    """Score NDJSON request lines with engine and write them as a feed file.
+
+    The file is written next to output_path and renamed into place, so a
+    serving process never sees a partial feed. Returns counts and timing.
+    """
+    start = time.perf_counter()
+    hashes, fingerprints, offsets = array("Q"), array("Q"), array("Q")
+    id_lengths, response_lengths, request_lengths = array("I"), array("I"), array("I")
+    errors = 0
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    staging = f"{output_path}.tmp"
+    with open(staging, "wb") as f:
+        for chunk in read_chunks(lines, chunk_size):
+            requests, raw = [], []
+            for line_number, line in chunk:
+                try:
+                    requests.append(decode_request(line))
+                    raw.append(line.encode("utf-8"))
+                except (ValidationError, ValueError) as e:
+                    errors += 1
+                    logger.warning("Skipping line %d: %s", line_number, e)
+            if not requests:
+                continue
+
+            for request, request_bytes, nudges in zip(requests, raw, engine.score_batch(requests)):
+                user_id = request.user_id.encode("utf-8")
+                response = encode_response(request.user_id, nudges)
+                hashes.append(user_hash(request.user_id))
+                fingerprints.append(input_fingerprint(request))
+                offsets.append(f.tell())
+                id_lengths.append(len(user_id))
+                response_lengths.append(len(response))
+                request_lengths.append(len(request_bytes))
+                f.write(user_id + response + request_bytes)
+
+        # Sorted hash column, then the index entries in the same order
+        f.write(b"\0" * (-f.tell() % 8))
+        index_offset = f.tell()
+        hash_column = np.frombuffer(hashes, dtype=np.uint64) if hashes else np.zeros(0, dtype=np.uint64)
+        order = np.argsort(hash_column, kind="stable")
+        index = np.zeros(len(order), dtype=INDEX_DTYPE)
+        for name, column in (("fingerprint", fingerprints), ("offset", offsets), ("id_length", id_lengths),
+                             ("response_length", response_lengths), ("request_length", request_lengths)):
+            if column:
+                index[name] = np.frombuffer(column, dtype=np.uint64 if column.typecode == "Q" else np.uint32)[order]
+        f.write(hash_column[order].astype("<u8").tobytes())
+        f.write(index.tobytes())
+
+        metadata = {
+            "users": len(order),
+            "index_offset": index_offset,
+            "built_at": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "model_fingerprint": engine.model_set.fingerprint,
+            "rules_fingerprint": engine.rules.fingerprint
+        }
+        footer = json.dumps(metadata).encode("utf-8")
+        f.write(footer + struct.pack("<I", len(footer)) + MAGIC)
+    os.replace(staging, output_path)
+
+    elapsed = time.perf_counter() - start
+    return {"users": len(order), "errors": errors, "seconds": elapsed,
+            "users_per_sec": len(order) / elapsed if elapsed > 0 else 0.0}
+
+class ChangedInputsFull(Exception):
+    """Raised when update_inputs would track more changed users than max_changed_users."""
+
+class NudgeFeedService:
+    """Serves precomputed nudges, falling back to live scoring when they may be out of date.
+
+    A user is scored live instead of served from the feed when their inputs
+    changed since the build (recorded with update_inputs), when the serving
+    models or rules differ from the ones the feed was built with, or when the
+    daily nudge cap is on (whose answer depends on what was already sent
+    today). The feed keeps each user's request, so stale users are rescored
+    from it. Changed inputs are held in memory until a rebuilt feed covers
+    them; at most max_changed_users are tracked, beyond which new changes
+    are refused (ChangedInputsFull) rather than dropping any, which would
+    serve those users their outdated feed answer.
+    """
+
+    def __init__(self, engine, path: str, max_changed_users: int = 100_000):
+        self.engine = engine
+        self.path = path
+        self.max_changed_users = max_changed_users
+        self.feed: Optional[NudgeFeed] = None
+        self._changed: Dict[str, Tuple[int, CompactRequest]] = {}
+        self._lock = threading.Lock()
+        self.refused_changes = 0
+        self.served = 0
+        self.live_changed = 0
+        self.live_stale = 0
+        self.misses = 0
+        self.reload()
+
+    def reload(self) -> bool:
+        """(Re)open the feed file; returns False if it is missing or unreadable."""
+        try:
+            feed = NudgeFeed(self.path)
+        except (OSError, ValueError) as e:
+            logger.warning("Nudge feed %s is not available: %s", self.path, e)
+            return False
+        # The previous mapping is released once lookups still using it finish
+        self.feed = feed
+        with self._lock:
+            # Changes the new build already reflects no longer need live scoring
+            for user_id, (fingerprint, _) in list(self._changed.items()):
+                record = feed.get(user_id)
+                if record is not None and record.fingerprint == fingerprint:
+                    del self._changed[user_id]
+        return True
+
+    def is_current(self) -> bool:
+        """Whether the feed was built with the serving models and rules, and can be served as is."""
+        feed = self.feed
+        return (feed is not None and self.engine.nudge_cap is None
+                and feed.metadata["model_fingerprint"] == self.engine.model_set.fingerprint
+                and feed.metadata["rules_fingerprint"] == self.engine.rules.fingerprint)
+
+    def update_inputs(self, request: CompactRequest) -> bool:
+        """Record a user's current inputs; returns True if they differ from the feed's (so reads go live).
+
+        Raises ChangedInputsFull for a user not yet tracked when max_changed_users are.
+        """
+        fingerprint = input_fingerprint(request)
+        record = self.feed.get(request.user_id) if self.feed is not None else None
+        with self._lock:
+            if record is not None and record.fingerprint == fingerprint:
+                self._changed.pop(request.user_id, None)
+                return False
+            if request.user_id not in self._changed and len(self._changed) >= self.max_changed_users:
+                self.refused_changes += 1
+                raise ChangedInputsFull()
+            self._changed[request.user_id] = (fingerprint, request)
+            return True
+
+    def lookup(self, user_id: str) -> Tuple[Optional[bytes], Optional[CompactRequest]]:
+        """Return (response bytes, None) to serve from the feed, (None, request) to score live, or (None, None) for unknown users."""
+        changed = self._changed.get(user_id)
+        if changed is not None:
+            self.live_changed += 1
+            return None, changed[1]
+        record = self.feed.get(user_id) if self.feed is not None else None
+        if record is None:
+            self.misses += 1
+            return None, None
+        if self.is_current():
+            self.served += 1
+            return record.response, None
+        self.live_stale += 1
+        return None, decode_request(record.request)
+
+    def stats(self) -> Dict[str, Any]:
+        """Feed size and build, whether it is current, and how reads were answered."""
+        feed = self.feed
+        return {
+            "path": self.path,
+            "users": len(feed) if feed is not None else 0,
+            "built_at": feed.metadata["built_at"] if feed is not None else None,
+            "current": self.is_current(),
+            "changed_users": len(self._changed),
+            "max_changed_users": self.max_changed_users,
+            "refused_changes": self.refused_changes,
+            "served": self.served,
+            "live_changed": self.live_changed,
+            "live_stale": self.live_stale,
+            "misses": self.misses
+        }
+
+def build_nudge_feed(engine, config: Dict[str, Any]) -> Optional[NudgeFeedService]:
+    """Create the feed service from the "nudge_feed" config section, or None when disabled."""
+    feed_config = config.get("nudge_feed", {})
+    if not feed_config.get("enabled"):
+        return None
+    return NudgeFeedService(engine, feed_config.get("path", "data/nudge_feed.bin"),
+                            feed_config.get("max_changed_users", 100_000))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute every user's nudges into a memory-mapped feed file.")
+    parser.add_argument("input", help="NDJSON file of EngagementAnalysisRequest records, or - for stdin")
+    parser.add_argument("-o", "--output", default="data/nudge_feed.bin", help="Feed file to write")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Requests scored per batch")
+    parser.add_argument("--config", default="config.json", help="Engine configuration file")
+    parser.add_argument("--models", default="models/nudge_models.pkl", help="Pickled models file")
+    args = parser.parse_args(argv)
+
+    from app.nudge_engine import NudgeEngine
+    engine = NudgeEngine(config_path=args.config, model_path=args.models)
+    # Reads score live while the daily cap is on, so the feed stores uncapped results
+    engine.nudge_cap = None
+
+    stream = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    try:
+        result = build_feed(stream, args.output, engine, args.chunk_size)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    print(f"Wrote {result['users']} users to {args.output} in {result['seconds']:.2f}s "
+          f"({result['users_per_sec']:.0f} users/sec, {result['errors']} errors)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from app.schemas import PeerEvent, PeerSnapshotData
+
+class _BatchAggregate:
+    """Running totals for one batch plus what each member last reported."""
+
+    def __init__(self):
+        self.profiles: Dict[str, Tuple[bool, int]] = {}
+        self.attending: Dict[str, Set[str]] = {}
+        self.resume_uploaded = 0
+        self.projects_added = 0
+        self.attendance: Counter = Counter()
+        self.changed_events: Set[str] = set()
+
+    def set_profile(self, user_id: str, resume_uploaded: Optional[bool], projects_added: Optional[int]):
+        old_resume, old_projects = self.profiles.get(user_id, (False, 0))
+        resume = old_resume if resume_uploaded is None else resume_uploaded
+        projects = old_projects if projects_added is None else projects_added
+        self.resume_uploaded += resume - old_resume
+        self.projects_added += projects - old_projects
+        self.profiles[user_id] = (resume, projects)
+
+    def set_attending(self, user_id: str, event: str, attending: bool):
+        events = self.attending.setdefault(user_id, set())
+        if attending == (event in events):
+            return
+        if attending:
+            events.add(event)
+            self.attendance[event] += 1
+        else:
+            events.discard(event)
+            self.attendance[event] -= 1
+            if not self.attendance[event]:
+                del self.attendance[event]
+        self.changed_events.add(event)
+
+    def leave(self, user_id: str):
+        resume, projects = self.profiles.pop(user_id, (False, 0))
+        self.resume_uploaded -= resume
+        self.projects_added -= projects
+        for event in list(self.attending.pop(user_id, ())):
+            self.attendance[event] -= 1
+            if not self.attendance[event]:
+                del self.attendance[event]
+            self.changed_events.add(event)
+
+class PeerAggregator:
+    """Keeps per-batch peer aggregates up to date from profile and attendance events.
+
+    Each event changes a running sum, count or attendance counter in O(1)
+    (a member leaving costs one step per event they attended), using the
+    member's last reported state so repeated or out-of-date values are not
+    counted twice. snapshot() turns the totals into PeerSnapshotData on
+    demand, so callers no longer scan the whole batch to build one.
+    """
+
+    def __init__(self):
+        self._batches: Dict[str, _BatchAggregate] = {}
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._published: Dict[str, int] = {}
+        self.applied = 0
+
+    def apply(self, event: PeerEvent):
+        """Fold one event into its batch's aggregates."""
+        with self._lock:
+            batch = self._batches.get(event.batch_id)
+            if batch is None:
+                batch = self._batches[event.batch_id] = _BatchAggregate()
+            if event.kind == "profile":
+                batch.set_profile(event.user_id, event.resume_uploaded, event.projects_added)
+            elif event.kind == "attendance":
+                batch.set_attending(event.user_id, event.event, event.attending)
+            else:
+                batch.leave(event.user_id)
+            self.applied += 1
+
+    def apply_all(self, events: Iterable[PeerEvent]) -> List[str]:
+        """Fold many events in; returns the batch ids they touched, in first-seen order."""
+        touched = {}
+        for event in events:
+            self.apply(event)
+            touched[event.batch_id] = None
+        return list(touched)
+
+    def snapshot(self, batch_id: str, buddies_attending_events: Iterable[str] = ()) -> Optional[PeerSnapshotData]:
+        """Build the batch's peer snapshot from its aggregates, or None for an unknown batch.
+
+        Averages and percentages are rounded half up. Buddies are per user and
+        not derived from batch events, so they are passed in.
+        """
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            members = len(batch.profiles)
+            return PeerSnapshotData(
+                batch_avg_projects=(2 * batch.projects_added + members) // (2 * members) if members else 0,
+                batch_resume_uploaded_pct=(200 * batch.resume_uploaded + members) // (2 * members) if members else 0,
+                batch_event_attendance=dict(batch.attendance),
+                buddies_attending_events=list(buddies_attending_events)
+            )
+
+    def take_changed_events(self, batch_id: str) -> Set[str]:
+        """Return and forget the events whose attendance changed since the last call."""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return set()
+            changed, batch.changed_events = batch.changed_events, set()
+            return changed
+
+    def publish(self, registry, batch_id: str):
+        """Register the batch's current snapshot in a PeerSnapshotRegistry, keeping the buddies of the snapshot it replaces."""
+        with self._publish_lock:
+            previous = registry.get(batch_id)
+            buddies = previous.snapshot.buddies_attending_events if previous is not None else ()
+            # Take the changes before building the snapshot so none are lost to a concurrent event
+            changed = self.take_changed_events(batch_id)
+            if previous is None or self._published.get(batch_id) != previous.version:
+                # The registered snapshot did not come from here, so its index is compared in full
+                changed = None
+            entry = registry.register(batch_id, self.snapshot(batch_id, buddies), changed)
+            self._published[batch_id] = entry.version
+            return entry
+
+    def stats(self) -> Dict[str, int]:
+        """Batches and members tracked and events applied."""
+        with self._lock:
+            return {
+                "batches": len(self._batches),
+                "members": sum(len(batch.profiles) for batch in self._batches.values()),
+                "events_applied": self.applied
+            }
@@ -0,0 +1,49 @@
+import threading
+from typing import Dict, Iterable, NamedTuple, Optional
+from app.schemas import PeerSnapshotData
+from app.event_index import EventIndex
+
+class SnapshotEntry(NamedTuple):
+    batch_id: str
+    version: int
+    snapshot: PeerSnapshotData
+    events: Optional[EventIndex] = None
+
+class PeerSnapshotRegistry:
+    """In-memory store of peer snapshots shared by every student in a batch.
+
+    Each update bumps the batch's version, so anything derived from a
+    snapshot can be cached per (batch_id, version). Every batch also keeps an
+    EventIndex ranking its events, which an update changes in place only for
+    the events whose attendance or buddy overlap changed; the index locks
+    itself against requests reading it meanwhile.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, SnapshotEntry] = {}
+        self._lock = threading.Lock()
+
+    def register(self, batch_id: str, snapshot: PeerSnapshotData,
+                 changed_events: Optional[Iterable[str]] = None) -> SnapshotEntry:
+        """Register or replace the snapshot for a batch.
+
+        changed_events, when known, lists the events whose attendance differs
+        from the previous snapshot, so only those are re-ranked.
+        """
+        with self._lock:
+            previous = self._entries.get(batch_id)
+            if previous is None:
+                events = EventIndex.from_snapshot(snapshot)
+            else:
+                events = previous.events
+                events.update(snapshot, changed_events)
+            entry = SnapshotEntry(batch_id, previous.version + 1 if previous else 1, snapshot, events)
+            self._entries[batch_id] = entry
+            return entry
+
+    def get(self, batch_id: str) -> Optional[SnapshotEntry]:
+        """Return the current snapshot entry for a batch, or None."""
+        return self._entries.get(batch_id)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,91 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Any
+
+EVICTION_POLICIES = ("lru", "fifo")
+
+class PredictionCache:
+    """Bounded memo of nudge predictions keyed on the feature vector.
+
+    Wraps a predictor and remembers the three predictions for each 6-tuple of
+    features it has seen. When full, the least recently used entry ("lru") or
+    the oldest inserted entry ("fifo") is evicted.
+    """
+
+    def __init__(self, predictor, capacity: int = 100000, eviction: str = "lru"):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {eviction}")
+        if capacity < 1:
+            raise ValueError("Prediction cache capacity must be at least 1")
+
+        self.predictor = predictor
+        self.capacity = capacity
+        self.eviction = eviction
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Return resume, project and event predictions, shape (n_samples, 3)."""
+        keys = [tuple(row) for row in np.asarray(X).tolist()]
+        predictions = [None] * len(keys)
+        missing = []
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._entries.get(key)
+                if cached is None:
+                    missing.append(i)
+                    continue
+                if self.eviction == "lru":
+                    self._entries.move_to_end(key)
+                predictions[i] = cached
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            predictor = self.predictor
+
+        if missing:
+            computed = predictor.predict(np.asarray(X)[missing]).tolist()
+            with self._lock:
+                for i, row in zip(missing, computed):
+                    predictions[i] = tuple(row)
+                    # Skip results computed by models that were swapped out meanwhile
+                    if predictor is self.predictor:
+                        self._store(keys[i], predictions[i])
+
+        return np.array(predictions, dtype=np.int64).reshape(len(keys), -1)
+
+    def _store(self, key, value):
+        """Insert an entry, evicting until the cache is within capacity."""
+        self._entries[key] = value
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def reset(self, predictor):
+        """Drop every entry and start predicting with new models."""
+        with self._lock:
+            if self.predictor is not None:
+                self.invalidations += 1
+            self.predictor = predictor
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss/eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "capacity": self.capacity,
+                "eviction": self.eviction,
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,310 @@
+import gc
+import os
+import sys
+import json
+import time
+import select
+import signal
+import socket
+import logging
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+import uvicorn
+from app.worker_fanout import read_frame, write_frame
+
+logger = logging.getLogger(__name__)
+
+# Signals the parent acts on between supervision passes
+HANDLED_SIGNALS = (signal.SIGHUP, signal.SIGTERM, signal.SIGINT)
+
+def usable_cpus() -> List[int]:
+    """CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+class _WorkerServer(uvicorn.Server):
+    """uvicorn server that tells the parent, through a pipe, once it is serving."""
+
+    def __init__(self, config: uvicorn.Config, ready_fd: int):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if not self.should_exit:
+            os.write(self.ready_fd, b"1")
+        os.close(self.ready_fd)
+
+class PreforkServer:
+    """Serves app.main from forked workers that share the parent's loaded models.
+
+    The parent imports app.main once (config, rules, pickled or memory-mapped
+    models, lookup table), warms the predictors and freezes the garbage
+    collector, so the workers it forks share those pages copy-on-write
+    instead of each unpickling the forests. Workers serve the listening
+    socket they inherit and can be pinned to one CPU each. A worker that
+    dies is replaced. SIGHUP reloads the rules and models in the parent and
+    then replaces the workers one at a time, stopping each old worker only
+    once its replacement serves. SIGTERM and SIGINT stop every worker
+    gracefully.
+
+    Writes to in-memory state (peer snapshots and events, nudge feed inputs
+    and reloads, /admin/models swaps, /admin/reload-config, debug profiles)
+    go through app.main.worker_fanout: each worker has a pipe to the parent
+    and one back, and the parent relays every write to all workers and
+    applies it itself, so replacement workers fork with it. The daily nudge
+    cap is moved into shared memory before forking. Prediction caches,
+    metrics and the stats endpoints stay per worker.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8000, workers: int = 1, cpu_affinity: bool = False,
+                 graceful_timeout: float = 30.0, ready_timeout: float = 60.0, log_level: str = "info"):
+        self.host = host
+        self.port = port
+        self.cpus = usable_cpus()
+        self.worker_count = workers or len(self.cpus)
+        self.cpu_affinity = cpu_affinity and hasattr(os, "sched_setaffinity")
+        self.graceful_timeout = graceful_timeout
+        self.ready_timeout = ready_timeout
+        self.log_level = log_level
+        self.workers: Dict[int, int] = {}  # pid -> worker slot
+        self.channels: Dict[int, Tuple[int, int]] = {}  # pid -> (read end of its writes, write end of the relay)
+        self.main = None
+        self.socket: Optional[socket.socket] = None
+        self._signals: List[int] = []
+        self._stopping = False
+        if cpu_affinity and not self.cpu_affinity:
+            logger.warning("CPU pinning is not supported on this platform; workers are not pinned")
+
+    def bind(self):
+        """Open the listening socket the workers share."""
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        self.socket = sock
+
+    def load(self):
+        """Import the app in the parent and prepare its memory for sharing."""
+        import app.main as main
+        if main.nudge_engine.nudge_cap is not None:
+            # One allowance per user across the workers
+            main.nudge_engine.nudge_cap.share()
+        self.main = main
+        if main.executor_config.get("kind") == "process":
+            logger.warning("The process scoring executor loads the models again in every pool process")
+        self._prepare()
+
+    def _prepare(self):
+        from app.model_registry import warm_up, warmup_domain
+        engine = self.main.nudge_engine
+        # Page in the memory-mapped arrays and load the large-batch predictor before forking
+        warm_up(engine.model_set.predictor, warmup_domain(engine.config), self.main.registry_config.get("warmup_rows", 512))
+        # Keep the collector from writing to the shared objects in every worker
+        gc.collect()
+        gc.freeze()
+
+    def _run_worker(self, slot: int, ready_fd: int, up_fd: int, down_fd: int):
+        for signum in HANDLED_SIGNALS:
+            signal.signal(signum, signal.SIG_DFL)
+        # Keep only this worker's own ends of the pipes to the parent
+        for channel in self.channels.values():
+            for fd in channel:
+                os.close(fd)
+        self.channels.clear()
+        self.main.worker_fanout.connect(up_fd, down_fd)
+        if self.cpu_affinity:
+            os.sched_setaffinity(0, {self.cpus[slot % len(self.cpus)]})
+        config = uvicorn.Config(self.main.app, log_level=self.log_level,
+                                timeout_graceful_shutdown=int(self.graceful_timeout))
+        _WorkerServer(config, ready_fd).run(sockets=[self.socket])
+
+    def spawn(self, slot: int) -> Tuple[int, bool]:
+        """Fork a worker for slot and wait until it serves; returns its pid and whether it became ready."""
+        # A load still running here would never finish in the fork
+        self.main.model_rollout.wait()
+        read_fd, write_fd = os.pipe()
+        up_read, up_write = os.pipe()
+        down_read, down_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            for fd in (read_fd, up_read, down_write):
+                os.close(fd)
+            code = 0
+            try:
+                self._run_worker(slot, write_fd, up_write, down_read)
+            except BaseException:
+                logger.exception("Worker %d failed", slot)
+                code = 1
+            finally:
+                os._exit(code)
+
+        for fd in (write_fd, up_write, down_read):
+            os.close(fd)
+        self.workers[pid] = slot
+        self.channels[pid] = (up_read, down_write)
+        readable, _, _ = select.select([read_fd], [], [], self.ready_timeout)
+        ready = bool(readable) and os.read(read_fd, 1) == b"1"
+        os.close(read_fd)
+        if ready:
+            logger.info("Worker %d (pid %d) ready", slot, pid)
+        else:
+            logger.error("Worker %d (pid %d) did not start within %ss", slot, pid, self.ready_timeout)
+        return pid, ready
+
+    def _close_channel(self, pid: int):
+        for fd in self.channels.pop(pid, ()):
+            os.close(fd)
+
+    def relay(self, timeout: float):
+        """Wait up to timeout for writes from the workers; relay each to every worker, then apply it here."""
+        sources = {up_read: pid for pid, (up_read, _) in self.channels.items()}
+        try:
+            readable, _, _ = select.select(list(sources), [], [], timeout)
+        except OSError:
+            return
+        for fd in readable:
+            if sources[fd] not in self.channels:
+                continue
+            message = read_frame(fd)
+            if message is None:
+                # The worker is gone; _reap replaces it
+                self._close_channel(sources[fd])
+                continue
+            for pid, (_, down_write) in list(self.channels.items()):
+                try:
+                    write_frame(down_write, message)
+                except OSError:
+                    self._close_channel(pid)
+            self.main.worker_fanout.run(message)
+
+    def stop_worker(self, pid: int):
+        """Ask a worker to finish its requests and exit, killing it after graceful_timeout."""
+        self.workers.pop(pid, None)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while time.monotonic() < deadline:
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    break
+            except ChildProcessError:
+                break
+            # Keep relaying, so the worker can finish requests waiting on their writes
+            self.relay(0.05)
+        else:
+            logger.warning("Worker pid %d did not stop in time; killing it", pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self._close_channel(pid)
+
+    def rolling_restart(self) -> bool:
+        """Reload rules and models, then replace the workers one at a time."""
+        engine = self.main.nudge_engine
+        gc.unfreeze()
+        try:
+            engine.reload_config()
+            engine.reload_models()
+        except Exception:
+            logger.exception("Reload failed; keeping the running workers")
+            return False
+        finally:
+            self._prepare()
+
+        for old_pid, slot in list(self.workers.items()):
+            pid, ready = self.spawn(slot)
+            if not ready:
+                logger.error("Rolling restart stopped; worker %d keeps serving", slot)
+                self.stop_worker(pid)
+                return False
+            self.stop_worker(old_pid)
+        logger.info("Rolling restart finished")
+        return True
+
+    def stop(self):
+        """Stop every worker gracefully."""
+        self._stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+
+    def _reap(self):
+        """Collect exited workers and replace them."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            slot = self.workers.pop(pid, None)
+            self._close_channel(pid)
+            if slot is not None and not self._stopping:
+                logger.warning("Worker %d (pid %d) exited with status %d; replacing it", slot, pid, status)
+                time.sleep(1)
+                self.spawn(slot)
+
+    def serve(self):
+        """Bind, load, fork the workers and supervise them until SIGTERM or SIGINT."""
+        if self.socket is None:
+            self.bind()
+        if self.main is None:
+            self.load()
+        for signum in HANDLED_SIGNALS:
+            signal.signal(signum, lambda signum, frame: self._signals.append(signum))
+
+        for slot in range(self.worker_count):
+            self.spawn(slot)
+        logger.info("Serving on %s:%d with %d workers", self.host, self.port, self.worker_count)
+
+        while True:
+            self._reap()
+            while self._signals:
+                if self._signals.pop(0) == signal.SIGHUP:
+                    self.rolling_restart()
+                else:
+                    self.stop()
+                    self.socket.close()
+                    return
+            self.relay(0.2)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve the API from prefork workers that share one copy of the loaded models.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: prefork.workers; 0 for one per CPU)")
+    parser.add_argument("--cpu-affinity", action="store_true", default=None, help="Pin each worker to one CPU")
+    parser.add_argument("--graceful-timeout", type=float, help="Seconds a stopping worker gets to finish its requests")
+    parser.add_argument("--log-level", default="info", help="Log level of the parent and the workers")
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, "fork"):
+        parser.error("prefork serving needs os.fork")
+    with open("config.json", "r") as f:
+        prefork_config: Dict[str, Any] = json.load(f).get("prefork", {})
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s:     [prefork] %(message)s")
+
+    server = PreforkServer(
+        host=args.host,
+        port=args.port,
+        workers=args.workers if args.workers is not None else prefork_config.get("workers", 0),
+        cpu_affinity=args.cpu_affinity if args.cpu_affinity is not None else prefork_config.get("cpu_affinity", False),
+        graceful_timeout=args.graceful_timeout or prefork_config.get("graceful_timeout_seconds", 30),
+        ready_timeout=prefork_config.get("ready_timeout_seconds", 60),
+        log_level=args.log_level
+    )
+    server.serve()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
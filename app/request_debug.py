@@ -0,0 +1,88 @@
+import uuid
+import marshal
+import cProfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+# Request header that turns on debug mode: "timing" for Server-Timing only,
+# "profile" to also capture a cProfile of the request
+DEBUG_HEADER = "X-Nudge-Debug"
+DEBUG_MODES = ("timing", "profile")
+
+# Response header naming where a captured profile can be downloaded
+PROFILE_HEADER = "X-Nudge-Profile"
+
+# Only one profiler can be active per process (sys.monitoring on 3.12+), so profiled calls take turns
+_profile_lock = threading.Lock()
+
+def profile_call(function: Callable, *args) -> Tuple[Any, bytes]:
+    """Run function(*args) under cProfile; returns its result and the stats in pstats' file format."""
+    profiler = cProfile.Profile()
+    with _profile_lock:
+        profiler.enable()
+        try:
+            result = function(*args)
+        finally:
+            profiler.disable()
+    profiler.create_stats()
+    return result, marshal.dumps(profiler.stats)
+
+def server_timing(stages: Iterable[Tuple[str, float, Optional[str]]]) -> str:
+    """Format (name, seconds, description) stages as a Server-Timing header value, in milliseconds."""
+    metrics = []
+    for name, seconds, description in stages:
+        metric = f"{name};dur={1000 * seconds:.3f}"
+        if description:
+            metric += f';desc="{description}"'
+        metrics.append(metric)
+    return ", ".join(metrics)
+
+class RequestDebug:
+    """Per-request debug mode for /analyze-engagement.
+
+    Requests sent with DEBUG_HEADER get a Server-Timing header with their
+    stage timings; "profile" requests are also run under cProfile and the
+    stats kept here, the last max_profiles of them, for download by id.
+    """
+
+    def __init__(self, max_profiles: int = 32):
+        self.max_profiles = max_profiles
+        self._profiles: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.traced = 0
+        self.profiled = 0
+
+    def mode(self, headers) -> Optional[str]:
+        """The debug mode a request asks for, or None; any value other than "profile" means timings only."""
+        value = headers.get(DEBUG_HEADER)
+        if not value:
+            return None
+        self.traced += 1
+        return "profile" if value.strip().lower() == "profile" else "timing"
+
+    def store_profile(self, stats: bytes, profile_id: Optional[str] = None) -> str:
+        """Keep a captured profile and return its id (a new one unless given), dropping the oldest beyond max_profiles."""
+        profile_id = profile_id or uuid.uuid4().hex
+        with self._lock:
+            self._profiles[profile_id] = stats
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+            self.profiled += 1
+        return profile_id
+
+    def get_profile(self, profile_id: str) -> Optional[bytes]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def stats(self) -> Dict[str, int]:
+        """Debug requests served and profiles captured and kept."""
+        with self._lock:
+            return {"traced": self.traced, "profiled": self.profiled, "profiles_kept": len(self._profiles)}
+
+def build_request_debug(config: Dict[str, Any]) -> Optional[RequestDebug]:
+    """Create the debug mode from the "request_debug" config section, or None when it is not allowed."""
+    debug_config = config.get("request_debug", {})
+    if not debug_config.get("enabled"):
+        return None
+    return RequestDebug(debug_config.get("max_profiles", 32))
@@ -0,0 +1,354 @@
+import json
+import hashlib
+import datetime
+import operator
+import numpy as np
+from string import Formatter
+from typing import List, Dict, Any, Optional
+from pydantic import BaseModel
+from app.schemas import EngagementAnalysisRequest, Nudge
+from app.event_index import EVENT_SOURCES, top_events
+from app.columnar import ColumnarBatch
+
+OPERATORS = {
+    ">=": operator.ge,
+    ">": operator.gt,
+    "<=": operator.le,
+    "<": operator.lt,
+    "==": operator.eq,
+    "!=": operator.ne
+}
+
+FUNCTIONS = {
+    "len": len,
+    "first": lambda items: items[0] if items else None
+}
+
+def days_since_last_quiz(request) -> int:
+    """Days since the user's last quiz."""
+    last_quiz_date = datetime.datetime.now() - datetime.timedelta(days=10)  # Simulated
+    return (datetime.datetime.now() - last_quiz_date).days
+
+# Fields computed from the request rather than read from it
+DERIVED_FIELDS = {
+    "days_since_last_quiz": days_since_last_quiz
+}
+
+# Nudge priorities, most urgent first; priority_labels must map onto these
+PRIORITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+# Request every new rule set is tried on before it is used, with non-empty
+# lists and maps so selectors and functions have something to work on
+SAMPLE_REQUEST = {
+    "user_id": "rule-check",
+    "profile": {"resume_uploaded": False, "goal_tags": ["sample"], "karma": 100, "projects_added": 0,
+                "quiz_history": ["sample"], "clubs_joined": ["sample"], "buddy_count": 1},
+    "activity": {"login_streak": 1, "posts_created": 1, "buddies_interacted": 1, "last_event_attended": "sample"},
+    "peer_snapshot": {"batch_avg_projects": 1, "batch_resume_uploaded_pct": 50,
+                      "batch_event_attendance": {"sample": 1}, "buddies_attending_events": ["sample"]}
+}
+
+# Config sections the compiled rules depend on
+RULE_CONFIG_KEYS = ("rules", "priority_labels", "max_nudges_per_day", "profile_rules", "event_rules")
+
+# Fields under this prefix depend only on the peer snapshot ("snapshot" scope);
+# everything else is "request" scope and is evaluated per user
+SNAPSHOT_PREFIX = "peer_snapshot."
+
+class RuleConfigError(ValueError):
+    """Raised when the rules in config.json cannot be compiled."""
+
+def check_field(path: str, source: str):
+    """Raise RuleConfigError unless path names a field of EngagementAnalysisRequest."""
+    model = EngagementAnalysisRequest
+    for name in path.split("."):
+        field = model.model_fields.get(name) if model is not None else None
+        if field is None:
+            raise RuleConfigError(f"Unknown field '{path}' in '{source}'")
+        annotation = field.annotation
+        model = annotation if isinstance(annotation, type) and issubclass(annotation, BaseModel) else None
+
+class Expression:
+    """A compiled field reference such as "peer_snapshot.buddies_attending_events|len"."""
+
+    def __init__(self, source: str):
+        path, _, function = source.partition("|")
+        if function and function not in FUNCTIONS:
+            raise RuleConfigError(f"Unknown function '{function}' in '{source}'")
+
+        if path not in DERIVED_FIELDS:
+            check_field(path, source)
+
+        self.source = source
+        self.path = path
+        self.function_name = function or None
+        self.function = FUNCTIONS[function] if function else None
+        if path in DERIVED_FIELDS:
+            self.scope = "request"
+            self.getter = DERIVED_FIELDS[path]
+        elif path.startswith(SNAPSHOT_PREFIX):
+            self.scope = "snapshot"
+            self.getter = operator.attrgetter(path[len(SNAPSHOT_PREFIX):])
+        else:
+            self.scope = "request"
+            self.getter = operator.attrgetter(path)
+
+    def __call__(self, request, snapshot):
+        value = self.getter(snapshot if self.scope == "snapshot" else request)
+        return self.function(value) if self.function else value
+
+def resolve_operand(operand, config: Dict[str, Any]):
+    """Turn a literal or {"param": "section.key", "scale": n} into a constant."""
+    if not isinstance(operand, dict):
+        return operand
+    value = config
+    for key in operand["param"].split("."):
+        if not isinstance(value, dict) or key not in value:
+            raise RuleConfigError(f"Unknown rule parameter '{operand['param']}'")
+        value = value[key]
+    return value * operand["scale"] if "scale" in operand else value
+
+class Condition:
+    """A compiled "field op value" check."""
+
+    def __init__(self, spec: Dict[str, Any], config: Dict[str, Any]):
+        if spec.get("op") not in OPERATORS:
+            raise RuleConfigError(f"Unknown operator '{spec.get('op')}'")
+        self.expression = Expression(spec["field"])
+        self.scope = self.expression.scope
+        self.compare = OPERATORS[spec["op"]]
+        self.value = resolve_operand(spec["value"], config)
+
+    def __call__(self, request, snapshot) -> bool:
+        return self.compare(self.expression(request, snapshot), self.value)
+
+    def column(self, requests, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Evaluate the condition for every request at once.
+
+        requests may be a ColumnarBatch, whose columns are compared directly;
+        fields it cannot serve as a column are checked row by row, only for
+        the rows still in mask.
+        """
+        if isinstance(requests, ColumnarBatch):
+            values = requests.column(self.expression)
+            if values is None:
+                result = np.zeros(len(requests), dtype=bool)
+                for i in (np.flatnonzero(mask) if mask is not None else range(len(requests))):
+                    request = requests[i]
+                    result[i] = self(request, request.peer_snapshot)
+                return result
+        else:
+            values = np.asarray([self.expression(request, request.peer_snapshot) for request in requests])
+        return np.asarray(self.compare(values, self.value), dtype=bool)
+
+class Selector:
+    """Binds names to the first item of a mapping that passes a check.
+
+    With "top_event" instead of "from", the items are the snapshot's "top"
+    highest ranked events ("batch" by attendance or "buddies" by buddy
+    overlap) with their batch attendance, read from the batch's EventIndex
+    when one is given.
+    """
+
+    def __init__(self, spec: Dict[str, Any], config: Dict[str, Any]):
+        if spec.get("op") not in OPERATORS:
+            raise RuleConfigError(f"Unknown operator '{spec.get('op')}'")
+        if "top_event" in spec:
+            if spec["top_event"] not in EVENT_SOURCES:
+                raise RuleConfigError(f"Unknown event ranking '{spec['top_event']}'")
+            self.expression = None
+            self.scope = "snapshot"
+            self.source = spec["top_event"]
+            self.top = spec.get("top", 1)
+        else:
+            self.expression = Expression(spec["from"])
+            self.scope = self.expression.scope
+        self.compare = OPERATORS[spec["op"]]
+        self.value = resolve_operand(spec["value"], config)
+        self.key_name, self.value_name = spec["as"]
+
+    def items(self, request, snapshot, events=None):
+        if self.expression is not None:
+            return self.expression(request, snapshot).items()
+        if events is not None:
+            return events.top(self.top, self.source)
+        return top_events(snapshot, self.top, self.source)
+
+    def __call__(self, request, snapshot, events=None, items=None) -> Optional[Dict[str, Any]]:
+        for key, value in items if items is not None else self.items(request, snapshot, events):
+            if self.compare(value, self.value):
+                return {self.key_name: key, self.value_name: value}
+        return None
+
+class Template:
+    """A nudge title compiled once into literal pieces and expressions."""
+
+    def __init__(self, source: str, bound_names: Dict[str, str]):
+        self.parts = []
+        self.scope = "snapshot"
+        try:
+            pieces = list(Formatter().parse(source))
+        except ValueError as e:
+            raise RuleConfigError(f"Invalid title '{source}': {e}") from e
+        for literal, field, _, _ in pieces:
+            if literal:
+                self.parts.append(literal)
+            if field is None:
+                continue
+            if field in bound_names:
+                self.parts.append(operator.itemgetter(field))
+                scope = bound_names[field]
+            else:
+                expression = Expression(field)
+                self.parts.append(expression)
+                scope = expression.scope
+            if scope == "request":
+                self.scope = "request"
+
+    def render(self, request, snapshot, bindings: Dict[str, Any]) -> str:
+        pieces = []
+        for part in self.parts:
+            if isinstance(part, str):
+                pieces.append(part)
+            elif isinstance(part, Expression):
+                pieces.append(str(part(request, snapshot)))
+            else:
+                pieces.append(str(part(bindings)))
+        return "".join(pieces)
+
+class CompiledRule:
+    """One rule from config.json, split into snapshot-only and per-request work."""
+
+    def __init__(self, spec: Dict[str, Any], config: Dict[str, Any]):
+        try:
+            self.name = spec["name"]
+            conditions = [Condition(condition, config) for condition in spec.get("when", [])]
+            self.selector = Selector(spec["select"], config) if "select" in spec else None
+
+            nudge = spec["nudge"]
+            bound = {}
+            if self.selector is not None:
+                bound = {self.selector.key_name: self.selector.scope, self.selector.value_name: self.selector.scope}
+            self.title = Template(nudge["title"], bound)
+            self.type = nudge["type"]
+            self.action = nudge["action"]
+            self.priority = config["priority_labels"][nudge["priority"]]
+        except KeyError as e:
+            raise RuleConfigError(f"Rule {spec.get('name', '?')} is missing {e}") from e
+
+        self.snapshot_conditions = [c for c in conditions if c.scope == "snapshot"]
+        self.request_conditions = [c for c in conditions if c.scope == "request"]
+
+    def build_nudge(self, title: str) -> Nudge:
+        """Build this rule's nudge with a rendered title."""
+        return Nudge(self.type, title, self.action, self.priority)
+
+    def evaluate_snapshot(self, snapshot, events=None) -> Optional[Dict[str, Any]]:
+        """Run the snapshot-only half of the rule.
+
+        Returns None when the rule cannot fire for anyone with this snapshot,
+        otherwise the bindings found so far and, when the title only depends
+        on the snapshot, the finished nudge. events is the batch's EventIndex,
+        if it has one.
+        """
+        for condition in self.snapshot_conditions:
+            if not condition(None, snapshot):
+                return None
+
+        bindings = {}
+        if self.selector is not None and self.selector.scope == "snapshot":
+            bindings = self.selector(None, snapshot, events)
+            if bindings is None:
+                return None
+
+        result = {"bindings": bindings, "nudge": None}
+        if self.title.scope == "snapshot" and (self.selector is None or self.selector.scope == "snapshot"):
+            result["nudge"] = self.build_nudge(self.title.render(None, snapshot, bindings))
+        return result
+
+    def evaluate_request(self, request, snapshot_result: Dict[str, Any]) -> Optional[Nudge]:
+        """Run the per-request half of the rule given its snapshot result."""
+        for condition in self.request_conditions:
+            if not condition(request, request.peer_snapshot):
+                return None
+        if snapshot_result["nudge"] is not None:
+            return snapshot_result["nudge"]
+
+        bindings = snapshot_result["bindings"]
+        if self.selector is not None and self.selector.scope == "request":
+            bindings = self.selector(request, request.peer_snapshot)
+            if bindings is None:
+                return None
+        return self.build_nudge(self.title.render(request, request.peer_snapshot, bindings))
+
+class RuleSet:
+    """The rules and rule parameters compiled from one version of config.json."""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.rules = [CompiledRule(spec, config) for spec in config.get("rules", [])]
+        self.max_nudges_per_day = config["max_nudges_per_day"]
+        self.priority_labels = config["priority_labels"]
+        for label, priority in self.priority_labels.items():
+            if priority not in PRIORITY_ORDER:
+                raise RuleConfigError(f"Priority label '{label}' maps to unknown priority '{priority}'")
+
+        # Identifies the rule configuration, so stored results can tell when the rules changed
+        rule_config = json.dumps({key: config.get(key) for key in RULE_CONFIG_KEYS}, sort_keys=True)
+        self.fingerprint = hashlib.sha256(rule_config.encode("utf-8")).hexdigest()
+
+    def evaluate_snapshot(self, snapshot, events=None) -> List[Optional[Dict[str, Any]]]:
+        """Run the snapshot-only half of every rule, ranking events with the batch's EventIndex if given."""
+        return [rule.evaluate_snapshot(snapshot, events) for rule in self.rules]
+
+    def apply(self, request, snapshot_results: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[Nudge]:
+        """Return the nudges every rule emits for one request, in rule order."""
+        if snapshot_results is None:
+            snapshot_results = self.evaluate_snapshot(request.peer_snapshot)
+
+        nudges = []
+        for rule, snapshot_result in zip(self.rules, snapshot_results):
+            if snapshot_result is None:
+                continue
+            nudge = rule.evaluate_request(request, snapshot_result)
+            if nudge is not None:
+                nudges.append(nudge)
+        return nudges
+
+    def apply_batch(self, requests) -> List[List[Nudge]]:
+        """Return the nudges for many requests (a list or a ColumnarBatch), evaluating conditions column-wise."""
+        nudges = [[] for _ in range(len(requests))]
+        for rule in self.rules:
+            mask = np.ones(len(requests), dtype=bool)
+            for condition in rule.snapshot_conditions + rule.request_conditions:
+                mask &= condition.column(requests, mask)
+
+            # Columnar batches rank top events for all rows at once
+            ranked = None
+            if isinstance(requests, ColumnarBatch) and rule.selector is not None and rule.selector.expression is None:
+                ranked = requests.top_events(rule.selector.top, rule.selector.source)
+
+            for i in np.flatnonzero(mask):
+                request = requests[i]
+                bindings = {}
+                if rule.selector is not None:
+                    bindings = rule.selector(request, request.peer_snapshot, items=ranked[i] if ranked is not None else None)
+                    if bindings is None:
+                        continue
+                nudges[i].append(rule.build_nudge(rule.title.render(request, request.peer_snapshot, bindings)))
+        return nudges
+
+def compile_rules(config: Dict[str, Any]) -> RuleSet:
+    """Compile the rules in a loaded config.json and try them on SAMPLE_REQUEST.
+
+    Errors the rules would only hit while scoring (a value of the wrong type
+    for its operator, say) are raised here as RuleConfigError instead.
+    """
+    rules = RuleSet(config)
+    request = EngagementAnalysisRequest(**SAMPLE_REQUEST)
+    try:
+        rules.apply(request)
+        rules.apply_batch([request])
+    except Exception as e:
+        raise RuleConfigError(f"Rules fail on a sample request: {e!r}") from e
+    return rules
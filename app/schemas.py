@@ -1,5 +1,5 @@
-from typing import List, Dict, Optional, Any
-from pydantic import BaseModel
+from typing import List, Dict, Optional, Any, NamedTuple, Literal
+from pydantic import BaseModel, model_validator
 
 class ProfileData(BaseModel):
     resume_uploaded: bool
@@ -28,13 +28,72 @@ class EngagementAnalysisRequest(BaseModel):
     activity: ActivityData
     peer_snapshot: PeerSnapshotData
 
+class EngagementAnalysisByBatchRequest(BaseModel):
+    user_id: str
+    profile: ProfileData
+    activity: ActivityData
+    batch_id: str
+
+class NudgeFeedback(BaseModel):
+    user_id: str
+    profile: ProfileData
+    activity: ActivityData
+    peer_snapshot: PeerSnapshotData
+    model: Literal["resume", "project", "event"]
+    acted_on: bool
+
+class FeedbackReceipt(BaseModel):
+    user_id: str
+    model: str
+    recorded_at: str
+
+class PeerEvent(BaseModel):
+    """A change to one batch member: their profile, an event they attend or stopped attending, or leaving the batch."""
+    kind: Literal["profile", "attendance", "leave"]
+    batch_id: str
+    user_id: str
+    resume_uploaded: Optional[bool] = None
+    projects_added: Optional[int] = None
+    event: Optional[str] = None
+    attending: bool = True
+
+    @model_validator(mode="after")
+    def check_event(self):
+        if self.kind == "attendance" and self.event is None:
+            raise ValueError("attendance events need an event")
+        return self
+
+class PeerEventBatch(BaseModel):
+    events: List[PeerEvent]
+
+class PeerEventReceipt(BaseModel):
+    applied: int
+    batches: Dict[str, int]
+
+class PeerSnapshotRegistration(BaseModel):
+    batch_id: str
+    version: int
+
 class NudgeResponse(BaseModel):
     type: str
     title: str
     action: str
     priority: str
 
+class Nudge(NamedTuple):
+    """A nudge as built by the engine; NudgeResponse is only created at the API boundary."""
+    type: str
+    title: str
+    action: str
+    priority: str
+
 class EngagementAnalysisResponse(BaseModel):
     user_id: str
     nudges: List[NudgeResponse]
-    status: str
\ No newline at end of file
+    status: str
+
+class BatchEngagementAnalysisRequest(BaseModel):
+    requests: List[EngagementAnalysisRequest]
+
+class BatchEngagementAnalysisResponse(BaseModel):
+    results: List[EngagementAnalysisResponse]
\ No newline at end of file
@@ -0,0 +1,124 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Any, Tuple
+from app.nudge_engine import NudgeEngine
+
+# Engine used by the current worker process (process executors only)
+_engine = None
+
+class ScoringQueueFull(Exception):
+    """Raised when the scoring executor already has max_in_flight requests."""
+
+def _init_worker(config_path: str, model_path: str):
+    """Load the nudge engine once per worker process."""
+    global _engine
+    _engine = NudgeEngine(config_path=config_path, model_path=model_path)
+
+    # Workers pick up rule changes from the file, as the admin endpoint only reaches the parent
+    watch_config = _engine.config.get("config_watch", {})
+    if watch_config.get("enabled"):
+        _engine.start_config_watcher(watch_config.get("interval_seconds", 2))
+
+def _call(engine: NudgeEngine, method: str, args: Tuple, enqueued_at: float):
+    """Run one engine call, returning its result and how long it waited for a worker."""
+    wait = time.monotonic() - enqueued_at
+    return getattr(engine, method)(*args), wait
+
+def _call_in_worker(method: str, args: Tuple, enqueued_at: float):
+    return _call(_engine, method, args, enqueued_at)
+
+class ScoringExecutor:
+    """Runs CPU-bound scoring off the asyncio event loop with bounded concurrency.
+
+    Engine calls go to a thread or process pool. Once max_in_flight calls
+    are queued or running, new ones fail fast with ScoringQueueFull instead
+    of piling up latency, so /health keeps answering under load.
+
+    The "process" kind scores with an engine loaded in each pool process
+    from config.json and the models file. Models swapped in or shadowed
+    through /admin/models and the daily nudge cap held by the serving
+    process do not reach those engines, so the app rejects those
+    combinations.
+    """
+
+    def __init__(self, engine: NudgeEngine, kind: str = "thread", max_workers: int = 4, max_in_flight: int = 64,
+                 config_path: str = "config.json", model_path: str = "models/nudge_models.pkl"):
+        if kind == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scoring")
+        elif kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                                 initargs=(config_path, model_path))
+        else:
+            raise ValueError(f"Unknown scoring executor kind: {kind}")
+
+        self.engine = engine
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def run(self, method: str, *args):
+        """Call NudgeEngine.<method>(*args) on a worker and await the result."""
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                raise ScoringQueueFull()
+            self.in_flight += 1
+
+        enqueued_at = time.monotonic()
+        try:
+            if self.kind == "thread":
+                future = self._executor.submit(_call, self.engine, method, args, enqueued_at)
+            else:
+                future = self._executor.submit(_call_in_worker, method, args, enqueued_at)
+        except BaseException:
+            with self._lock:
+                self.in_flight -= 1
+                self.failed += 1
+            raise
+
+        # The slot is released when the call ends, even if the caller is cancelled (a client
+        # disconnecting) while it is still queued or running
+        future.add_done_callback(self._finished)
+        result, _ = await asyncio.wrap_future(future)
+        return result
+
+    def _finished(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+                return
+            wait = future.result()[1]
+            self.completed += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, throughput and wait-time counters."""
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "queued": max(0, self.in_flight - self.max_workers),
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": 1000 * self.total_wait / self.completed if self.completed else 0.0,
+                "max_wait_ms": 1000 * self.max_wait
+            }
+
+    def shutdown(self):
+        """Stop the worker pool once queued calls finish."""
+        self._executor.shutdown(wait=True)
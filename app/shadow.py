@@ -0,0 +1,84 @@
+import time
+import random
+import threading
+import numpy as np
+from typing import Any, Dict
+
+# Outputs compared by a shadow run, in prediction column order
+SHADOW_OUTPUTS = ("resume", "project", "event")
+
+class ShadowPredictor:
+    """Answers with the primary predictor while scoring the same rows with a candidate.
+
+    A sample_rate fraction of predict calls is also sent to the candidate's
+    serving predictor. The candidate never affects responses: its errors are
+    counted and its outputs are only compared with the primary's, recording
+    how often they disagree and how their latencies differ.
+    """
+
+    def __init__(self, primary, candidate, sample_rate: float = 1.0):
+        if not 0.0 < sample_rate <= 1.0:
+            raise ValueError("Shadow sample rate must be in (0, 1]")
+        self.primary = primary
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.rows = 0
+        self.disagreements = 0
+        self.output_disagreements = np.zeros(len(SHADOW_OUTPUTS), dtype=np.int64)
+        self.errors = 0
+        self.primary_seconds = 0.0
+        self.candidate_seconds = 0.0
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Return the primary predictions, shadow-scoring a sample of calls with the candidate."""
+        clock = time.perf_counter
+        start = clock()
+        primary = self.primary.predict(X)
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return primary
+
+        primary_done = clock()
+        try:
+            shadow = self.candidate.serving_predictor.predict(X)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            return primary
+        shadow_done = clock()
+
+        differs = np.asarray(primary) != np.asarray(shadow)
+        with self._lock:
+            self.calls += 1
+            self.rows += len(differs)
+            self.disagreements += int(differs.any(axis=1).sum())
+            self.output_disagreements += differs.sum(axis=0)
+            self.primary_seconds += primary_done - start
+            self.candidate_seconds += shadow_done - primary_done
+        return primary
+
+    def stats(self) -> Dict[str, Any]:
+        """Disagreement rates and mean per-call latencies of the two predictors."""
+        with self._lock:
+            calls, rows = self.calls, self.rows
+            primary_us = 1e6 * self.primary_seconds / calls if calls else 0.0
+            candidate_us = 1e6 * self.candidate_seconds / calls if calls else 0.0
+            return {
+                "version": self.candidate.version,
+                "sample_rate": self.sample_rate,
+                "running_seconds": time.time() - self.started_at,
+                "calls": calls,
+                "rows": rows,
+                "errors": self.errors,
+                "disagreement_rate": self.disagreements / rows if rows else 0.0,
+                "output_disagreement_rates": {
+                    name: int(count) / rows if rows else 0.0
+                    for name, count in zip(SHADOW_OUTPUTS, self.output_disagreements)
+                },
+                "primary_mean_us": primary_us,
+                "candidate_mean_us": candidate_us,
+                "latency_delta_us": candidate_us - primary_us,
+            }
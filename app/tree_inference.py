@@ -0,0 +1,351 @@
+import os
+import json
+import threading
+import numpy as np
+from typing import List, Dict, Any, Tuple
+
+MODEL_NAMES = ("resume_model", "project_model", "event_model")
+
+# Model input columns, in NudgeEngine.extract_features order
+FEATURE_NAMES = ["resume_uploaded", "karma", "projects_added",
+                 "batch_avg_projects", "batch_resume_uploaded_pct", "event_fomo_score"]
+
+# Rows walked together by FlatForest.apply
+APPLY_CHUNK_SIZE = 256
+
+class FlatForest:
+    """A fitted RandomForestClassifier compiled into flat NumPy node arrays.
+
+    All trees share one set of arrays (feature, threshold, left, right, value)
+    and are walked together, so a prediction costs a handful of vectorized
+    steps per tree level instead of sklearn's validation, joblib dispatch and
+    per-tree Python loop. Predictions are bit-identical to sklearn's.
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, children: np.ndarray,
+                 value: np.ndarray, roots: np.ndarray, depth: int, classes: List[np.ndarray]):
+        self.feature = feature
+        self.threshold = threshold
+        # Children are interleaved as [right, left] so a step is children[2 * node + go_left]
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.classes = classes
+
+    @staticmethod
+    def interleave(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        """Pack left and right child arrays into one [right, left] array."""
+        children = np.empty(2 * left.shape[0], dtype=np.intp)
+        children[0::2] = right
+        children[1::2] = left
+        return children
+
+    @property
+    def left(self) -> np.ndarray:
+        return self.children[1::2]
+
+    @property
+    def right(self) -> np.ndarray:
+        return self.children[0::2]
+
+    @classmethod
+    def from_sklearn(cls, model) -> "FlatForest":
+        """Compile a fitted RandomForestClassifier into flat arrays."""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        depth = 0
+        offset = 0
+
+        n_classes = np.atleast_1d(model.n_classes_)
+        max_classes = int(n_classes.max())
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            # Leaves point back at themselves so every row can take the same number of steps
+            left = np.where(is_leaf, node_ids, tree.children_left) + offset
+            right = np.where(is_leaf, node_ids, tree.children_right) + offset
+            feature = np.where(is_leaf, 0, tree.feature)
+
+            # Store per-node class probabilities, normalized exactly as DecisionTreeClassifier.predict_proba does
+            value = np.zeros((tree.node_count, tree.n_outputs, max_classes), dtype=np.float64)
+            for k in range(tree.n_outputs):
+                proba = tree.value[:, k, :n_classes[k]].copy()
+                normalizer = proba.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                proba /= normalizer
+                value[:, k, :n_classes[k]] = proba
+
+            features.append(feature)
+            thresholds.append(tree.threshold)
+            lefts.append(left)
+            rights.append(right)
+            values.append(value)
+            roots.append(offset)
+            depth = max(depth, tree.max_depth)
+            offset += tree.node_count
+
+        classes = model.classes_ if isinstance(model.classes_, list) else [model.classes_]
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=cls.interleave(np.concatenate(lefts), np.concatenate(rights)),
+            value=np.concatenate(values),
+            roots=np.array(roots, dtype=np.intp),
+            depth=int(depth),
+            classes=[np.asarray(c) for c in classes],
+        )
+
+    @classmethod
+    def concatenate(cls, forests: List["FlatForest"]) -> "FlatForest":
+        """Join several single-output forests into one set of node arrays."""
+        if any(forest.n_outputs != 1 for forest in forests):
+            raise ValueError("Only single-output forests can be concatenated")
+
+        max_classes = max(forest.value.shape[2] for forest in forests)
+        offsets = np.cumsum([0] + [forest.feature.shape[0] for forest in forests])
+
+        values = []
+        for forest in forests:
+            value = np.zeros((forest.value.shape[0], 1, max_classes), dtype=np.float64)
+            value[:, :, :forest.value.shape[2]] = forest.value
+            values.append(value)
+
+        return cls(
+            feature=np.concatenate([forest.feature for forest in forests]),
+            threshold=np.concatenate([forest.threshold for forest in forests]),
+            children=np.concatenate([forest.children + offset for forest, offset in zip(forests, offsets)]),
+            value=np.concatenate(values),
+            roots=np.concatenate([forest.roots + offset for forest, offset in zip(forests, offsets)]),
+            depth=max(forest.depth for forest in forests),
+            classes=[forests[0].classes[0]],
+        )
+
+    @property
+    def n_outputs(self) -> int:
+        return len(self.classes)
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Return the leaf index reached in every tree, shape (n_samples, n_trees)."""
+        # sklearn compares float32 inputs against float64 thresholds; do the same
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_samples, n_features = X.shape
+
+        leaves = np.empty((n_samples, self.roots.shape[0]), dtype=np.intp)
+        # Walk rows in small chunks so the node arrays being gathered stay in cache
+        for start in range(0, n_samples, APPLY_CHUNK_SIZE):
+            rows = X[start:start + APPLY_CHUNK_SIZE]
+            row_offsets = (np.arange(rows.shape[0], dtype=np.intp) * n_features)[:, np.newaxis]
+            values = rows.ravel()
+
+            nodes = np.tile(self.roots, (rows.shape[0], 1))
+            for _ in range(self.depth):
+                go_left = values.take(row_offsets + self.feature.take(nodes)) <= self.threshold.take(nodes)
+                nodes = self.children.take(2 * nodes + go_left)
+            leaves[start:start + APPLY_CHUNK_SIZE] = nodes
+
+        return leaves
+
+    def predict_proba_all(self, X: np.ndarray) -> List[np.ndarray]:
+        """Return averaged class probabilities for every output."""
+        leaf_values = self.value[self.apply(X)]  # (n_samples, n_trees, n_outputs, n_classes)
+
+        # Sum trees in order (cumsum is sequential) to match sklearn's accumulation bit for bit
+        total = np.cumsum(leaf_values, axis=1)[:, -1]
+        total /= self.roots.shape[0]
+
+        return [total[:, k, :len(self.classes[k])] for k in range(self.n_outputs)]
+
+    def predict_proba(self, X: np.ndarray):
+        """Return class probabilities, like RandomForestClassifier.predict_proba."""
+        proba = self.predict_proba_all(X)
+        return proba[0] if self.n_outputs == 1 else proba
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Return predicted classes, like RandomForestClassifier.predict."""
+        proba = self.predict_proba_all(X)
+        if self.n_outputs == 1:
+            return self.classes[0].take(np.argmax(proba[0], axis=1), axis=0)
+
+        predictions = np.empty((proba[0].shape[0], self.n_outputs), dtype=self.classes[0].dtype)
+        for k in range(self.n_outputs):
+            predictions[:, k] = self.classes[k].take(np.argmax(proba[k], axis=1), axis=0)
+        return predictions
+
+class FusedForest:
+    """Several single-output forests evaluated in one traversal.
+
+    Used for the "separate" model layout: the three nudge forests are joined
+    into one FlatForest so a request walks every tree once, then each model's
+    slice of trees is averaged on its own.
+    """
+
+    def __init__(self, forest: FlatForest, groups: List[Tuple[int, int]], classes: List[np.ndarray]):
+        self.forest = forest
+        self.groups = groups
+        self.classes = classes
+
+    @classmethod
+    def fuse(cls, forests: List[FlatForest]) -> "FusedForest":
+        """Join single-output forests; each keeps its own slice of trees."""
+        bounds = np.cumsum([0] + [forest.roots.shape[0] for forest in forests])
+        return cls(
+            FlatForest.concatenate(forests),
+            [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:])],
+            [forest.classes[0] for forest in forests]
+        )
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Return one predicted class per forest, shape (n_samples, n_forests)."""
+        leaf_values = self.forest.value[self.forest.apply(X)][:, :, 0, :]  # (n_samples, n_trees, n_classes)
+
+        predictions = np.empty((leaf_values.shape[0], len(self.groups)), dtype=self.classes[0].dtype)
+        for k, (start, end) in enumerate(self.groups):
+            total = np.cumsum(leaf_values[:, start:end], axis=1)[:, -1]
+            total /= end - start
+            predictions[:, k] = self.classes[k].take(np.argmax(total[:, :len(self.classes[k])], axis=1), axis=0)
+        return predictions
+
+class SklearnPredictor:
+    """Runs the pickled sklearn models through their own predict."""
+
+    def __init__(self, models: Dict[str, Any], layout: str):
+        self.models = models
+        self.layout = layout
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Return resume, project and event predictions, shape (n_samples, 3)."""
+        if self.layout == "multi_output":
+            return self.models["nudge_model"].predict(X)
+        return np.column_stack([self.models[name].predict(X) for name in MODEL_NAMES])
+
+class BatchSizeRouter:
+    """Sends small batches to one predictor and large batches to another.
+
+    The flat evaluator wins by a wide margin on single requests, while
+    sklearn's compiled per-tree loop is faster once a batch has a few
+    hundred rows; both return identical predictions.
+    """
+
+    def __init__(self, small, large, max_small_batch: int):
+        self.small = small
+        self.large = large
+        self.max_small_batch = max_small_batch
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Return resume, project and event predictions, shape (n_samples, 3)."""
+        if X.shape[0] <= self.max_small_batch:
+            return self.small.predict(X)
+        return self.large.predict(X)
+
+class LazyPredictor:
+    """Builds a predictor the first time it is used.
+
+    Lets a flat artifact serve requests straight away while the pickled
+    models (and scikit-learn) are only loaded if a large batch needs them.
+    """
+
+    def __init__(self, build):
+        self._build = build
+        self._predictor = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._predictor is not None
+
+    def load(self):
+        """Build the predictor now rather than on first use."""
+        if self._predictor is None:
+            with self._lock:
+                if self._predictor is None:
+                    self._predictor = self._build()
+        return self._predictor
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Return resume, project and event predictions, shape (n_samples, 3)."""
+        return self.load().predict(X)
+
+def load_lazy_predictors(predictor):
+    """Build every LazyPredictor in a predictor chain (lookup table, cache, batch-size router)."""
+    if isinstance(predictor, LazyPredictor):
+        predictor = predictor.load()
+    for name in ("fallback", "predictor", "small", "large"):
+        inner = getattr(predictor, name, None)
+        if inner is not None:
+            load_lazy_predictors(inner)
+
+def build_predictor(models: Dict[str, Any], engine: str, flat_max_batch: int = None):
+    """Build a predictor returning all three nudge predictions in one call.
+
+    With the flat engine, batches larger than flat_max_batch rows go to
+    sklearn's predict instead.
+    """
+    layout = models.get("layout", "separate")
+    if layout not in ("separate", "multi_output"):
+        raise ValueError(f"Unknown model layout: {layout}")
+
+    if engine == "sklearn":
+        return SklearnPredictor(models, layout)
+    if engine == "flat":
+        if layout == "multi_output":
+            flat = FlatForest.from_sklearn(models["nudge_model"])
+        else:
+            flat = FusedForest.fuse([FlatForest.from_sklearn(models[name]) for name in MODEL_NAMES])
+        if flat_max_batch is None:
+            return flat
+        return BatchSizeRouter(flat, SklearnPredictor(models, layout), flat_max_batch)
+    raise ValueError(f"Unknown inference engine: {engine}")
+
+
+# Node arrays stored as individual .npy files so they can be memory-mapped
+ARTIFACT_ARRAYS = ("feature", "threshold", "children", "value", "roots")
+
+def save_flat_artifact(predictor, directory: str, layout: str, model_fingerprint: str):
+    """Save a FlatForest or FusedForest as plain NumPy arrays plus a JSON manifest."""
+    forest = predictor.forest if isinstance(predictor, FusedForest) else predictor
+    os.makedirs(directory, exist_ok=True)
+
+    for name in ARTIFACT_ARRAYS:
+        array = getattr(forest, name)
+        if array.dtype == np.intp:
+            array = array.astype(np.int64)
+        np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(array))
+
+    manifest = {
+        "format_version": 1,
+        "layout": layout,
+        "kind": "fused" if isinstance(predictor, FusedForest) else "forest",
+        "depth": forest.depth,
+        "classes": [c.tolist() for c in predictor.classes],
+        "groups": predictor.groups if isinstance(predictor, FusedForest) else None,
+        "model_fingerprint": model_fingerprint
+    }
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+def load_flat_artifact(directory: str):
+    """Memory-map a saved flat artifact, returning (manifest, predictor).
+
+    Only NumPy is needed; scikit-learn is never imported.
+    """
+    with open(os.path.join(directory, "manifest.json"), "r") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != 1:
+        raise ValueError(f"Unsupported flat artifact version: {manifest.get('format_version')}")
+
+    arrays = {}
+    for name in ARTIFACT_ARRAYS:
+        array = np.asarray(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+        if array.dtype == np.int64 and np.dtype(np.intp) != np.int64:
+            array = array.astype(np.intp)
+        arrays[name] = array
+
+    classes = [np.array(c) for c in manifest["classes"]]
+    if manifest["kind"] == "fused":
+        forest = FlatForest(depth=manifest["depth"], classes=[classes[0]], **arrays)
+        return manifest, FusedForest(forest, [tuple(group) for group in manifest["groups"]], classes)
+    return manifest, FlatForest(depth=manifest["depth"], classes=classes, **arrays)
@@ -0,0 +1,125 @@
+import os
+import pickle
+import struct
+import asyncio
+import logging
+import threading
+import itertools
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Frames are a 4-byte big-endian length followed by a pickled message
+_HEADER = struct.Struct(">I")
+
+def write_frame(fd: int, message: Any):
+    """Write one message to a pipe in full."""
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    view = memoryview(_HEADER.pack(len(data)) + data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def read_frame(fd: int) -> Optional[Any]:
+    """Read one message written by write_frame, or None once the other end is closed."""
+    header = _read_exactly(fd, _HEADER.size)
+    if header is None:
+        return None
+    data = _read_exactly(fd, _HEADER.unpack(header)[0])
+    return None if data is None else pickle.loads(data)
+
+def _read_exactly(fd: int, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = os.read(fd, size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+class WorkerFanout:
+    """Applies writes to in-memory state in every prefork process, in one order.
+
+    Endpoints that change state (peer snapshots and events, nudge feed
+    inputs, model swaps, rule reloads, debug profiles) call a registered
+    operation through apply. In a single process the operation simply runs.
+    In a prefork worker it is sent to the parent instead, which relays it to
+    every worker, the sender included, and then applies it to its own copy,
+    so workers forked later start from the same state. Each process applies
+    the operations on one thread in the parent's order, and the sender
+    answers with the result of its own application.
+    """
+
+    def __init__(self):
+        self.operations: Dict[str, Callable] = {}
+        # pid of this worker once connected; a slot is reused by the replacement during a rolling restart
+        self.origin: Optional[int] = None
+        self._up_fd: Optional[int] = None
+        self._write_lock = threading.Lock()
+        self._pending: Dict[int, tuple] = {}
+        self._ids = itertools.count()
+
+    def operation(self, function: Callable) -> Callable:
+        """Register a write operation under its function name."""
+        self.operations[function.__name__] = function
+        return function
+
+    async def apply(self, name: str, *args):
+        """Run an operation here, or in every prefork process when connected to the parent."""
+        loop = asyncio.get_running_loop()
+        if self._up_fd is None:
+            return await loop.run_in_executor(None, self.operations[name], *args)
+
+        future = loop.create_future()
+        message_id = next(self._ids)
+        self._pending[message_id] = (loop, future)
+        try:
+            # Off the event loop, as the pipe may be full while the parent relays
+            await loop.run_in_executor(None, self._send, (self.origin, message_id, name, args))
+        except OSError:
+            self._pending.pop(message_id, None)
+            raise
+        return await future
+
+    def _send(self, message):
+        with self._write_lock:
+            write_frame(self._up_fd, message)
+
+    def run(self, message) -> Any:
+        """Apply a relayed (origin, id, name, args) message; errors are raised only for the sender."""
+        origin, message_id, name, args = message
+        try:
+            result, error = self.operations[name](*args), None
+        except Exception as e:
+            result, error = None, e
+            if origin != self.origin:
+                logger.debug("Relayed %s failed: %s", name, e)
+        if origin == self.origin and origin is not None:
+            loop, future = self._pending.pop(message_id, (None, None))
+            if future is not None:
+                loop.call_soon_threadsafe(_settle, future, result, error)
+        return result
+
+    def connect(self, up_fd: int, down_fd: int) -> threading.Thread:
+        """Send writes to the parent through up_fd and apply the ones it relays on down_fd (in a worker)."""
+        self.origin = os.getpid()
+        self._up_fd = up_fd
+
+        def listen():
+            while True:
+                message = read_frame(down_fd)
+                if message is None:
+                    return
+                self.run(message)
+
+        listener = threading.Thread(target=listen, name="worker-fanout", daemon=True)
+        listener.start()
+        return listener
+
+def _settle(future: asyncio.Future, result, error: Optional[Exception]):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
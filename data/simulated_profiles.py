@@ -1,7 +1,12 @@
+import os
+import sys
 import json
+import time
 import random
+import argparse
 import datetime
-from typing import List, Dict, Any
+import numpy as np
+from typing import List, Dict, Any, Iterator
 
 def generate_user_profile(user_id: str) -> Dict[str, Any]:
     """Generate a simulated user profile."""
@@ -158,7 +163,171 @@ def generate_test_profiles(num_profiles: int = 10, num_peer_sets: int = 3) -> Li
     
     return test_profiles
 
-if __name__ == "__main__":
+# Vectorized generation. Every field is drawn with NumPy from a seeded
+# Generator using the same ranges and labelling rules as the functions above,
+# so datasets of tens of millions of rows can be built chunk by chunk.
+
+GOAL_TAGS = ["GRE", "data science", "web development", "machine learning", "cloud computing", "DevOps"]
+QUIZZES = ["aptitude", "python", "java", "javascript", "data structures", "algorithms"]
+CLUBS = ["coding club", "data science club", "AI club", "cloud computing club"]
+EVENTS = ["startup-meetup", "coding-contest", "hackathon", "career-fair", "workshop"]
+
+FEATURE_NAMES = ["resume_uploaded", "karma", "projects_added",
+                 "batch_avg_projects", "batch_resume_uploaded_pct", "event_fomo_score"]
+LABEL_NAMES = ["should_nudge_resume", "should_nudge_project", "should_nudge_event"]
+
+def label_columns(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Apply the labelling rules of generate_training_data to feature columns."""
+    return {
+        "should_nudge_resume": (~columns["resume_uploaded"] & (columns["batch_resume_uploaded_pct"] >= 80)).astype(np.int8),
+        "should_nudge_project": ((columns["projects_added"] == 0) & (columns["batch_avg_projects"] >= 2)).astype(np.int8),
+        "should_nudge_event": (columns["event_fomo_score"] >= 2).astype(np.int8),
+    }
+
+def generate_training_columns(num_samples: int, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """Draw num_samples labelled training rows as feature and label columns."""
+    columns = {
+        "resume_uploaded": rng.random(num_samples) < 0.5,
+        "karma": rng.integers(50, 501, num_samples, dtype=np.int32),
+        "projects_added": rng.integers(0, 6, num_samples, dtype=np.int32),
+        "batch_avg_projects": rng.integers(1, 6, num_samples, dtype=np.int32),
+        "batch_resume_uploaded_pct": rng.integers(50, 96, num_samples, dtype=np.int32),
+    }
+
+    # Buddies attend events 70% of the time: min(1-3 buddies' events, 2-5 batch events)
+    events_in_batch = rng.integers(2, 6, num_samples, dtype=np.int32)
+    buddy_events = np.minimum(rng.integers(1, 4, num_samples, dtype=np.int32), events_in_batch)
+    columns["event_fomo_score"] = np.where(rng.random(num_samples) > 0.3, buddy_events, 0).astype(np.int32)
+
+    columns.update(label_columns(columns))
+    return columns
+
+def write_training_chunks(output_dir: str, num_samples: int, chunk_rows: int = 1_000_000, seed: int = 42) -> List[str]:
+    """Write labelled training rows as columnar .npz chunks plus a manifest.json.
+
+    Each chunk is drawn from its own child of SeedSequence(seed), so the
+    dataset is reproducible for a given seed and chunk size and only one
+    chunk is ever held in memory.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    num_chunks = -(-num_samples // chunk_rows)
+    paths = []
+    for index, child in enumerate(np.random.SeedSequence(seed).spawn(num_chunks)):
+        rows = min(chunk_rows, num_samples - index * chunk_rows)
+        path = os.path.join(output_dir, f"part-{index:05d}.npz")
+        np.savez(path, **generate_training_columns(rows, np.random.default_rng(child)))
+        paths.append(path)
+
+    manifest = {
+        "rows": num_samples,
+        "chunk_rows": chunk_rows,
+        "seed": seed,
+        "features": FEATURE_NAMES,
+        "labels": LABEL_NAMES,
+        "chunks": [os.path.basename(path) for path in paths]
+    }
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return paths
+
+def _sample_rows(rng: np.random.Generator, choices: List[str], low: int, high: int, num_rows: int) -> List[List[str]]:
+    """Draw, for each row, between low and high distinct items from choices."""
+    order = np.argsort(rng.random((num_rows, len(choices))), axis=1)
+    counts = rng.integers(low, high + 1, num_rows)
+    return [[choices[i] for i in row[:count]] for row, count in zip(order.tolist(), counts.tolist())]
+
+def generate_peer_snapshots(num_snapshots: int, rng: np.random.Generator) -> List[Dict[str, Any]]:
+    """Draw peer snapshots with the same distributions as generate_peer_snapshot."""
+    avg_projects = rng.integers(1, 6, num_snapshots).tolist()
+    resume_pct = rng.integers(50, 96, num_snapshots).tolist()
+    events = _sample_rows(rng, EVENTS, 2, 5, num_snapshots)
+    attendance = rng.integers(3, 21, (num_snapshots, len(EVENTS))).tolist()
+    has_buddies = (rng.random(num_snapshots) > 0.3).tolist()
+    buddy_counts = rng.integers(1, 4, num_snapshots).tolist()
+
+    snapshots = []
+    for i in range(num_snapshots):
+        buddies = events[i][:min(buddy_counts[i], len(events[i]))] if has_buddies[i] else []
+        snapshots.append({
+            "batch_avg_projects": avg_projects[i],
+            "batch_resume_uploaded_pct": resume_pct[i],
+            "batch_event_attendance": dict(zip(events[i], attendance[i])),
+            "buddies_attending_events": buddies
+        })
+    return snapshots
+
+def generate_request_rows(num_requests: int, rng: np.random.Generator, peer_snapshots: List[Dict[str, Any]],
+                          start_id: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield complete EngagementAnalysisRequest documents, each sharing one of peer_snapshots."""
+    resume = (rng.random(num_requests) < 0.5).tolist()
+    karma = rng.integers(50, 501, num_requests).tolist()
+    projects = rng.integers(0, 6, num_requests).tolist()
+    buddy_count = rng.integers(0, 11, num_requests).tolist()
+    goal_tags = _sample_rows(rng, GOAL_TAGS, 1, 3, num_requests)
+    quizzes = _sample_rows(rng, QUIZZES, 0, 4, num_requests)
+    clubs = _sample_rows(rng, CLUBS, 0, 3, num_requests)
+    login_streak = rng.integers(0, 8, num_requests).tolist()
+    posts = rng.integers(0, 11, num_requests).tolist()
+    interacted = rng.integers(0, 6, num_requests).tolist()
+    days_back = rng.integers(0, 31, num_requests)
+    last_event = (np.datetime64(datetime.date.today()) - days_back).astype(str).tolist()
+    snapshot_ids = rng.integers(0, len(peer_snapshots), num_requests).tolist()
+
+    for i in range(num_requests):
+        yield {
+            "user_id": f"stu_{start_id + i}",
+            "profile": {
+                "resume_uploaded": resume[i],
+                "goal_tags": goal_tags[i],
+                "karma": karma[i],
+                "projects_added": projects[i],
+                "quiz_history": quizzes[i],
+                "clubs_joined": clubs[i],
+                "buddy_count": buddy_count[i]
+            },
+            "activity": {
+                "login_streak": login_streak[i],
+                "posts_created": posts[i],
+                "buddies_interacted": interacted[i],
+                "last_event_attended": last_event[i]
+            },
+            "peer_snapshot": peer_snapshots[snapshot_ids[i]]
+        }
+
+def write_request_ndjson(path: str, num_requests: int, peer_sets: int = 100, chunk_rows: int = 100_000, seed: int = 42):
+    """Write num_requests load-testing requests as NDJSON, chunk by chunk."""
+    seeds = np.random.SeedSequence(seed).spawn(1 + -(-num_requests // chunk_rows))
+    peer_snapshots = generate_peer_snapshots(peer_sets, np.random.default_rng(seeds[0]))
+    with open(path, "w") as f:
+        for index, child in enumerate(seeds[1:]):
+            start = index * chunk_rows
+            rows = generate_request_rows(min(chunk_rows, num_requests - start), np.random.default_rng(child), peer_snapshots, start)
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+
+def main(argv: List[str] = None):
+    """Generate the sample JSON files, or large columnar datasets when --rows or --requests is given."""
+    parser = argparse.ArgumentParser(description="Generate simulated profiles and training data.")
+    parser.add_argument("--rows", type=int, default=0, help="Labelled training rows to write as .npz chunks")
+    parser.add_argument("--output-dir", default="data/training_chunks", help="Directory for the training chunks")
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000, help="Rows per chunk")
+    parser.add_argument("--requests", type=int, default=0, help="Load-testing requests to write as NDJSON")
+    parser.add_argument("--requests-output", default="data/requests.ndjson", help="NDJSON file for the requests")
+    parser.add_argument("--peer-sets", type=int, default=100, help="Distinct peer snapshots shared by the requests")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args(argv)
+
+    if args.rows:
+        start = time.perf_counter()
+        paths = write_training_chunks(args.output_dir, args.rows, args.chunk_rows, args.seed)
+        print(f"Generated {args.rows} training rows in {len(paths)} chunks under {args.output_dir} "
+              f"in {time.perf_counter() - start:.1f}s")
+    if args.requests:
+        start = time.perf_counter()
+        write_request_ndjson(args.requests_output, args.requests, args.peer_sets, seed=args.seed)
+        print(f"Generated {args.requests} requests in {args.requests_output} in {time.perf_counter() - start:.1f}s")
+    if args.rows or args.requests:
+        return
+
     # Generate training data
     training_data = generate_training_data(500)
     with open("data/training_data.json", "w") as f:
@@ -170,4 +339,7 @@ if __name__ == "__main__":
         json.dump(test_profiles, f, indent=2)
     
     print(f"Generated {len(training_data)} training samples")
-    print(f"Generated {len(test_profiles)} test profiles")
\ No newline at end of file
+    print(f"Generated {len(test_profiles)} test profiles")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
\ No newline at end of file
@@ -1,10 +1,24 @@
+import os
+import sys
 import json
+import time
+import argparse
+import itertools
+import copy
 import pickle
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
+from contextlib import contextmanager
+
+# Allow importing the service package when run as models/model_training.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.tree_inference import FEATURE_NAMES
+
+LABEL_NAMES = ["should_nudge_resume", "should_nudge_project", "should_nudge_event"]
 
 def load_training_data(file_path="data/training_data.json"):
     """Load training data from JSON file."""
@@ -12,86 +26,353 @@ def load_training_data(file_path="data/training_data.json"):
         data = json.load(f)
     return data
 
+def iter_training_samples(file_path):
+    """Yield training samples from a JSON array file, or one line at a time from an NDJSON file."""
+    if file_path.endswith(".json"):
+        yield from load_training_data(file_path)
+        return
+    with open(file_path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def samples_to_matrix(samples, chunk_rows=65536):
+    """Build the feature matrix and label matrix from an iterable of training samples.
+
+    Samples are consumed chunk_rows at a time, so a stream is never held as
+    Python objects in full. Returns X (int32, one column per FEATURE_NAMES
+    entry) and Y (int8, one column per LABEL_NAMES entry).
+    """
+    rows = (
+        (1 if sample["features"]["resume_uploaded"] else 0,
+         *(sample["features"][name] for name in FEATURE_NAMES[1:]),
+         *(sample["label"][name] for name in LABEL_NAMES))
+        for sample in samples
+    )
+    data = rows_to_matrix(rows, len(FEATURE_NAMES) + len(LABEL_NAMES), chunk_rows)
+    return np.ascontiguousarray(data[:, :len(FEATURE_NAMES)]), data[:, len(FEATURE_NAMES):].astype(np.int8)
+
+def rows_to_matrix(rows, width, chunk_rows=65536):
+    """Collect an iterable of integer rows into an int32 matrix, chunk_rows at a time."""
+    chunks = []
+    while True:
+        chunk = np.array(list(itertools.islice(rows, chunk_rows)), dtype=np.int32).reshape(-1, width)
+        if not len(chunk):
+            break
+        chunks.append(chunk)
+    return np.concatenate(chunks) if chunks else np.empty((0, width), dtype=np.int32)
+
+def load_training_chunks(directory):
+    """Read the columnar .npz chunks written by data/simulated_profiles.py --rows into X and Y.
+
+    The matrices are allocated once from the manifest's row count and filled
+    chunk by chunk, so peak memory is the result plus one chunk.
+    """
+    with open(os.path.join(directory, "manifest.json"), "r") as f:
+        manifest = json.load(f)
+
+    X = np.empty((manifest["rows"], len(FEATURE_NAMES)), dtype=np.int32)
+    Y = np.empty((manifest["rows"], len(LABEL_NAMES)), dtype=np.int8)
+    start = 0
+    for name in manifest["chunks"]:
+        with np.load(os.path.join(directory, name)) as chunk:
+            end = start + len(chunk[FEATURE_NAMES[0]])
+            for j, feature in enumerate(FEATURE_NAMES):
+                X[start:end, j] = chunk[feature]
+            for j, label in enumerate(LABEL_NAMES):
+                Y[start:end, j] = chunk[label]
+        start = end
+    return X, Y
+
+def load_feature_matrix(path="data/training_data.json"):
+    """Load X and Y from a chunk directory, an NDJSON file of samples or a JSON array file."""
+    if os.path.isdir(path):
+        return load_training_chunks(path)
+    return samples_to_matrix(iter_training_samples(path))
+
 def prepare_features_and_labels(data):
     """Extract features and labels from training data."""
-    features = []
-    resume_labels = []
-    project_labels = []
-    event_labels = []
-    
-    for sample in data:
-        # Extract features
-        feature_dict = sample["features"]
-        feature_vector = [
-            1 if feature_dict["resume_uploaded"] else 0,
-            feature_dict["karma"],
-            feature_dict["projects_added"],
-            feature_dict["batch_avg_projects"],
-            feature_dict["batch_resume_uploaded_pct"],
-            feature_dict["event_fomo_score"]
-        ]
-        features.append(feature_vector)
-        
-        # Extract labels
-        label_dict = sample["label"]
-        resume_labels.append(label_dict["should_nudge_resume"])
-        project_labels.append(label_dict["should_nudge_project"])
-        event_labels.append(label_dict["should_nudge_event"])
-    
-    return np.array(features), np.array(resume_labels), np.array(project_labels), np.array(event_labels)
+    X, Y = samples_to_matrix(data)
+    return X, Y[:, 0], Y[:, 1], Y[:, 2]
 
-def train_models():
-    """Train and save nudge prediction models."""
-    # Load training data
-    data = load_training_data()
-    
-    # Prepare features and labels
-    X, y_resume, y_project, y_event = prepare_features_and_labels(data)
-    
-    # Split data into training and testing sets
-    X_train, X_test, y_resume_train, y_resume_test = train_test_split(X, y_resume, test_size=0.2, random_state=42)
-    _, _, y_project_train, y_project_test = train_test_split(X, y_project, test_size=0.2, random_state=42)
-    _, _, y_event_train, y_event_test = train_test_split(X, y_event, test_size=0.2, random_state=42)
-    
-    # Train resume nudge model
-    resume_model = RandomForestClassifier(n_estimators=100, random_state=42)
-    resume_model.fit(X_train, y_resume_train)
-    
-    # Train project nudge model
-    project_model = RandomForestClassifier(n_estimators=100, random_state=42)
-    project_model.fit(X_train, y_project_train)
+def reset_peak_memory():
+    """Reset the process's peak resident set size so the next phase is measured on its own (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def peak_memory_bytes():
+    """Peak resident set size since the last reset, or since the process started where it cannot be reset."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class PhaseTimer:
+    """Record wall time and peak memory for each phase of a training run."""
+
+    def __init__(self):
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        reset_peak_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start, peak_memory_bytes()))
+
+    def report(self):
+        """Print one line per phase."""
+        print(f"{'Phase':<12} {'Wall (s)':>10} {'Peak RSS (MB)':>14}")
+        for name, seconds, peak in self.phases:
+            print(f"{name:<12} {seconds:>10.2f} {peak / 2**20:>14.1f}")
+
+def new_forest(n_jobs):
+    return RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=n_jobs)
+
+def train_models(layout="separate", output_path="models/nudge_models.pkl", input_path="data/training_data.json", n_jobs=-1,
+                 registry_path=None):
+    """Train and save nudge prediction models.
+
+    layout="separate" trains one forest per label; layout="multi_output"
+    trains a single multi-output forest so all three labels come from one
+    traversal per tree. The layout is recorded in the saved pickle.
+
+    input_path may be a JSON array file, an NDJSON file of samples or a
+    directory of columnar chunks. Trees are fitted on n_jobs cores (-1 for
+    all); the forests are seeded, so the result does not depend on n_jobs.
+    With registry_path the models are also published as a new version there.
+    Returns the (phase, seconds, peak bytes) timings that are also printed.
+    """
+    if layout not in ("separate", "multi_output"):
+        raise ValueError(f"Unknown model layout: {layout}")
+    timer = PhaseTimer()
+
+    # Load the feature and label matrices
+    with timer.phase("load"):
+        X, Y = load_feature_matrix(input_path)
     
-    # Train event nudge model
-    event_model = RandomForestClassifier(n_estimators=100, random_state=42)
-    event_model.fit(X_train, y_event_train)
+    # Split data into training and testing sets once for all labels
+    with timer.phase("split"):
+        X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=0.2, random_state=42)
+        del X, Y
     
-    # Evaluate models
-    print("Resume Nudge Model Performance:")
-    y_resume_pred = resume_model.predict(X_test)
-    print(classification_report(y_resume_test, y_resume_pred))
+    with timer.phase("fit"):
+        if layout == "multi_output":
+            # Train one forest on all three labels
+            fitted = {"nudge_model": new_forest(n_jobs).fit(X_train, Y_train)}
+        else:
+            # Train one forest per label
+            fitted = {
+                name: new_forest(n_jobs).fit(X_train, Y_train[:, k])
+                for k, name in enumerate(["resume_model", "project_model", "event_model"])
+            }
     
-    print("Project Nudge Model Performance:")
-    y_project_pred = project_model.predict(X_test)
-    print(classification_report(y_project_test, y_project_pred))
+    with timer.phase("evaluate"):
+        if layout == "multi_output":
+            Y_pred = fitted["nudge_model"].predict(X_test)
+        else:
+            Y_pred = np.column_stack([model.predict(X_test) for model in fitted.values()])
+        for k, title in enumerate(["Resume", "Project", "Event"]):
+            print(f"{title} Nudge Model Performance:")
+            print(classification_report(Y_test[:, k], Y_pred[:, k]))
     
-    print("Event Nudge Model Performance:")
-    y_event_pred = event_model.predict(X_test)
-    print(classification_report(y_event_test, y_event_pred))
+    # Serve predictions single-threaded; n_jobs only speeds up fitting
+    for model in fitted.values():
+        model.set_params(n_jobs=None)
+    models = {"layout": layout, **fitted, "feature_names": FEATURE_NAMES}
+    if layout == "multi_output":
+        models["label_names"] = LABEL_NAMES
     
     # Save models
-    models = {
-        "resume_model": resume_model,
-        "project_model": project_model,
-        "event_model": event_model,
-        "feature_names": ["resume_uploaded", "karma", "projects_added", 
-                         "batch_avg_projects", "batch_resume_uploaded_pct", "event_fomo_score"]
-    }
-    
-    with open("models/nudge_models.pkl", "wb") as f:
-        pickle.dump(models, f)
+    with timer.phase("save"):
+        with open(output_path, "wb") as f:
+            pickle.dump(models, f)
     
-    print("Models trained and saved to models/nudge_models.pkl")
+    print(f"Models trained on {len(X_train)} samples and saved to {output_path}")
+    if registry_path:
+        from app.model_registry import ModelRegistry, lookup_domain
+        with timer.phase("publish"):
+            version = ModelRegistry(registry_path).publish(models, {"source": "full", "training_rows": len(X_train)},
+                                                           lookup_domain())
+        print(f"Published as {version} in {registry_path}")
+    timer.report()
+    return timer.phases
+
+def load_feedback(feedback_path, since=None):
+    """Read a feedback NDJSON file into features X, the index of each record's model and acted_on labels."""
+    from app.feedback import FEEDBACK_MODELS, read_feedback
+
+    rows = (
+        (*(int(record["features"][name]) for name in FEATURE_NAMES),
+         FEEDBACK_MODELS.index(record["model"]),
+         1 if record["acted_on"] else 0)
+        for record in read_feedback(feedback_path, since)
+    )
+    data = rows_to_matrix(rows, len(FEATURE_NAMES) + 2)
+    return np.ascontiguousarray(data[:, :len(FEATURE_NAMES)]), data[:, -2], data[:, -1].astype(np.int8)
+
+def windowed_forest(base, X, y, new_trees, max_trees, seed, n_jobs=-1):
+    """Fit new_trees trees on (X, y) and add them to a copy of base, keeping only the newest max_trees.
+
+    Returns None when the new data does not cover the base forest's classes.
+    """
+    update = RandomForestClassifier(n_estimators=new_trees, random_state=seed, n_jobs=n_jobs).fit(X, y)
+    base_classes = base.classes_ if isinstance(base.classes_, list) else [base.classes_]
+    new_classes = update.classes_ if isinstance(update.classes_, list) else [update.classes_]
+    if len(base_classes) != len(new_classes) or not all(np.array_equal(a, b) for a, b in zip(base_classes, new_classes)):
+        return None
+
+    forest = copy.copy(base)
+    forest.estimators_ = (list(base.estimators_) + update.estimators_)[-max_trees:]
+    forest.n_estimators = len(forest.estimators_)
+    forest.n_jobs = None
+    return forest
+
+def update_models(feedback_path, registry_path="models/registry", base_path=None, new_trees=20, max_trees=None,
+                  since=None, min_feedback=20, n_jobs=-1):
+    """Update the current models from nudge feedback and publish them as a new registry version.
+
+    Rather than refitting on the whole history, new_trees trees are fitted on
+    the feedback (acted_on is the label) and appended to each forest, and the
+    oldest trees are dropped so a forest never exceeds max_trees (by default
+    its current size): a sliding window over recent behaviour. The base is the
+    registry's latest version, or base_path / models/nudge_models.pkl. For
+    the multi_output layout the labels of the other two outputs are the base
+    forest's own predictions. A model with fewer than min_feedback records,
+    or whose feedback has a single outcome, is left unchanged. Returns the
+    new version, or None when no model changed.
+    """
+    from app.model_registry import ModelRegistry, lookup_domain
+    from app.tree_inference import MODEL_NAMES
+
+    registry = ModelRegistry(registry_path)
+    timer = PhaseTimer()
+
+    with timer.phase("load"):
+        parent = registry.latest() if base_path is None else None
+        if base_path is None:
+            base_path = registry.model_path(parent) if parent else "models/nudge_models.pkl"
+        with open(base_path, "rb") as f:
+            models = pickle.load(f)
+        layout = models.get("layout", "separate")
+        X, model_index, acted_on = load_feedback(feedback_path, since)
+
+    # Seed each update differently so successive windows do not repeat trees
+    seed = 42 + len(registry.versions())
+    updated, trees_added = {}, {}
+    with timer.phase("fit"):
+        if layout == "multi_output":
+            # Feedback labels one output per record; the others keep the base forest's predictions
+            base = models["nudge_model"]
+            if len(X) >= min_feedback:
+                Y = base.predict(X).astype(np.int8)
+                Y[np.arange(len(X)), model_index] = acted_on
+                forest = windowed_forest(base, X, Y, new_trees, max_trees or base.n_estimators, seed, n_jobs)
+                if forest is not None:
+                    updated["nudge_model"] = forest
+                    trees_added["nudge_model"] = new_trees
+        else:
+            for k, name in enumerate(MODEL_NAMES):
+                rows = model_index == k
+                if rows.sum() < min_feedback or len(np.unique(acted_on[rows])) < 2:
+                    continue
+                base = models[name]
+                forest = windowed_forest(base, X[rows], acted_on[rows], new_trees, max_trees or base.n_estimators, seed, n_jobs)
+                if forest is not None:
+                    updated[name] = forest
+                    trees_added[name] = new_trees
+
+    print(f"Read {len(X)} feedback records from {feedback_path}; updated {', '.join(updated) or 'no models'}")
+
+    # How often each model agrees with the recorded outcomes, before and after the update
+    with timer.phase("evaluate"):
+        for name, forest in updated.items():
+            rows = slice(None) if layout == "multi_output" else model_index == MODEL_NAMES.index(name)
+            accuracy = []
+            for model in (models[name], forest):
+                predicted = model.predict(X[rows])
+                if predicted.ndim == 2:
+                    predicted = predicted[np.arange(len(predicted)), model_index]
+                accuracy.append((predicted == acted_on[rows]).mean())
+            print(f"{name}: feedback accuracy {accuracy[0]:.1%} -> {accuracy[1]:.1%}")
+    if not updated:
+        timer.report()
+        return None
+
+    with timer.phase("publish"):
+        version = registry.publish({**models, "layout": layout, **updated}, {
+            "source": "incremental",
+            "parent": parent or base_path,
+            "feedback_rows": len(X),
+            "feedback_since": since,
+            "trees_added": trees_added,
+            "trees": {name: forest.n_estimators for name, forest in updated.items()}
+        }, lookup_domain())
+    print(f"Published {version} in {registry_path}")
+    timer.report()
+    return version
+
+def export_flat_artifact(model_path="models/nudge_models.pkl", output_dir="models/nudge_flat"):
+    """Export the pickled forests as memory-mappable NumPy arrays.
+
+    The service loads this directory instead of the pickle when
+    inference.flat_artifact points at it, so it starts without importing
+    scikit-learn.
+    """
+    from app.tree_inference import MODEL_NAMES, FlatForest, FusedForest, save_flat_artifact
+    from app.lookup_table import model_fingerprint
+
+    with open(model_path, "rb") as f:
+        model_bytes = f.read()
+    models = pickle.loads(model_bytes)
+    layout = models.get("layout", "separate")
+
+    if layout == "multi_output":
+        flat = FlatForest.from_sklearn(models["nudge_model"])
+    else:
+        flat = FusedForest.fuse([FlatForest.from_sklearn(models[name]) for name in MODEL_NAMES])
+    save_flat_artifact(flat, output_dir, layout, model_fingerprint(model_bytes))
+
+    print(f"Flat model artifact exported to {output_dir}")
 
 if __name__ == "__main__":
-    train_models()
-    
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the nudge prediction models.")
+    parser.add_argument("--layout", choices=["separate", "multi_output"], default="separate",
+                        help="Train three separate forests or one multi-output forest")
+    parser.add_argument("--input", default="data/training_data.json",
+                        help="Training samples: a JSON array file, an NDJSON file or a directory of .npz chunks")
+    parser.add_argument("--output", default="models/nudge_models.pkl", help="Where to save the model pickle")
+    parser.add_argument("--jobs", type=int, default=-1, help="Cores used to fit the forests (-1 for all)")
+    parser.add_argument("--export-flat", metavar="DIR", default=None,
+                        help="Also export the models as a flat NumPy artifact to DIR")
+    parser.add_argument("--no-train", action="store_true", help="Skip training and only export the existing pickle")
+    parser.add_argument("--registry", default=None,
+                        help="Model registry directory to publish to (models/registry for --incremental)")
+    parser.add_argument("--incremental", metavar="FEEDBACK", default=None,
+                        help="Update the latest models from a feedback NDJSON file instead of training from scratch")
+    parser.add_argument("--base", default=None, help="Model pickle to update (default: the registry's latest version)")
+    parser.add_argument("--new-trees", type=int, default=20, help="Trees fitted on the feedback per model")
+    parser.add_argument("--max-trees", type=int, default=None, help="Trees kept per forest (default: the base size)")
+    parser.add_argument("--since", default=None, help="Only use feedback recorded at or after this UTC ISO time")
+    parser.add_argument("--min-feedback", type=int, default=20, help="Feedback records needed to update a model")
+    args = parser.parse_args()
+    if args.incremental:
+        update_models(args.incremental, registry_path=args.registry or "models/registry", base_path=args.base,
+                      new_trees=args.new_trees, max_trees=args.max_trees, since=args.since,
+                      min_feedback=args.min_feedback, n_jobs=args.jobs)
+    elif not args.no_train:
+        train_models(layout=args.layout, output_path=args.output, input_path=args.input, n_jobs=args.jobs,
+                     registry_path=args.registry)
+    if args.export_flat:
+        export_flat_artifact(model_path=args.output, output_dir=args.export_flat)
@@ -0,0 +1,47 @@
+import json
+import asyncio
+import app.main as app_main
+from app.benchmark import compare, generate_workload, main
+from app.codec import decode_request
+
+def test_workload_is_reproducible_and_skewed():
+    """Test that a seed fixes the workload and skew concentrates it on popular users."""
+    first = generate_workload(500, 100, 1.5, 4, seed=7)
+    assert first == generate_workload(500, 100, 1.5, 4, seed=7)
+
+    uniform = generate_workload(500, 100, 0.0, 4, seed=7)
+    assert len({profile["user_id"] for profile in first}) < len({profile["user_id"] for profile in uniform})
+    print("Workload test passed!")
+
+def test_compare_flags_regressions_beyond_threshold():
+    """Test that throughput drops and latency rises beyond the threshold are reported."""
+    baseline = {"engine_single": {"ops_per_sec": 1000.0, "p50_us": 100.0, "p99_us": 200.0}}
+    within = {"engine_single": {"ops_per_sec": 950.0, "p50_us": 105.0, "p99_us": 150.0}}
+    assert compare(within, baseline, 0.10) == []
+
+    worse = {"engine_single": {"ops_per_sec": 800.0, "p50_us": 130.0, "p99_us": 150.0}}
+    regressions = compare(worse, baseline, 0.10)
+    assert [regression.split(":")[0] for regression in regressions] == ["engine_single.ops_per_sec", "engine_single.p50_us"]
+    print("Baseline comparison test passed!")
+
+def test_benchmark_writes_results_and_fails_on_regression(tmp_path):
+    """Test a small end-to-end run, including the in-process HTTP benchmark."""
+    output = tmp_path / "results.json"
+    args = ["--requests", "60", "--unique", "20", "--batch-size", "20", "--http-requests", "20", "--repeat", "1"]
+    assert main(args + ["-o", str(output)]) == 0
+
+    results = json.loads(output.read_text())["results"]
+    assert set(results) == {"engine_single", "engine_batch", "http_single"}
+    assert results["engine_single"]["ops_per_sec"] > 0
+    assert results["engine_single"]["alloc_peak_bytes_per_op"] > 0
+
+    # The HTTP benchmark scores on its own pool, leaving the app's running
+    with open("data/test_profiles.json", "r") as f:
+        request = decode_request(json.dumps(json.load(f)[0]))
+    assert asyncio.run(app_main.scoring_executor.run("score", request)) == app_main.nudge_engine.score(request)
+
+    # A baseline far faster than anything achievable must fail the run
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({"results": {"engine_single": {"ops_per_sec": 1e12}}}))
+    assert main(args + ["--skip-http", "-o", str(output), "--baseline", str(baseline)]) == 1
+    print("Benchmark run test passed!")
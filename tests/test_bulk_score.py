@@ -0,0 +1,49 @@
+import json
+from app.bulk_score import main
+
+def test_bulk_score_keeps_order_and_reports_malformed_lines(tmp_path):
+    """Test that bulk scoring writes one output line per input record, in order."""
+    with open("data/test_profiles.json", "r") as f:
+        test_profiles = json.load(f)
+
+    input_path = tmp_path / "requests.jsonl"
+    output_path = tmp_path / "responses.jsonl"
+    with open(input_path, "w") as f:
+        for test_profile in test_profiles[:5]:
+            f.write(json.dumps(test_profile) + "\n")
+        f.write("{not json\n")
+        for test_profile in test_profiles[5:]:
+            f.write(json.dumps(test_profile) + "\n")
+
+    main([str(input_path), "-o", str(output_path), "--workers", "2", "--chunk-size", "4"])
+
+    with open(output_path, "r") as f:
+        results = [json.loads(line) for line in f]
+
+    assert len(results) == len(test_profiles) + 1
+    assert results[5] == {"line": 6, "status": "error", "error": results[5]["error"]}
+
+    scored = results[:5] + results[6:]
+    assert [result["user_id"] for result in scored] == [test_profile["user_id"] for test_profile in test_profiles]
+    assert all(result["status"] == "generated" for result in scored)
+    print("Bulk scoring test passed!")
+
+def test_bulk_score_ignores_the_daily_cap(tmp_path):
+    """Test that offline scoring neither withholds nudges nor spends a user's daily allowance."""
+    with open("config.json", "r") as f:
+        config = json.load(f)
+    config["nudge_cap"] = {"enabled": True, "capacity": 1000, "shards": 4}
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(config))
+    with open("data/test_profiles.json", "r") as f:
+        test_profile = json.load(f)[0]
+
+    input_path = tmp_path / "requests.jsonl"
+    output_path = tmp_path / "responses.jsonl"
+    input_path.write_text((json.dumps(test_profile) + "\n") * 3)
+    main([str(input_path), "-o", str(output_path), "--workers", "1", "--config", str(config_path)])
+
+    with open(output_path, "r") as f:
+        results = [json.loads(line) for line in f]
+    assert results[0]["nudges"] and results[0] == results[1] == results[2]
+    print("Bulk scoring cap test passed!")
@@ -1,6 +1,7 @@
 import json
 import requests
 import copy
+from app.columnar import CONTENT_TYPE as COLUMNAR_CONTENT_TYPE, encode_requests
 
 def test_health_endpoint():
     """Test the health endpoint."""
@@ -16,6 +17,15 @@ def test_version_endpoint():
     assert response.json() == {"version": "1.0.0"}
     print("Version endpoint test passed!")
 
+def test_ready_endpoint():
+    """Test that the readiness endpoint reports startup timings."""
+    response = requests.get("http://localhost:8000/ready")
+    assert response.status_code == 200
+    result = response.json()
+    assert result["status"] == "ready"
+    assert result["ready_ms"] >= result["imports_ms"] + result["engine_load_ms"]
+    print("Ready endpoint test passed!")
+
 def test_analyze_engagement_endpoint():
     """Test the analyze-engagement endpoint with various scenarios."""
     # Load test profiles
@@ -148,6 +158,226 @@ def test_analyze_engagement_endpoint():
         
         print(f"Test scenario {i+1} passed!")
 
+def test_analyze_engagement_batch_endpoint():
+    """Test that the batch endpoint matches the single-request endpoint per user."""
+    # Load test profiles
+    with open("data/test_profiles.json", "r") as f:
+        test_profiles = json.load(f)
+    
+    # Send the whole set as one batch
+    response = requests.post("http://localhost:8000/analyze-engagement/batch", json={"requests": test_profiles})
+    assert response.status_code == 200, f"Failed with status code {response.status_code}"
+    
+    results = response.json()["results"]
+    assert len(results) == len(test_profiles)
+    
+    # Every per-user result must match the single-request path exactly
+    for test_profile, result in zip(test_profiles, results):
+        single = requests.post("http://localhost:8000/analyze-engagement", json=test_profile)
+        assert single.status_code == 200
+        assert result == single.json(), f"Batch result differs for {test_profile['user_id']}"
+    
+    # An empty batch is valid and yields no results
+    response = requests.post("http://localhost:8000/analyze-engagement/batch", json={"requests": []})
+    assert response.status_code == 200
+    assert response.json() == {"results": []}
+    print("Batch analyze-engagement endpoint test passed!")
+
+def test_prediction_cache_stats_endpoint():
+    """Test that repeated requests are answered from the prediction cache."""
+    with open("data/test_profiles.json", "r") as f:
+        test_profiles = json.load(f)
+    
+    before = requests.get("http://localhost:8000/prediction-cache/stats").json()
+    if not before["enabled"]:
+        print("Prediction cache disabled, skipping")
+        return
+    
+    # The same profile twice must produce at least one hit; karma outside the
+    # lookup table's domain makes the prediction reach the cache
+    profile = copy.deepcopy(test_profiles[0])
+    profile["profile"]["karma"] = 100000
+    for _ in range(2):
+        response = requests.post("http://localhost:8000/analyze-engagement", json=profile)
+        assert response.status_code == 200
+    
+    after = requests.get("http://localhost:8000/prediction-cache/stats").json()
+    assert after["hits"] >= before["hits"] + 1
+    assert after["hits"] + after["misses"] == before["hits"] + before["misses"] + 2
+    assert after["size"] <= after["capacity"]
+    print("Prediction cache stats endpoint test passed!")
+
+def test_analyze_engagement_by_batch_endpoint():
+    """Test scoring against a registered peer snapshot."""
+    with open("data/test_profiles.json", "r") as f:
+        test_profiles = json.load(f)
+    
+    # Unknown batch ids are rejected
+    test_profile = copy.deepcopy(test_profiles[0])
+    by_batch = {key: test_profile[key] for key in ("user_id", "profile", "activity")}
+    by_batch["batch_id"] = "unregistered-batch"
+    response = requests.post("http://localhost:8000/analyze-engagement/by-batch", json=by_batch)
+    assert response.status_code == 404
+    
+    # Register the snapshot, then update it and check the version moves
+    response = requests.put("http://localhost:8000/peer-snapshots/test-batch", json=test_profiles[0]["peer_snapshot"])
+    assert response.status_code == 200
+    first_version = response.json()["version"]
+    
+    for test_profile in test_profiles[::3]:
+        response = requests.put("http://localhost:8000/peer-snapshots/test-batch", json=test_profile["peer_snapshot"])
+        assert response.json()["version"] > first_version
+        
+        by_batch = {key: test_profile[key] for key in ("user_id", "profile", "activity")}
+        by_batch["batch_id"] = "test-batch"
+        response = requests.post("http://localhost:8000/analyze-engagement/by-batch", json=by_batch)
+        assert response.status_code == 200
+        
+        # Same answer as sending the full snapshot
+        single = requests.post("http://localhost:8000/analyze-engagement", json=test_profile)
+        assert response.json() == single.json()
+    print("Analyze-engagement by batch endpoint test passed!")
+
+def test_reload_config_endpoint():
+    """Test that the rules can be reloaded without a restart."""
+    response = requests.post("http://localhost:8000/admin/reload-config")
+    assert response.status_code == 200
+    result = response.json()
+    assert result["status"] == "reloaded"
+    assert "resume" in result["rules"]
+    print("Reload config endpoint test passed!")
+
+def test_metrics_endpoint():
+    """Test that /metrics exposes stage histograms after a request."""
+    with open("data/test_profiles.json", "r") as f:
+        test_profiles = json.load(f)
+    
+    response = requests.post("http://localhost:8000/analyze-engagement", json=test_profiles[0])
+    assert response.status_code == 200
+    
+    response = requests.get("http://localhost:8000/metrics")
+    if response.status_code == 404:
+        print("Metrics disabled, skipping")
+        return
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE nudge_stage_duration_seconds histogram" in response.text
+    assert 'stage="serialization"' in response.text
+    print("Metrics endpoint test passed!")
+
+def test_analyze_engagement_rejects_invalid_body():
+    """Test that malformed requests still get FastAPI's 422 validation errors."""
+    with open("data/test_profiles.json", "r") as f:
+        test_profiles = json.load(f)
+    
+    invalid_profile = copy.deepcopy(test_profiles[0])
+    invalid_profile["profile"]["karma"] = "not a number"
+    response = requests.post("http://localhost:8000/analyze-engagement", json=invalid_profile)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "profile", "karma"]
+    
+    response = requests.post("http://localhost:8000/analyze-engagement", data="{not json",
+                             headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+    print("Invalid body test passed!")
+
+def test_feedback_endpoint():
+    """Test recording nudge feedback and rejecting unknown models."""
+    with open("data/test_profiles.json", "r") as f:
+        profile = json.load(f)[0]
+
+    feedback = {**profile, "model": "resume", "acted_on": True}
+    response = requests.post("http://localhost:8000/feedback", json=feedback)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["user_id"] == profile["user_id"]
+    assert result["model"] == "resume"
+    assert result["recorded_at"].endswith("Z")
+
+    response = requests.post("http://localhost:8000/feedback", json={**feedback, "model": "quiz"})
+    assert response.status_code == 422
+    print("Feedback endpoint test passed!")
+
+def test_model_admin_endpoints():
+    """Test the model rollout status and rejection of unknown versions."""
+    response = requests.get("http://localhost:8000/admin/models")
+    assert response.status_code == 200
+    result = response.json()
+    assert result["loading"] is None
+    assert result["shadow"] is None
+    assert isinstance(result["versions"], list)
+
+    response = requests.post("http://localhost:8000/admin/models/v9999/activate")
+    assert response.status_code == 404
+
+    response = requests.post("http://localhost:8000/admin/models/promote")
+    assert response.status_code == 409
+    print("Model admin endpoints test passed!")
+
+def test_peer_events_endpoint():
+    """Test that peer events build a registered snapshot that scoring by batch uses."""
+    events = [
+        {"kind": "profile", "batch_id": "event-batch", "user_id": "stu_1", "resume_uploaded": True, "projects_added": 3},
+        {"kind": "profile", "batch_id": "event-batch", "user_id": "stu_2", "resume_uploaded": False, "projects_added": 0},
+        {"kind": "attendance", "batch_id": "event-batch", "user_id": "stu_1", "event": "hackathon"},
+        {"kind": "attendance", "batch_id": "event-batch", "user_id": "stu_2", "event": "hackathon"}
+    ]
+    response = requests.post("http://localhost:8000/peer-events", json={"events": events})
+    assert response.status_code == 200
+    result = response.json()
+    assert result["applied"] == 4 and result["batches"]["event-batch"] >= 1
+
+    response = requests.get("http://localhost:8000/peer-snapshots/event-batch")
+    assert response.json() == {
+        "batch_avg_projects": 2,
+        "batch_resume_uploaded_pct": 50,
+        "batch_event_attendance": {"hackathon": 2},
+        "buddies_attending_events": []
+    }
+
+    response = requests.post("http://localhost:8000/peer-events",
+                             json={"events": [{"kind": "attendance", "batch_id": "event-batch", "user_id": "stu_1"}]})
+    assert response.status_code == 422
+    print("Peer events endpoint test passed!")
+
+def test_analyze_engagement_columnar_batch_endpoint():
+    """Test that a columnar batch body gets the same results as the JSON batch endpoint."""
+    with open("data/test_profiles.json", "r") as f:
+        test_profiles = json.load(f)
+
+    response = requests.post("http://localhost:8000/analyze-engagement/batch/columnar", data=encode_requests(test_profiles),
+                             headers={"Content-Type": COLUMNAR_CONTENT_TYPE})
+    assert response.status_code == 200
+    expected = requests.post("http://localhost:8000/analyze-engagement/batch", json={"requests": test_profiles})
+    assert response.json() == expected.json()
+
+    response = requests.post("http://localhost:8000/analyze-engagement/batch/columnar", data=b"not columnar",
+                             headers={"Content-Type": COLUMNAR_CONTENT_TYPE})
+    assert response.status_code == 422
+    print("Analyze-engagement columnar batch endpoint test passed!")
+
+def test_nudge_feed_endpoints():
+    """Test that a user whose inputs changed since the feed was built is scored live."""
+    with open("data/test_profiles.json", "r") as f:
+        profile = copy.deepcopy(json.load(f)[0])
+    profile["user_id"] = "feed-test-user"
+
+    response = requests.put("http://localhost:8000/nudges/feed-test-user/inputs", json=profile)
+    assert response.status_code == 200
+    assert response.json() == {"user_id": "feed-test-user", "changed": True}
+    response = requests.get("http://localhost:8000/nudges/feed-test-user")
+    assert response.status_code == 200
+    expected = requests.post("http://localhost:8000/analyze-engagement", json=profile)
+    assert response.json()["nudges"] == expected.json()["nudges"]
+
+    response = requests.put("http://localhost:8000/nudges/someone-else/inputs", json=profile)
+    assert response.status_code == 422
+    assert requests.get("http://localhost:8000/nudges/no-such-user").status_code == 404
+
+    stats = requests.get("http://localhost:8000/nudge-feed/stats").json()
+    assert stats["enabled"] is True and stats["live_changed"] >= 1
+    print("Nudge feed endpoints test passed!")
+
 if __name__ == "__main__":
     # Make sure the server is running before running tests
     print("Make sure the FastAPI server is running on http://localhost:8000")
@@ -155,7 +385,19 @@ if __name__ == "__main__":
     
     test_health_endpoint()
     test_version_endpoint()
+    test_ready_endpoint()
     test_analyze_engagement_endpoint()
+    test_analyze_engagement_batch_endpoint()
+    test_prediction_cache_stats_endpoint()
+    test_analyze_engagement_by_batch_endpoint()
+    test_reload_config_endpoint()
+    test_metrics_endpoint()
+    test_analyze_engagement_rejects_invalid_body()
+    test_feedback_endpoint()
+    test_model_admin_endpoints()
+    test_peer_events_endpoint()
+    test_analyze_engagement_columnar_batch_endpoint()
+    test_nudge_feed_endpoints()
     
     print("\nAll tests passed!")
     
@@ -0,0 +1,65 @@
+import copy
+import json
+import pytest
+from pydantic import ValidationError
+from app.codec import decode_request, decode_batch_request, encode_response, encode_batch_response
+from app.nudge_engine import NudgeEngine
+from app.schemas import EngagementAnalysisRequest, EngagementAnalysisResponse, BatchEngagementAnalysisResponse
+
+def load_profiles():
+    with open("data/test_profiles.json", "r") as f:
+        return json.load(f)
+
+def validation_errors(decode, document):
+    with pytest.raises(ValidationError) as error:
+        decode(json.dumps(document))
+    return [(e["type"], e["loc"]) for e in error.value.errors()]
+
+def test_compact_decoding_matches_pydantic_validation():
+    """Test that the compact decoder accepts and rejects exactly what the Pydantic models do."""
+    profile = load_profiles()[0]
+    compact = decode_request(json.dumps(profile))
+    model = EngagementAnalysisRequest(**profile)
+    assert compact.profile.karma == model.profile.karma
+    assert compact.peer_snapshot.batch_event_attendance == model.peer_snapshot.batch_event_attendance
+
+    bad = copy.deepcopy(profile)
+    bad["profile"]["karma"] = "lots"
+    bad["profile"]["projects_added"] = 1.5
+    del bad["activity"]["login_streak"]
+    bad["peer_snapshot"]["buddies_attending_events"] = "hackathon"
+    bad["unexpected"] = True
+    expected = validation_errors(EngagementAnalysisRequest.model_validate_json, bad)
+    assert len(expected) == 4
+    assert validation_errors(decode_request, bad) == expected
+
+    # Positional arrays are rejected, as they are by BaseModel
+    assert validation_errors(decode_request, {**profile, "profile": list(profile["profile"].values())})[0][0] == "dataclass_type"
+    print("Compact decoding test passed!")
+
+def test_encoded_responses_match_pydantic_serialization():
+    """Test that the fast path scores and encodes exactly like the Pydantic path."""
+    engine = NudgeEngine()
+    profiles = load_profiles()
+
+    for profile in profiles:
+        compact = decode_request(json.dumps(profile))
+        expected = EngagementAnalysisResponse(
+            user_id=profile["user_id"],
+            nudges=engine.generate_nudges(EngagementAnalysisRequest(**profile)),
+            status="generated"
+        )
+        assert json.loads(encode_response(compact.user_id, engine.score(compact))) == expected.model_dump()
+
+    requests = decode_batch_request(json.dumps({"requests": profiles}))
+    body = encode_batch_response([request.user_id for request in requests], engine.score_batch(requests))
+    expected = BatchEngagementAnalysisResponse(results=[
+        EngagementAnalysisResponse(user_id=profile["user_id"], nudges=nudges, status="generated")
+        for profile, nudges in zip(profiles, engine.generate_nudges_batch([EngagementAnalysisRequest(**p) for p in profiles]))
+    ])
+    assert json.loads(body) == expected.model_dump()
+    print("Response encoding test passed!")
+
+if __name__ == "__main__":
+    test_compact_decoding_matches_pydantic_validation()
+    test_encoded_responses_match_pydantic_serialization()
@@ -0,0 +1,56 @@
+import json
+import pickle
+import numpy as np
+from app.codec import decode_batch_request
+from app.columnar import ColumnarFormatError, decode_columnar, encode_buffers, encode_requests
+from app.nudge_engine import NudgeEngine
+
+def load_profiles():
+    with open("data/test_profiles.json", "r") as f:
+        return json.load(f)
+
+def test_columnar_batch_scores_like_json():
+    """Test that a columnar batch gets the same nudges as the same requests sent as JSON."""
+    profiles = load_profiles()
+    engine = NudgeEngine()
+    batch = decode_columnar(encode_requests(profiles))
+    requests = decode_batch_request(json.dumps({"requests": profiles}).encode("utf-8"))
+
+    assert batch.user_ids == [profile["user_id"] for profile in profiles]
+    assert [batch.to_request(i) for i in range(len(batch))] == requests
+    assert np.array_equal(batch.features(), engine._extract_features_batch(requests))
+    assert engine.score_batch(batch) == engine.score_batch(requests)
+
+    # Process-pool workers receive the batch pickled
+    assert engine.score_batch(pickle.loads(pickle.dumps(batch))) == engine.score_batch(requests)
+    print("Columnar scoring test passed!")
+
+def test_malformed_columnar_bodies_are_rejected():
+    """Test that bad magic, bad headers, missing buffers, inconsistent offsets and bad values raise ColumnarFormatError."""
+    body = encode_requests(load_profiles()[:3])
+    batch = decode_columnar(body)
+    buffers = {name: np.array(array) for name, array in batch.buffers.items()}
+
+    broken = [
+        b"not columnar",
+        encode_buffers(3, {name: array for name, array in buffers.items() if name != "profile.karma"}),
+        encode_buffers(4, buffers),
+        encode_buffers(3, {**buffers, "profile.goal_tags.offsets": buffers["profile.goal_tags.offsets"][::-1].copy()}),
+        encode_buffers(3, {**buffers, "profile.karma": buffers["profile.karma"].astype(np.float64)}),
+        body[:-8],
+        body.replace(b'"offset": 0}', b'"offset":""}', 1),  # same header length, non-numeric offset
+        encode_buffers(3, {**buffers, "user_id.data": np.full(len(buffers["user_id.data"]), 0xff, dtype=np.uint8)}),
+        encode_buffers(3, {**buffers, "profile.resume_uploaded": np.array([0, 2, 1], dtype=np.uint8)}),
+        encode_buffers(3, {**buffers, "profile.karma": np.array([1, 2 ** 63, 3], dtype=np.uint64)})
+    ]
+    for body in broken:
+        try:
+            decode_columnar(body)
+        except ColumnarFormatError:
+            continue
+        raise AssertionError("Malformed columnar body was accepted")
+    print("Malformed columnar body test passed!")
+
+if __name__ == "__main__":
+    test_columnar_batch_scores_like_json()
+    test_malformed_columnar_bodies_are_rejected()
@@ -0,0 +1,70 @@
+import copy
+import json
+from app.codec import decode_request
+from app.nudge_engine import NudgeEngine
+
+class CountingPredictor:
+    """Wraps a predictor and counts the rows it is asked to predict."""
+
+    def __init__(self, predictor):
+        self.predictor = predictor
+        self.rows = 0
+
+    def predict(self, X):
+        self.rows += len(X)
+        return self.predictor.predict(X)
+
+def load_profile():
+    with open("data/test_profiles.json", "r") as f:
+        return json.load(f)[0]
+
+def engine_with(tmp_path, **overrides):
+    with open("config.json", "r") as f:
+        config = json.load(f)
+    config.update(overrides)
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    engine = NudgeEngine(config_path=str(path))
+    engine.predictor = CountingPredictor(engine.predictor)
+    return engine
+
+def test_models_are_skipped_when_no_ml_nudge_can_fire(tmp_path):
+    """Test that a request that rules out every ML nudge never reaches the predictor."""
+    engine = engine_with(tmp_path)
+    profile = copy.deepcopy(load_profile())
+    profile["profile"]["resume_uploaded"] = True
+    profile["profile"]["projects_added"] = 2
+    profile["peer_snapshot"]["buddies_attending_events"] = []
+    done = decode_request(json.dumps(profile))
+    open_profile = copy.deepcopy(profile)
+    open_profile["profile"]["projects_added"] = 0
+    pending = decode_request(json.dumps(open_profile))
+
+    engine.score(done)
+    assert engine.predictor.rows == 0
+    engine.score(pending)
+    assert engine.predictor.rows == 1
+
+    # Only the rows that need a model go into the batch prediction
+    engine.score_batch([done, pending, done])
+    assert engine.predictor.rows == 2
+
+    stats = engine.planner_stats.stats()
+    assert stats["requests"] == 5 and stats["predictions_skipped"] == 3
+    assert stats["outputs_skipped"] == {"resume": 5, "project": 3, "event": 5}
+
+def test_models_are_skipped_when_rules_fill_the_top_n(tmp_path):
+    """Test that ML nudges that cannot outrank the rule nudges are not predicted, unless the daily cap is on."""
+    profile = copy.deepcopy(load_profile())
+    profile["profile"]["resume_uploaded"] = False
+    profile["peer_snapshot"]["batch_resume_uploaded_pct"] = 95
+    request = decode_request(json.dumps(profile))
+
+    engine = engine_with(tmp_path, max_nudges_per_day=1)
+    nudges = engine.score(request)
+    assert [nudge.action for nudge in nudges] == ["Upload resume now"]
+    assert engine.predictor.rows == 0
+
+    capped = engine_with(tmp_path, max_nudges_per_day=1, nudge_cap={"enabled": True, "capacity": 100, "shards": 1})
+    assert capped.score(request) == nudges
+    assert capped.predictor.rows == 1
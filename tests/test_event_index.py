@@ -0,0 +1,107 @@
+import json
+import random
+import threading
+from app.codec import decode_request
+from app.event_index import EventIndex, top_events
+from app.peer_snapshots import PeerSnapshotRegistry
+from app.nudge_engine import NudgeEngine
+from app.rules import compile_rules
+from app.schemas import PeerSnapshotData
+
+def make_snapshot(attendance, buddies):
+    return PeerSnapshotData(batch_avg_projects=2, batch_resume_uploaded_pct=70,
+                            batch_event_attendance=attendance, buddies_attending_events=buddies)
+
+def test_incremental_updates_match_a_fresh_ranking():
+    """Test that an index kept up to date event by event ranks like one built from scratch."""
+    rng = random.Random(7)
+    events = [f"event-{i}" for i in range(300)]
+    index = EventIndex.from_snapshot(make_snapshot({}, []))
+    attendance, buddies = {}, []
+
+    for step in range(2000):
+        event = rng.choice(events)
+        action = rng.random()
+        if action < 0.6:
+            attendance[event] = rng.randint(0, 50)
+            index.set_attendance(event, attendance[event])
+        elif action < 0.8 and event in attendance:
+            del attendance[event]
+            index.remove_event(event)
+        else:
+            buddies = rng.sample(events, rng.randint(0, 4)) * rng.randint(1, 2)
+            index.set_buddies(buddies)
+
+        if step % 100 == 0:
+            snapshot = make_snapshot(attendance, buddies)
+            for source in ("batch", "buddies"):
+                expected = EventIndex.from_snapshot(snapshot).top(20, source)
+                assert index.top(20, source) == expected == top_events(snapshot, 20, source)
+    assert len(index) == len(attendance)
+    print("Incremental event index test passed!")
+
+def test_registry_updates_the_batch_index_in_place():
+    """Test that re-registering a batch updates its event index rather than rebuilding it."""
+    registry = PeerSnapshotRegistry()
+    first = registry.register("batch-1", make_snapshot({"hackathon": 40, "meetup": 10}, ["meetup"]))
+    assert first.events.top(2) == [("hackathon", 40), ("meetup", 10)]
+
+    second = registry.register("batch-1", make_snapshot({"meetup": 60, "demo-day": 5}, ["demo-day", "demo-day", "meetup"]))
+    assert second.events is first.events and second.version == 2
+    assert second.events.top(3) == [("meetup", 60), ("demo-day", 5)]
+    assert second.events.top(3, "buddies") == [("demo-day", 5), ("meetup", 60)]
+    print("Registry event index test passed!")
+
+def test_readers_never_see_a_half_applied_update():
+    """Test that top() read while snapshots are re-registered always ranks one of the registered snapshots."""
+    snapshots = [make_snapshot({"hackathon": 40, "meetup": 10}, ["meetup"]),
+                 make_snapshot({"hackathon": 5, "meetup": 60}, ["hackathon", "hackathon"])]
+    expected = [EventIndex.from_snapshot(snapshot).top(2) for snapshot in snapshots]
+    registry = PeerSnapshotRegistry()
+    entry = registry.register("batch-1", snapshots[0])
+
+    seen, stop = [], threading.Event()
+    def read():
+        while not stop.is_set():
+            seen.append(entry.events.top(2))
+    reader = threading.Thread(target=read)
+    reader.start()
+    for i in range(2000):
+        registry.register("batch-1", snapshots[i % 2])
+    stop.set()
+    reader.join()
+    assert seen and all(ranking in expected for ranking in seen)
+    print("Concurrent event index test passed!")
+
+def test_fomo_rules_pick_the_top_events():
+    """Test that the FOMO rules name the most attended event and the event most buddies attend."""
+    with open("config.json", "r") as f:
+        config = json.load(f)
+    with open("data/test_profiles.json", "r") as f:
+        profile = json.load(f)[0]
+    profile["peer_snapshot"] = {
+        "batch_avg_projects": 0,
+        "batch_resume_uploaded_pct": 0,
+        "batch_event_attendance": {"meetup": 12, "hackathon": 80, "demo-day": 30},
+        "buddies_attending_events": ["meetup", "demo-day", "demo-day"]
+    }
+    rules = compile_rules(config)
+    entry = PeerSnapshotRegistry().register("batch-1", PeerSnapshotData(**profile["peer_snapshot"]))
+
+    request = decode_request(json.dumps(profile).encode("utf-8"))
+    nudges = rules.apply(request)
+    assert nudges == rules.apply(request, rules.evaluate_snapshot(entry.snapshot, entry.events))
+    assert nudges == rules.apply_batch([request])[0]
+    titles = [nudge.title for nudge in nudges if nudge.type == "event"]
+    assert titles == ["3 of your buddies are joining 'demo-day'", "80 peers from your batch are attending 'hackathon'"]
+
+    # The ML event nudge names the same buddy event as the rule
+    ml_nudges = NudgeEngine()._ml_nudges(request, rules, 0, 0, 1)
+    assert [nudge.title for nudge in ml_nudges] == ["Our AI thinks you'd enjoy the 'demo-day' event"]
+    print("FOMO top event test passed!")
+
+if __name__ == "__main__":
+    test_incremental_updates_match_a_fresh_ranking()
+    test_registry_updates_the_batch_index_in_place()
+    test_readers_never_see_a_half_applied_update()
+    test_fomo_rules_pick_the_top_events()
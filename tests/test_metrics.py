@@ -0,0 +1,76 @@
+import json
+from app.nudge_engine import NudgeEngine
+from app.metrics import ENGINE_STAGES, MODEL_STAGES, PipelineMetrics, StageTimer
+from app.schemas import EngagementAnalysisRequest
+
+def load_requests():
+    with open("data/test_profiles.json", "r") as f:
+        return [EngagementAnalysisRequest(**profile) for profile in json.load(f)]
+
+def test_metrics_record_stages_and_nudges():
+    """Test that timed generation matches untimed output and fills every stage histogram."""
+    engine = NudgeEngine()
+    requests = load_requests()
+
+    engine.metrics = None
+    expected = [engine.generate_nudges(request) for request in requests]
+    expected_batch = engine.generate_nudges_batch(requests)
+
+    engine.metrics = PipelineMetrics()
+    assert [engine.generate_nudges(request) for request in requests] == expected
+    assert engine.generate_nudges_batch(requests) == expected_batch
+
+    text = engine.metrics.render()
+    for stage in ENGINE_STAGES:
+        if stage in MODEL_STAGES:
+            continue
+        assert f'nudge_stage_duration_seconds_count{{mode="single",stage="{stage}"}} {len(requests)}' in text
+        assert f'nudge_stage_duration_seconds_count{{mode="batch",stage="{stage}"}} 1' in text
+
+    # A model output is only timed for the requests whose planner evaluated it
+    plans = [engine._plan_models(request, engine._apply_rule_based_logic(request, engine.rules), engine.rules)
+             for request in requests]
+    for k, stage in enumerate(MODEL_STAGES):
+        evaluated = sum(1 for needed in plans if needed[k])
+        assert evaluated > 0
+        assert f'nudge_stage_duration_seconds_count{{mode="single",stage="{stage}"}} {evaluated}' in text
+        assert f'nudge_stage_duration_seconds_count{{mode="batch",stage="{stage}"}} 1' in text
+
+    # Every emitted nudge is counted once per call, by type and source
+    emitted = sum(int(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith("nudges_emitted_total{"))
+    assert emitted == 2 * sum(len(nudges) for nudges in expected)
+    print("Metrics recording test passed!")
+
+def test_stage_timer_splits_the_model_call():
+    """Test that the fused model call is shared evenly by the evaluated outputs only."""
+    timer = StageTimer()
+    timer.marks = [0.0, 1.0, 2.0, 8.0, 9.0, 10.0]
+    timer.needed = (True, False, True)
+    stages, marks = timer.stages()
+    assert stages == ("rules", "feature_extraction", "model_resume", "model_event", "ml_nudges", "prioritization")
+    assert marks == (0.0, 1.0, 2.0, 5.0, 8.0, 9.0, 10.0)
+
+    timer.needed = (False, False, False)
+    stages, marks = timer.stages()
+    assert stages == ("rules", "feature_extraction", "ml_nudges", "prioritization")
+    assert marks == (0.0, 1.0, 2.0, 9.0, 10.0)
+    print("Stage timer test passed!")
+
+def test_histogram_buckets_are_cumulative():
+    """Test bucket placement on the le (less or equal) boundary."""
+    metrics = PipelineMetrics(buckets=[0.001, 0.01])
+    metrics.record("single", ("serialization",), (0.0, 0.001))
+    metrics.record("single", ("serialization",), (0.0, 0.005))
+    metrics.record("single", ("serialization",), (0.0, 0.5))
+
+    text = metrics.render()
+    assert 'nudge_stage_duration_seconds_bucket{mode="single",stage="serialization",le="0.001"} 1' in text
+    assert 'nudge_stage_duration_seconds_bucket{mode="single",stage="serialization",le="0.01"} 2' in text
+    assert 'nudge_stage_duration_seconds_bucket{mode="single",stage="serialization",le="+Inf"} 3' in text
+    assert 'nudge_stage_duration_seconds_count{mode="single",stage="serialization"} 3' in text
+    print("Histogram bucket test passed!")
+
+if __name__ == "__main__":
+    test_metrics_record_stages_and_nudges()
+    test_stage_timer_splits_the_model_call()
+    test_histogram_buckets_are_cumulative()
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import pickle
+import threading
+import numpy as np
+from app.model_registry import LOOKUP_FILE, ModelRegistry, ModelRollout
+from app.nudge_engine import NudgeEngine
+from app.codec import decode_request
+from app.shadow import ShadowPredictor
+from app.tree_inference import LazyPredictor
+
+def load_requests():
+    with open("data/test_profiles.json", "r") as f:
+        return [decode_request(json.dumps(profile)) for profile in json.load(f)]
+
+# A corner of the lookup table domain, so publishing stays quick
+TEST_DOMAIN = {"resume_uploaded": [0, 1], "karma": [50, 53], "projects_added": [0, 1],
+               "batch_avg_projects": [1, 2], "batch_resume_uploaded_pct": [50, 52], "event_fomo_score": [0, 1]}
+
+def publish_versions(root):
+    """Publish the shipped models as v0001 and a version with the resume and project forests swapped as v0002."""
+    with open("models/nudge_models.pkl", "rb") as f:
+        models = pickle.load(f)
+    registry = ModelRegistry(str(root))
+    registry.publish(models, {"source": "test"}, TEST_DOMAIN)
+    swapped = {**models, "resume_model": models["project_model"], "project_model": models["resume_model"]}
+    registry.publish(swapped, {"source": "test"}, TEST_DOMAIN)
+    return registry
+
+def lazy_predictors(predictor):
+    """Every LazyPredictor in a predictor chain."""
+    if isinstance(predictor, LazyPredictor):
+        return [predictor]
+    inner = (getattr(predictor, name, None) for name in ("fallback", "predictor", "small", "large"))
+    return [lazy for part in inner if part is not None for lazy in lazy_predictors(part)]
+
+def wait_for(rollout):
+    for _ in range(500):
+        if rollout.loading is None:
+            return
+        time.sleep(0.01)
+    raise AssertionError("model load did not finish")
+
+def test_versions_swap_in_while_requests_are_scoring(tmp_path):
+    """Test that background loads swap versions without failing concurrent requests."""
+    registry = publish_versions(tmp_path / "registry")
+    assert registry.versions() == ["v0001", "v0002"] and registry.latest() == "v0002"
+    assert registry.metadata("v0002")["source"] == "test" and registry.metadata("v0002")["lookup_table"]
+    assert os.path.exists(registry.lookup_path("v0002"))
+
+    engine = NudgeEngine()
+    rollout = ModelRollout(engine, registry, warmup_rows=300)
+    requests = load_requests()
+    expected = [engine.score(request) for request in requests]
+
+    errors, stop = [], threading.Event()
+    def score_continuously():
+        while not stop.is_set():
+            try:
+                engine.score_batch(requests)
+            except Exception as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=score_continuously) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    try:
+        assert rollout.start("v0002")
+        assert not rollout.start("v0001")  # one load at a time
+        wait_for(rollout)
+        assert rollout.start("v0001")
+        wait_for(rollout)
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+    assert errors == []
+    assert engine.model_version == "v0001"
+    assert rollout.last_load["error"] is None and rollout.last_load["warmup_ms"] >= 0
+    assert [engine.score(request) for request in requests] == expected
+    print("Hot swap test passed!")
+
+def test_shadow_scoring_records_disagreement_and_promotes(tmp_path):
+    """Test that shadowing keeps serving the active models and measures the candidate."""
+    registry = publish_versions(tmp_path / "registry")
+    engine = NudgeEngine()
+    rollout = ModelRollout(engine, registry, warmup_rows=10)
+    requests = load_requests()
+    expected = [engine.score(request) for request in requests]
+
+    candidate = rollout.load("v0002", shadow=True)
+    # Warm-up rows all fall inside the lookup table, so the large-batch fallback is built explicitly
+    assert lazy_predictors(candidate.predictor) and all(lazy.loaded for lazy in lazy_predictors(candidate.predictor))
+    assert [engine.score(request) for request in requests] == expected
+    stats = rollout.status()["shadow"]
+    assert stats["version"] == "v0002" and 0 < stats["rows"] <= len(requests)
+    assert stats["disagreement_rate"] > 0 and stats["output_disagreement_rates"]["event"] == 0
+    assert stats["candidate_mean_us"] > 0
+
+    assert rollout.promote() == "v0002"
+    assert engine.shadow is None and engine.model_version == "v0002"
+    assert rollout.promote() is None
+    print("Shadow scoring test passed!")
+
+def test_versions_without_a_lookup_table_are_refused(tmp_path):
+    """Test that activating a version with no lookup table fails instead of serving without it."""
+    with open("models/nudge_models.pkl", "rb") as f:
+        models = pickle.load(f)
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    version = registry.publish(models, {"source": "test"})
+    assert not registry.metadata(version)["lookup_table"]
+
+    engine = NudgeEngine()
+    rollout = ModelRollout(engine, registry, warmup_rows=10)
+    try:
+        rollout.load(version)
+    except RuntimeError as e:
+        assert "app.lookup_table" in str(e)
+    else:
+        raise AssertionError("a version without a lookup table was activated")
+    assert engine.model_version != version
+    print("Missing lookup table test passed!")
+
+def test_shadow_errors_never_reach_responses():
+    """Test that a failing candidate is counted but the primary answer is returned."""
+    class Failing:
+        version = "broken"
+        class serving_predictor:
+            @staticmethod
+            def predict(X):
+                raise RuntimeError("candidate failed")
+
+    class Constant:
+        def predict(self, X):
+            return np.ones((len(X), 3), dtype=np.int64)
+
+    shadow = ShadowPredictor(Constant(), Failing())
+    assert shadow.predict(np.zeros((2, 6))).tolist() == [[1, 1, 1], [1, 1, 1]]
+    assert shadow.stats()["errors"] == 1 and shadow.stats()["rows"] == 0
+    print("Shadow error test passed!")
+
+if __name__ == "__main__":
+    test_shadow_errors_never_reach_responses()
@@ -0,0 +1,86 @@
+import json
+import pickle
+import numpy as np
+from app.feedback import FEEDBACK_MODELS, FeedbackLog
+from app.model_registry import ModelRegistry
+from app.tree_inference import build_predictor, load_flat_artifact
+from data.simulated_profiles import generate_training_data, write_training_chunks
+from models.model_training import (
+    FEATURE_NAMES, LABEL_NAMES, load_feature_matrix, load_feedback, train_models, update_models
+)
+
+def test_json_ndjson_and_chunk_inputs_build_the_same_matrices(tmp_path):
+    """Test that every training input format yields the same X and Y."""
+    samples = generate_training_data(300)
+    (tmp_path / "samples.json").write_text(json.dumps(samples))
+    (tmp_path / "samples.ndjson").write_text("".join(json.dumps(sample) + "\n" for sample in samples))
+    X, Y = load_feature_matrix(str(tmp_path / "samples.json"))
+    assert X.shape == (300, len(FEATURE_NAMES)) and Y.shape == (300, len(LABEL_NAMES))
+    assert X[0].tolist() == [int(samples[0]["features"][name]) for name in FEATURE_NAMES]
+    assert Y[0].tolist() == [samples[0]["label"][name] for name in LABEL_NAMES]
+
+    X_stream, Y_stream = load_feature_matrix(str(tmp_path / "samples.ndjson"))
+    assert np.array_equal(X, X_stream) and np.array_equal(Y, Y_stream)
+
+    write_training_chunks(str(tmp_path / "chunks"), 250, chunk_rows=100, seed=1)
+    X_chunks, Y_chunks = load_feature_matrix(str(tmp_path / "chunks"))
+    assert X_chunks.shape == (250, len(FEATURE_NAMES)) and Y_chunks.shape == (250, len(LABEL_NAMES))
+    assert np.array_equal(Y_chunks[:, 2], (X_chunks[:, 5] >= 2).astype(np.int8))
+
+def test_training_reports_phases_and_saves_serving_models(tmp_path):
+    """Test a parallel training run on columnar chunks."""
+    write_training_chunks(str(tmp_path / "chunks"), 2000, chunk_rows=500, seed=1)
+    output = tmp_path / "models.pkl"
+    phases = train_models(output_path=str(output), input_path=str(tmp_path / "chunks"), n_jobs=2)
+    assert [phase[0] for phase in phases] == ["load", "split", "fit", "evaluate", "save"]
+    assert all(seconds >= 0 and peak > 0 for _, seconds, peak in phases)
+
+    models = pickle.loads(output.read_bytes())
+    assert models["layout"] == "separate"
+    for name in ("resume_model", "project_model", "event_model"):
+        assert models[name].n_jobs is None
+    X, Y = load_feature_matrix(str(tmp_path / "chunks"))
+    assert (models["event_model"].predict(X) == Y[:, 2]).mean() > 0.95
+
+def write_feedback(path, samples, acted_on):
+    """Log one feedback record per sample and model, with acted_on(sample, model) as the outcome."""
+    log = FeedbackLog(str(path))
+    for sample in samples:
+        features = [int(sample["features"][name]) for name in FEATURE_NAMES]
+        for model in FEEDBACK_MODELS:
+            log.record("stu_1", model, acted_on(sample, model), features)
+    log.close()
+
+def test_incremental_update_publishes_windowed_versions(tmp_path):
+    """Test that feedback adds trees to a sliding window and publishes registry versions."""
+    write_training_chunks(str(tmp_path / "chunks"), 1000, chunk_rows=500, seed=1)
+    base = tmp_path / "base.pkl"
+    train_models(output_path=str(base), input_path=str(tmp_path / "chunks"), n_jobs=1)
+
+    # Users now act on event nudges only when their karma is high
+    feedback = tmp_path / "feedback.ndjson"
+    samples = generate_training_data(400)
+    write_feedback(feedback, samples, lambda sample, model: sample["features"]["karma"] > 300 if model == "event"
+                   else bool(sample["label"][f"should_nudge_{model}"]))
+
+    registry = ModelRegistry(str(tmp_path / "registry"))
+    assert update_models(str(feedback), registry.root, base_path=str(base), new_trees=60, n_jobs=1) == "v0001"
+    assert update_models(str(feedback), registry.root, new_trees=60, n_jobs=1) == "v0002"
+    assert registry.versions() == ["v0001", "v0002"]
+    assert registry.metadata("v0002")["parent"] == "v0001"
+    assert registry.metadata("v0002")["trees_added"]["event_model"] == 60
+
+    models = pickle.loads(open(registry.model_path("v0002"), "rb").read())
+    assert models["event_model"].n_estimators == 100
+    X, model_index, acted_on = load_feedback(str(feedback))
+    events = model_index == FEEDBACK_MODELS.index("event")
+    assert (models["event_model"].predict(X[events]) == acted_on[events]).mean() > 0.9
+
+    # The published flat artifact serves the same predictions as the pickle
+    _, flat = load_flat_artifact(registry.artifact_path("v0002"))
+    assert np.array_equal(flat.predict(X), build_predictor(models, "sklearn").predict(X))
+
+    # Feedback with a single outcome cannot update a model
+    write_feedback(tmp_path / "one_sided.ndjson", samples, lambda sample, model: True)
+    assert update_models(str(tmp_path / "one_sided.ndjson"), registry.root, n_jobs=1) is None
+    assert registry.latest() == "v0002"
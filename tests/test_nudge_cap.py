@@ -0,0 +1,107 @@
+import os
+import json
+import threading
+from app.codec import decode_request
+from app.nudge_cap import DailyNudgeCap
+from app.nudge_engine import NudgeEngine
+from app.schemas import Nudge
+
+NUDGES = [Nudge("profile", f"Title {i}", f"Action {i}", "high") for i in range(5)]
+
+def test_daily_cap_dedupes_and_limits_per_user():
+    """Test that a user never gets a nudge twice a day nor more than the daily limit."""
+    cap = DailyNudgeCap(capacity=1000, shards=4)
+    assert cap.take("stu_1", NUDGES[:2], 3) == NUDGES[:2]
+    assert cap.take("stu_1", NUDGES, 3) == [NUDGES[2]]
+    assert cap.take("stu_1", NUDGES, 3) == []
+    assert cap.sent_today("stu_1") == 3
+    assert cap.take("stu_2", NUDGES, 3) == NUDGES[:3]
+
+    # Nothing survives the day rollover
+    cap.today = lambda: 10 ** 6
+    assert cap.sent_today("stu_1") == 0
+    assert cap.take("stu_1", NUDGES, 3) == NUDGES[:3]
+    assert cap.stats()["users_today"] == 1
+    print("Daily cap test passed!")
+
+def test_full_shards_fail_open():
+    """Test that users beyond capacity are served uncapped instead of evicting anyone."""
+    cap = DailyNudgeCap(capacity=4, shards=1)
+    served = [cap.take(f"stu_{i}", NUDGES, 2) for i in range(10)]
+    assert all(nudges == NUDGES[:2] for nudges in served)
+    assert cap.stats()["users_today"] == cap.stats()["capacity"] and cap.stats()["overflows"] > 0
+    assert cap.take("stu_0", NUDGES, 2) == []
+    print("Full shard test passed!")
+
+def test_snapshot_round_trip(tmp_path):
+    """Test that a restored snapshot remembers today's nudges."""
+    cap = DailyNudgeCap(capacity=1000, shards=4)
+    cap.take("stu_1", NUDGES, 2)
+    cap.save(str(tmp_path / "cap.npz"))
+
+    restored = DailyNudgeCap(capacity=1000, shards=4)
+    assert restored.load(str(tmp_path / "cap.npz"))
+    assert restored.sent_today("stu_1") == 2
+    assert restored.take("stu_1", NUDGES, 3) == [NUDGES[2]]
+    assert not DailyNudgeCap(capacity=10 ** 5, shards=4).load(str(tmp_path / "cap.npz"))
+
+def test_engine_applies_the_cap_across_calls(tmp_path):
+    """Test that repeated scoring of one user spends a single daily allowance."""
+    with open("config.json", "r") as f:
+        config = json.load(f)
+    config["nudge_cap"] = {"enabled": True, "capacity": 1000, "shards": 4}
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(config))
+
+    engine = NudgeEngine(config_path=str(config_path))
+    with open("data/test_profiles.json", "r") as f:
+        request = decode_request(json.dumps(json.load(f)[0]))
+
+    sent = []
+    for _ in range(4):
+        sent.extend(engine.score(request))
+    assert len(sent) == len(set(sent)) <= config["max_nudges_per_day"]
+    assert engine.score_batch([request, request]) == [[], []]
+
+def test_counters_add_up_across_threads():
+    """Test that overflow and withheld counts from concurrent threads on different shards are all kept."""
+    cap = DailyNudgeCap(capacity=4000, shards=8)
+    def take(worker):
+        for i in range(500):
+            user_id = f"stu_{worker}_{i}"
+            cap.take(user_id, NUDGES, 3)
+            cap.take(user_id, NUDGES, 3)  # all three withheld: the allowance is spent
+
+    threads = [threading.Thread(target=take, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cap.stats()
+    assert stats["withheld"] == 3 * (8 * 500 - stats["overflows"])
+    print("Concurrent cap counter test passed!")
+
+def test_shared_tables_are_updated_by_forked_processes():
+    """Test that after share, nudges sent from forked processes count against one allowance."""
+    cap = DailyNudgeCap(capacity=1000, shards=4)
+    assert cap.take("stu_1", NUDGES[:1], 3) == NUDGES[:1]
+    cap.share()
+
+    pids = []
+    for nudges in (NUDGES[1:2], NUDGES[2:3]):
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if cap.take("stu_1", nudges, 3) == nudges else 1)
+        pids.append(pid)
+    assert all(os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]) == 0 for pid in pids)
+
+    assert cap.sent_today("stu_1") == 3
+    assert cap.take("stu_1", NUDGES, 3) == []
+    assert cap.stats()["withheld"] == 3
+    print("Shared cap test passed!")
+
+if __name__ == "__main__":
+    test_daily_cap_dedupes_and_limits_per_user()
+    test_full_shards_fail_open()
+    test_counters_add_up_across_threads()
+    test_shared_tables_are_updated_by_forked_processes()
@@ -0,0 +1,98 @@
+import json
+from app.codec import decode_request, encode_response
+from app.nudge_engine import NudgeEngine
+from app.nudge_feed import ChangedInputsFull, NudgeFeed, NudgeFeedService, build_feed
+from app.rules import compile_rules
+
+def load_lines():
+    with open("data/test_profiles.json", "r") as f:
+        return [json.dumps(profile) for profile in json.load(f)]
+
+def uncapped_engine():
+    engine = NudgeEngine()
+    engine.nudge_cap = None
+    return engine
+
+def test_feed_serves_what_live_scoring_returns(tmp_path):
+    """Test that every user's feed record is the response live scoring gives for their request."""
+    engine = uncapped_engine()
+    lines = load_lines()
+    path = str(tmp_path / "feed.bin")
+    result = build_feed(lines, path, engine, chunk_size=2)
+    assert result["users"] == len(lines) and result["errors"] == 0
+
+    feed = NudgeFeed(path)
+    for line in lines:
+        request = decode_request(line)
+        record = feed.get(request.user_id)
+        assert record.response == encode_response(request.user_id, engine.score(request))
+        assert decode_request(record.request) == request
+    assert feed.get("no-such-user") is None
+    feed.close()
+    print("Nudge feed build test passed!")
+
+def test_changed_inputs_and_stale_builds_score_live(tmp_path):
+    """Test that users with new inputs, and feeds built with other rules, are scored live."""
+    engine = uncapped_engine()
+    lines = load_lines()
+    path = str(tmp_path / "feed.bin")
+    build_feed(lines, path, engine)
+    service = NudgeFeedService(engine, path)
+
+    request = decode_request(lines[0])
+    response, live = service.lookup(request.user_id)
+    assert response is not None and live is None
+    assert service.lookup("no-such-user") == (None, None)
+
+    # Re-sending the inputs the feed was built from changes nothing
+    assert not service.update_inputs(request)
+    profile = json.loads(lines[0])
+    profile["profile"]["projects_added"] += 3
+    changed = decode_request(json.dumps(profile))
+    assert service.update_inputs(changed)
+    assert service.lookup(request.user_id) == (None, changed)
+
+    # A rebuild from the new inputs serves them from the feed again
+    build_feed([json.dumps(profile)] + lines[1:], path, engine)
+    assert service.reload()
+    response, live = service.lookup(request.user_id)
+    assert live is None and response == encode_response(request.user_id, engine.score(changed))
+
+    config = json.loads(json.dumps(engine.config))
+    config["max_nudges_per_day"] = config.get("max_nudges_per_day", 3) + 1
+    engine.rules = compile_rules(config)
+    assert not service.is_current()
+    other = decode_request(lines[1])
+    assert service.lookup(other.user_id) == (None, other)
+
+    stats = service.stats()
+    assert (stats["served"], stats["live_changed"], stats["live_stale"], stats["misses"]) == (2, 1, 1, 1)
+    print("Nudge feed fallback test passed!")
+
+def test_changed_users_are_bounded(tmp_path):
+    """Test that changes beyond max_changed_users are refused until a rebuilt feed covers the tracked ones."""
+    engine = uncapped_engine()
+    lines = load_lines()
+    path = str(tmp_path / "feed.bin")
+    build_feed(lines, path, engine)
+    service = NudgeFeedService(engine, path, max_changed_users=1)
+
+    profiles = [json.loads(line) for line in lines[:2]]
+    for profile in profiles:
+        profile["profile"]["projects_added"] += 3
+    first, second = (decode_request(json.dumps(profile)) for profile in profiles)
+    assert service.update_inputs(first)
+    assert service.update_inputs(first)  # users already tracked can still change
+    try:
+        service.update_inputs(second)
+    except ChangedInputsFull:
+        pass
+    else:
+        raise AssertionError("a change beyond max_changed_users was tracked")
+
+    build_feed([json.dumps(profiles[0])] + lines[1:], path, engine)
+    assert service.reload()
+    assert service.update_inputs(second)
+    stats = service.stats()
+    assert (stats["changed_users"], stats["max_changed_users"], stats["refused_changes"]) == (1, 1, 1)
+    print("Nudge feed changed user bound test passed!")
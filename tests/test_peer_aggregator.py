@@ -0,0 +1,71 @@
+import random
+from app.peer_aggregator import PeerAggregator
+from app.peer_snapshots import PeerSnapshotRegistry
+from app.event_index import EventIndex
+from app.schemas import PeerEvent
+
+def test_aggregates_match_a_full_recount():
+    """Test that running aggregates equal a recount of every member's latest state."""
+    rng = random.Random(3)
+    aggregator = PeerAggregator()
+    registry = PeerSnapshotRegistry()
+    users = [f"stu_{i}" for i in range(50)]
+    events = ["hackathon", "meetup", "demo-day", "coding-contest"]
+    profiles, attending = {}, {}
+
+    for step in range(3000):
+        user_id = rng.choice(users)
+        kind = rng.choices(["profile", "attendance", "leave"], [5, 5, 1])[0]
+        if kind == "profile":
+            event = PeerEvent(kind=kind, batch_id="b1", user_id=user_id,
+                              resume_uploaded=rng.random() < 0.6, projects_added=rng.randint(0, 5))
+            profiles[user_id] = (event.resume_uploaded, event.projects_added)
+        elif kind == "attendance":
+            event = PeerEvent(kind=kind, batch_id="b1", user_id=user_id, event=rng.choice(events),
+                              attending=rng.random() < 0.7)
+            chosen = attending.setdefault(user_id, set())
+            (chosen.add if event.attending else chosen.discard)(event.event)
+        else:
+            event = PeerEvent(kind=kind, batch_id="b1", user_id=user_id)
+            profiles.pop(user_id, None)
+            attending.pop(user_id, None)
+        aggregator.apply(event)
+
+        if step % 97 == 0:
+            entry = aggregator.publish(registry, "b1")
+            snapshot = entry.snapshot
+            members = len(profiles)
+            counts = {}
+            for chosen in attending.values():
+                for name in chosen:
+                    counts[name] = counts.get(name, 0) + 1
+            assert snapshot.batch_event_attendance == counts
+            if members:
+                assert snapshot.batch_avg_projects == int(sum(p for _, p in profiles.values()) / members + 0.5)
+                assert snapshot.batch_resume_uploaded_pct == int(100 * sum(r for r, _ in profiles.values()) / members + 0.5)
+            # The incrementally updated index ranks like a fresh one
+            assert entry.events.top(10) == EventIndex.from_snapshot(snapshot).top(10)
+
+    assert aggregator.stats()["members"] == len(profiles)
+    print("Peer aggregate recount test passed!")
+
+def test_publish_keeps_registered_buddies():
+    """Test that publishing keeps the buddies of a snapshot registered by a client."""
+    aggregator = PeerAggregator()
+    registry = PeerSnapshotRegistry()
+    assert aggregator.snapshot("unknown") is None
+
+    aggregator.apply(PeerEvent(kind="attendance", batch_id="b1", user_id="stu_1", event="meetup"))
+    first = aggregator.publish(registry, "b1")
+    registry.register("b1", first.snapshot.model_copy(update={"buddies_attending_events": ["meetup"]}))
+
+    aggregator.apply(PeerEvent(kind="attendance", batch_id="b1", user_id="stu_2", event="hackathon"))
+    entry = aggregator.publish(registry, "b1")
+    assert entry.version == 3
+    assert entry.snapshot.buddies_attending_events == ["meetup"]
+    assert entry.events.top(2, "buddies") == [("meetup", 1)]
+    print("Publish buddies test passed!")
+
+if __name__ == "__main__":
+    test_aggregates_match_a_full_recount()
+    test_publish_keeps_registered_buddies()
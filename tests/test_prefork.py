@@ -0,0 +1,90 @@
+import gc
+import sys
+import time
+import signal
+import socket
+import subprocess
+import requests
+import app.main as main
+from app.nudge_cap import DailyNudgeCap
+from app.prefork import PreforkServer
+from app.tree_inference import BatchSizeRouter, LazyPredictor
+
+SNAPSHOT = {"batch_avg_projects": 1, "batch_resume_uploaded_pct": 70,
+            "batch_event_attendance": {}, "buddies_attending_events": []}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for(log_path, text, count=1, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with open(log_path, "r") as f:
+            if f.read().count(text) >= count:
+                return
+        time.sleep(0.2)
+    raise AssertionError(f"{text!r} not logged {count} times")
+
+def test_prefork_workers_serve_and_restart_one_at_a_time(tmp_path):
+    """Test that prefork workers serve, share writes, are replaced one by one on SIGHUP and stop on SIGTERM."""
+    port = free_port()
+    log_path = tmp_path / "prefork.log"
+    with open(log_path, "w") as log:
+        parent = subprocess.Popen([sys.executable, "-m", "app.prefork", "--port", str(port), "--workers", "2"],
+                                  stdout=log, stderr=subprocess.STDOUT)
+    try:
+        wait_for(log_path, "with 2 workers")
+        base = f"http://127.0.0.1:{port}"
+        assert requests.get(f"{base}/health").json() == {"status": "ok"}
+
+        # Each write reaches every worker, whichever one received it
+        for projects in range(1, 6):
+            snapshot = dict(SNAPSHOT, batch_avg_projects=projects)
+            assert requests.put(f"{base}/peer-snapshots/prefork-batch", json=snapshot).json()["version"] == projects
+        for _ in range(20):
+            assert requests.get(f"{base}/peer-snapshots/prefork-batch").json()["batch_avg_projects"] == 5
+
+        parent.send_signal(signal.SIGHUP)
+        while "Rolling restart finished" not in log_path.read_text():
+            assert requests.get(f"{base}/health").status_code == 200
+            assert parent.poll() is None
+            time.sleep(0.1)
+        wait_for(log_path, ") ready", count=4)
+
+        # Replacement workers fork from the parent, which applied the writes too
+        for _ in range(20):
+            assert requests.get(f"{base}/peer-snapshots/prefork-batch").json()["batch_avg_projects"] == 5
+
+        parent.send_signal(signal.SIGTERM)
+        assert parent.wait(timeout=60) == 0
+    finally:
+        if parent.poll() is None:
+            parent.kill()
+    print("Prefork serving test passed!")
+
+def test_loading_shares_the_nudge_cap(monkeypatch):
+    """Test that preparing the parent moves the daily nudge cap into shared memory."""
+    cap = DailyNudgeCap(capacity=1000, shards=4)
+    monkeypatch.setattr(main.nudge_engine, "nudge_cap", cap)
+    server = PreforkServer(workers=2)
+    monkeypatch.setattr(server, "_prepare", lambda: None)
+    server.load()
+    assert cap.stats()["shared"]
+    print("Prefork nudge cap test passed!")
+
+def test_parent_loads_the_large_batch_predictor_before_forking(monkeypatch):
+    """Test that preparing the parent builds the lazily loaded fallback the warm-up rows never reach."""
+    table = main.nudge_engine.model_set.predictor
+    fallback = table.fallback
+    lazy = LazyPredictor(lambda: fallback)
+    monkeypatch.setattr(table, "fallback", BatchSizeRouter(fallback, lazy, 8))
+    server = PreforkServer()
+    server.main = main
+    try:
+        server._prepare()
+    finally:
+        gc.unfreeze()
+    assert lazy.loaded
+    print("Prefork preload test passed!")
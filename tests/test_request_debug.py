@@ -0,0 +1,60 @@
+import json
+import pstats
+import asyncio
+import httpx
+import app.main as main
+from app.metrics import MODEL_STAGES
+from app.request_debug import DEBUG_HEADER, PROFILE_HEADER, RequestDebug
+
+def post_profile(profile, headers):
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            response = await client.post("/analyze-engagement", json=profile, headers=headers)
+            download = None
+            if PROFILE_HEADER in response.headers:
+                download = await client.get(response.headers[PROFILE_HEADER])
+            return response, download
+    return asyncio.run(send())
+
+def load_profile():
+    with open("data/test_profiles.json", "r") as f:
+        return json.load(f)[0]
+
+def test_debug_requests_get_stage_timings_and_a_profile(tmp_path, monkeypatch):
+    """Test that a debug request gets Server-Timing stages and a profile pstats can load."""
+    monkeypatch.setattr(main, "request_debug", RequestDebug(max_profiles=2))
+    profile = load_profile()
+    plain, _ = post_profile(profile, {})
+    assert "Server-Timing" not in plain.headers
+
+    response, download = post_profile(profile, {DEBUG_HEADER: "profile"})
+    assert response.status_code == 200 and response.json() == plain.json()
+    stages = [metric.split(";")[0] for metric in response.headers["Server-Timing"].split(", ")]
+    assert stages[:3] == ["validation", "rules", "feature_extraction"]
+    assert stages[-4:] == ["ml_nudges", "prioritization", "encoding", "total"]
+    assert set(stages[3:-4]) <= set(MODEL_STAGES)
+
+    # Each evaluated model output is labelled as its share of the one fused call
+    models = stages[3:-4]
+    assert models
+    for metric in response.headers["Server-Timing"].split(", "):
+        if metric.split(";")[0] in MODEL_STAGES:
+            assert metric.endswith(f';desc="1/{len(models)} of one fused model call"')
+
+    assert download.status_code == 200
+    path = tmp_path / "request.prof"
+    path.write_bytes(download.content)
+    assert any(name == "score" for _, _, name in pstats.Stats(str(path)).stats)
+
+    response, download = post_profile(profile, {DEBUG_HEADER: "1"})
+    assert "Server-Timing" in response.headers and download is None
+    assert main.request_debug.stats() == {"traced": 2, "profiled": 1, "profiles_kept": 1}
+    print("Request debug test passed!")
+
+def test_debug_header_is_ignored_unless_allowed(monkeypatch):
+    """Test that the debug header does nothing when request_debug is not enabled."""
+    monkeypatch.setattr(main, "request_debug", None)
+    response, download = post_profile(load_profile(), {DEBUG_HEADER: "profile"})
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers and download is None
+    print("Request debug disabled test passed!")
@@ -0,0 +1,88 @@
+import copy
+import json
+from app.nudge_engine import NudgeEngine
+from app.rules import RuleConfigError, compile_rules
+from app.schemas import EngagementAnalysisRequest
+
+def load_config():
+    with open("config.json", "r") as f:
+        return json.load(f)
+
+def load_request(index=0):
+    with open("data/test_profiles.json", "r") as f:
+        return EngagementAnalysisRequest(**json.load(f)[index])
+
+def test_rule_added_through_config_only():
+    """Test that a new rule needs nothing but a config entry."""
+    config = load_config()
+    config["rules"].append({
+        "name": "login_streak",
+        "when": [{"field": "activity.login_streak", "op": "<", "value": 100}],
+        "nudge": {
+            "type": "activity",
+            "title": "You're on a {activity.login_streak}-day streak with {peer_snapshot.batch_avg_projects} projects as the batch average",
+            "action": "Keep your streak going",
+            "priority": "quiz"
+        }
+    })
+    request = load_request()
+    nudges = compile_rules(config).apply(request)
+
+    streak_nudge = nudges[-1]
+    assert streak_nudge.action == "Keep your streak going"
+    assert streak_nudge.title.startswith(f"You're on a {request.activity.login_streak}-day streak")
+    assert streak_nudge.priority == config["priority_labels"]["quiz"]
+    print("Config-only rule test passed!")
+
+def test_reload_config_swaps_rules_and_rejects_bad_rules(tmp_path):
+    """Test that reload_config swaps in new thresholds and keeps the old rules on errors."""
+    config = load_config()
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(config))
+    engine = NudgeEngine(config_path=str(config_path))
+
+    request = load_request()
+    request.profile.resume_uploaded = False
+    request.peer_snapshot.batch_resume_uploaded_pct = 75
+    actions = [nudge.action for nudge in engine.generate_nudges(request)]
+    assert "Upload resume now" in actions
+
+    # Raise the resume threshold above the batch percentage
+    tuned = copy.deepcopy(config)
+    tuned["profile_rules"]["resume_threshold"] = 0.8
+    config_path.write_text(json.dumps(tuned))
+    engine.reload_config()
+    actions = [nudge.action for nudge in engine.generate_nudges(request)]
+    assert "Upload resume now" not in actions
+
+    # A broken rule is rejected and the previous rules keep serving
+    broken = copy.deepcopy(tuned)
+    broken["rules"][0]["when"][0]["op"] = "~="
+    config_path.write_text(json.dumps(broken))
+    previous_rules = engine.rules
+    try:
+        engine.reload_config()
+        assert False, "Expected RuleConfigError"
+    except RuleConfigError:
+        pass
+    assert engine.rules is previous_rules
+    print("Config reload test passed!")
+
+def test_rules_that_would_fail_while_scoring_are_rejected():
+    """Test that unknown fields, malformed titles, unknown priorities and type errors fail at compile time."""
+    def broken(change):
+        config = load_config()
+        change(config)
+        try:
+            compile_rules(config)
+            assert False, "Expected RuleConfigError"
+        except RuleConfigError:
+            pass
+
+    broken(lambda config: config["rules"][0]["when"][0].update(field="profile.resume_uploadd"))
+    broken(lambda config: config["rules"][0]["when"][0].update(field="profile.karma.value"))
+    broken(lambda config: config["rules"][0]["nudge"].update(title="Peers {"))
+    broken(lambda config: config["rules"][0]["nudge"].update(title="{peer_snapshot.batch_size}"))
+    broken(lambda config: config["priority_labels"].update(resume="urgent"))
+    broken(lambda config: config["rules"][0]["when"][0].update(value="yes", op=">="))
+    print("Rule validation test passed!")
@@ -0,0 +1,57 @@
+import time
+import asyncio
+from app.scoring_executor import ScoringExecutor, ScoringQueueFull
+
+class SlowEngine:
+    def generate_nudges(self, request):
+        time.sleep(0.2)
+        return [request]
+
+def test_scoring_executor_rejects_when_full():
+    """Test that calls beyond max_in_flight fail fast while the event loop stays free."""
+    executor = ScoringExecutor(SlowEngine(), kind="thread", max_workers=1, max_in_flight=2)
+
+    async def scenario():
+        first = asyncio.ensure_future(executor.run("generate_nudges", "a"))
+        second = asyncio.ensure_future(executor.run("generate_nudges", "b"))
+        await asyncio.sleep(0)
+
+        # The queue is full: the third call is rejected immediately
+        started = time.perf_counter()
+        try:
+            await executor.run("generate_nudges", "c")
+            assert False, "Expected ScoringQueueFull"
+        except ScoringQueueFull:
+            pass
+        assert time.perf_counter() - started < 0.1
+
+        return await first, await second
+
+    assert asyncio.run(scenario()) == (["a"], ["b"])
+
+    stats = executor.stats()
+    assert stats["completed"] == 2
+    assert stats["rejected"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["max_wait_ms"] >= 150  # the second call waited for the single worker
+    executor.shutdown()
+    print("Scoring executor test passed!")
+
+def test_cancelled_calls_release_their_slot():
+    """Test that a call whose caller is cancelled holds its slot only until the work finishes."""
+    executor = ScoringExecutor(SlowEngine(), kind="thread", max_workers=1, max_in_flight=1)
+
+    async def scenario():
+        task = asyncio.ensure_future(executor.run("generate_nudges", "a"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.sleep(0)
+        assert executor.stats()["in_flight"] == 1
+        await asyncio.sleep(0.3)
+        return await executor.run("generate_nudges", "b")
+
+    assert asyncio.run(scenario()) == ["b"]
+    stats = executor.stats()
+    assert stats["in_flight"] == 0 and stats["completed"] == 2
+    executor.shutdown()
+    print("Scoring executor cancellation test passed!")
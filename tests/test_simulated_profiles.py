@@ -0,0 +1,49 @@
+import json
+import numpy as np
+from app.schemas import EngagementAnalysisRequest
+from data.simulated_profiles import (
+    FEATURE_NAMES, LABEL_NAMES, generate_training_columns, write_training_chunks, write_request_ndjson
+)
+
+def test_vectorized_columns_are_seeded_and_follow_labelling_rules():
+    """Test that a seed fixes every column and the labels follow generate_training_data's rules."""
+    columns = generate_training_columns(20000, np.random.default_rng(3))
+    again = generate_training_columns(20000, np.random.default_rng(3))
+    assert all(np.array_equal(columns[name], again[name]) for name in FEATURE_NAMES + LABEL_NAMES)
+
+    assert columns["karma"].min() >= 50 and columns["karma"].max() <= 500
+    assert set(np.unique(columns["projects_added"])) == set(range(6))
+    assert set(np.unique(columns["event_fomo_score"])) == {0, 1, 2, 3}
+    for i in range(1000):
+        row = {name: columns[name][i] for name in FEATURE_NAMES}
+        assert columns["should_nudge_resume"][i] == int(not row["resume_uploaded"] and row["batch_resume_uploaded_pct"] >= 80)
+        assert columns["should_nudge_project"][i] == int(row["projects_added"] == 0 and row["batch_avg_projects"] >= 2)
+        assert columns["should_nudge_event"][i] == int(row["event_fomo_score"] >= 2)
+    print("Vectorized generator test passed!")
+
+def test_chunked_outputs_are_reproducible(tmp_path):
+    """Test the .npz chunks, manifest and NDJSON request files."""
+    paths = write_training_chunks(str(tmp_path / "a"), 2500, chunk_rows=1000, seed=9)
+    write_training_chunks(str(tmp_path / "b"), 2500, chunk_rows=1000, seed=9)
+    manifest = json.loads((tmp_path / "a" / "manifest.json").read_text())
+    assert manifest["chunks"] == ["part-00000.npz", "part-00001.npz", "part-00002.npz"]
+
+    rows = 0
+    for name in manifest["chunks"]:
+        with np.load(tmp_path / "a" / name) as first, np.load(tmp_path / "b" / name) as second:
+            assert set(first.files) == set(FEATURE_NAMES + LABEL_NAMES)
+            assert all(np.array_equal(first[column], second[column]) for column in first.files)
+            rows += len(first["karma"])
+    assert len(paths) == 3 and rows == 2500
+
+    ndjson = tmp_path / "requests.ndjson"
+    write_request_ndjson(str(ndjson), 250, peer_sets=4, chunk_rows=100, seed=9)
+    lines = ndjson.read_text().splitlines()
+    assert len(lines) == 250
+    requests = [EngagementAnalysisRequest.model_validate_json(line) for line in lines]
+    assert len({request.user_id for request in requests}) == 250
+    assert len({json.dumps(request.peer_snapshot.model_dump(), sort_keys=True) for request in requests}) <= 4
+    print("Chunked output test passed!")
+
+if __name__ == "__main__":
+    test_vectorized_columns_are_seeded_and_follow_labelling_rules()
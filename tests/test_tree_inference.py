@@ -0,0 +1,135 @@
+import sys
+import json
+import pickle
+import tempfile
+import subprocess
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from app.tree_inference import FlatForest, build_predictor, save_flat_artifact, load_flat_artifact
+from app.lookup_table import LookupTablePredictor, build_table
+
+MODEL_NAMES = ["resume_model", "project_model", "event_model"]
+
+def load_training_features():
+    """Build the feature matrix for data/training_data.json."""
+    with open("data/training_data.json", "r") as f:
+        data = json.load(f)
+    return np.array([
+        [
+            1 if sample["features"]["resume_uploaded"] else 0,
+            sample["features"]["karma"],
+            sample["features"]["projects_added"],
+            sample["features"]["batch_avg_projects"],
+            sample["features"]["batch_resume_uploaded_pct"],
+            sample["features"]["event_fomo_score"]
+        ]
+        for sample in data
+    ])
+
+def test_flat_forest_matches_sklearn():
+    """Test that the flat evaluator is bit-identical to RandomForestClassifier."""
+    with open("models/nudge_models.pkl", "rb") as f:
+        models = pickle.load(f)
+    X = load_training_features()
+
+    for name in MODEL_NAMES:
+        forest = FlatForest.from_sklearn(models[name])
+        assert np.array_equal(forest.predict(X), models[name].predict(X)), f"{name} predictions differ"
+        assert np.array_equal(forest.predict_proba(X), models[name].predict_proba(X)), f"{name} probabilities differ"
+
+        # Single rows take the same path as the API
+        for row in X[:20]:
+            assert forest.predict(row.reshape(1, -1))[0] == models[name].predict(row.reshape(1, -1))[0]
+    print("Flat forest equivalence test passed!")
+
+def test_predictor_layouts_match_sklearn():
+    """Test the fused and multi-output flat predictors against sklearn."""
+    with open("models/nudge_models.pkl", "rb") as f:
+        models = pickle.load(f)
+    X = load_training_features()
+
+    # Separate layout: three forests fused into one traversal
+    fused = build_predictor(models, "flat")
+    assert np.array_equal(fused.predict(X), build_predictor(models, "sklearn").predict(X))
+
+    # Multi-output layout: one forest for all three labels
+    Y = np.column_stack([models[name].predict(X) for name in MODEL_NAMES])
+    multi_output = {
+        "layout": "multi_output",
+        "nudge_model": RandomForestClassifier(n_estimators=20, random_state=42).fit(X, Y)
+    }
+    flat = build_predictor(multi_output, "flat")
+    assert flat.predict(X).shape == (len(X), 3)
+    assert np.array_equal(flat.predict(X), build_predictor(multi_output, "sklearn").predict(X))
+    print("Predictor layout test passed!")
+
+def test_lookup_table_matches_forest():
+    """Test that table lookups match the forests inside the domain and fall back outside it."""
+    with open("models/nudge_models.pkl", "rb") as f:
+        models = pickle.load(f)
+    forest = build_predictor(models, "sklearn")
+
+    # A reduced domain keeps the build quick
+    domain = {
+        "resume_uploaded": [0, 1],
+        "karma": [150, 180],
+        "projects_added": [0, 5],
+        "batch_avg_projects": [1, 5],
+        "batch_resume_uploaded_pct": [50, 95],
+        "event_fomo_score": [0, 3]
+    }
+    table = build_table(forest, domain)
+    lookup = LookupTablePredictor(table["lows"], table["sizes"], table["packed"], forest)
+
+    rng = np.random.default_rng(42)
+    X = np.column_stack([
+        rng.integers(0, 2, 2000),
+        rng.integers(130, 200, 2000),  # partly outside the karma bounds
+        rng.integers(0, 7, 2000),
+        rng.integers(1, 6, 2000),
+        rng.integers(45, 100, 2000),
+        rng.integers(0, 5, 2000)
+    ])
+    assert np.array_equal(lookup.predict(X), forest.predict(X))
+    assert np.array_equal(lookup.predict(load_training_features()), forest.predict(load_training_features()))
+    print("Lookup table test passed!")
+
+def test_flat_artifact_round_trip():
+    """Test that a saved flat artifact predicts exactly like the models it came from."""
+    with open("models/nudge_models.pkl", "rb") as f:
+        models = pickle.load(f)
+    X = load_training_features()
+    fused = build_predictor(models, "flat")
+
+    with tempfile.TemporaryDirectory() as directory:
+        save_flat_artifact(fused, directory, "separate", "fingerprint")
+        manifest, loaded = load_flat_artifact(directory)
+        assert manifest["layout"] == "separate"
+        assert manifest["model_fingerprint"] == "fingerprint"
+        assert np.array_equal(loaded.predict(X), fused.predict(X))
+
+        forest = FlatForest.from_sklearn(models["event_model"])
+        save_flat_artifact(forest, directory, "separate", "fingerprint")
+        _, loaded = load_flat_artifact(directory)
+        assert np.array_equal(loaded.predict_proba(X), forest.predict_proba(X))
+    print("Flat artifact round trip test passed!")
+
+def test_engine_starts_without_sklearn():
+    """Test that the engine serves from the exported artifact without importing sklearn."""
+    script = (
+        "import sys\n"
+        "from app.nudge_engine import NudgeEngine\n"
+        "engine = NudgeEngine()\n"
+        "engine.predictor.predict([[1, 150, 2, 3, 80, 1]])\n"
+        "assert engine.models is None, 'flat artifact was not used'\n"
+        "assert 'sklearn' not in sys.modules, 'sklearn was imported'\n"
+    )
+    subprocess.run([sys.executable, "-c", script], check=True)
+    print("Cold start test passed!")
+
+if __name__ == "__main__":
+    test_flat_forest_matches_sklearn()
+    test_predictor_layouts_match_sklearn()
+    test_lookup_table_matches_forest()
+    test_flat_artifact_round_trip()
+    test_engine_starts_without_sklearn()